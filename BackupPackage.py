@@ -0,0 +1,282 @@
+"""
+增量壓縮備份 (完整備份 + 差異備份)
+1. 備份包為 zip：manifest.json + 各分頁的 JSON (deflate 壓縮)。
+2. 差異備份只存「與基準完整備份不同」的分頁，其餘分頁只記錄雜湊值。
+3. 還原時以 基準完整備份 + 差異備份 重組出完整活頁簿。
+4. 備份目的地為任一 BackupTarget 實作 (見 BackupTargets.py)，
+   Google Drive 與本機資料夾都適用，離線也能測試。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+
+FORMAT_VERSION = 1
+PACKAGE_EXT = ".omsz"
+BACKUP_PREFIX = "[系統備份] "
+BACKUP_KEEP = 20          # 保留的備份包數量 (不含仍被引用的基準備份)
+FULL_EVERY = 10           # 連續差異備份達此次數後，強制做一次完整備份
+DELTA_RATIO = 0.5         # 差異分頁大小超過整體一半時，直接改做完整備份
+
+# 雲端 / 本機備份的附加屬性 (Drive appProperties，值必須是字串)
+PROP_KIND = "oms_kind"        # full / delta
+PROP_BASE = "oms_base"        # 差異備份所依附的完整備份 ID
+PROP_FORMAT = "oms_format"
+PROP_SHA256 = "oms_sha256"    # 備份包檔案雜湊 (還原時驗證用)
+
+
+# ---------------- 分頁序列化 ----------------
+def table_to_bytes(df):
+    """ DataFrame -> JSON bytes (逐欄存放；浮點數以 repr 保存，還原後數值完全一致) """
+    payload = {"columns": [str(c) for c in df.columns],
+               "data": [df[c].tolist() for c in df.columns]}
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def table_from_bytes(data):
+    payload = json.loads(data.decode("utf-8"))
+    columns = payload["columns"]
+    return pd.DataFrame(dict(zip(range(len(columns)), payload["data"]))).set_axis(columns, axis=1) \
+        if columns else pd.DataFrame()
+
+
+def table_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def read_tables(xlsx_path):
+    """ 讀取活頁簿所有分頁，回傳 {分頁: JSON bytes} (依活頁簿順序) """
+    tables = {}
+    with pd.ExcelFile(xlsx_path) as xls:
+        for sn in xls.sheet_names:
+            tables[sn] = table_to_bytes(pd.read_excel(xls, sheet_name=sn))
+    return tables
+
+
+# ---------------- 備份包讀寫 ----------------
+def write_package(path, manifest, tables):
+    """ 寫出備份包；tables 只需包含實際要存的分頁 """
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=1))
+        for sn, data in tables.items():
+            zf.writestr(manifest["tables"][sn]["file"], data)
+
+
+def read_package(path):
+    """ 回傳 (manifest, {分頁: JSON bytes}) """
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json").decode("utf-8"))
+        tables = {sn: zf.read(info["file"]) for sn, info in manifest["tables"].items() if info.get("file")}
+    return manifest, tables
+
+
+def assemble(base_path, delta_path=None):
+    """ 以基準完整備份 (+ 差異備份) 重組所有分頁，回傳 (分頁順序, {分頁: DataFrame}) """
+    base_manifest, base_tables = read_package(base_path)
+    manifest, tables = base_manifest, dict(base_tables)
+    if delta_path:
+        manifest, delta_tables = read_package(delta_path)
+        tables.update(delta_tables)
+
+    frames = {}
+    for sn in manifest["sheet_order"]:
+        expected = manifest["tables"][sn]["hash"]
+        data = tables.get(sn)
+        if data is None or table_hash(data) != expected:
+            raise ValueError(f"備份資料不完整或已損毀：{sn}")
+        frames[sn] = table_from_bytes(data)
+    return manifest["sheet_order"], frames
+
+
+def write_frames(path, sheet_order, frames):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sn in sheet_order:
+            frames[sn].to_excel(writer, sheet_name=sn, index=False)
+
+
+def verify_download(path, expected_sha256):
+    """ 下載後比對備份包雜湊 (舊版備份沒有記錄雜湊則略過) """
+    if expected_sha256 and file_sha256(path) != expected_sha256:
+        raise ValueError("備份檔下載不完整或已損毀 (雜湊不符)")
+
+
+def verify_workbook(path, schema=None):
+    """
+    確認活頁簿可以開啟，且 schema 中的分頁與欄位都存在。
+    schema: {分頁: [必要欄位]}；回傳分頁名稱清單
+    """
+    try:
+        with pd.ExcelFile(path) as xls:
+            sheet_names = list(xls.sheet_names)
+            for sn, columns in (schema or {}).items():
+                if sn not in sheet_names:
+                    raise ValueError(f"備份缺少分頁：{sn}")
+                header = [str(c) for c in pd.read_excel(xls, sheet_name=sn, nrows=0).columns]
+                missing = [c for c in columns if c not in header]
+                if missing:
+                    raise ValueError(f"分頁『{sn}』缺少欄位：{', '.join(missing)}")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"備份檔無法開啟：{e}")
+    return sheet_names
+
+
+# ---------------- 增量備份流程 ----------------
+class IncrementalBackup:
+    """
+    在任一備份目的地上執行 完整 / 差異 備份、保留數量管理與還原。
+    state_path 記錄目前基準完整備份的 ID 與各分頁雜湊 (依目的地分開記錄)。
+    """
+
+    def __init__(self, target, state_path, target_key="default", keep=BACKUP_KEEP):
+        self.target = target
+        self.state_path = state_path
+        self.target_key = target_key
+        self.keep = keep
+
+    # --- 狀態檔 ---
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+
+    # --- 備份 ---
+    def backup(self, xlsx_path):
+        """ 回傳 (成功與否, 訊息) """
+        tables = read_tables(xlsx_path)
+        hashes = {sn: table_hash(data) for sn, data in tables.items()}
+        existing = self.target.list_backups()
+        existing_ids = {b["id"] for b in existing}
+
+        state_all = self._load_state()
+        state = state_all.get(self.target_key, {})
+        base_id = state.get("base_id")
+        base_hashes = state.get("base_hashes", {})
+
+        changed = [sn for sn in tables if base_hashes.get(sn) != hashes[sn]]
+        changed_size = sum(len(tables[sn]) for sn in changed)
+        total_size = sum(len(d) for d in tables.values()) or 1
+        need_full = (base_id not in existing_ids
+                     or state.get("deltas_since_base", 0) >= FULL_EVERY
+                     or changed_size > total_size * DELTA_RATIO)
+
+        if hashes == state.get("last_hashes") and base_id in existing_ids:
+            return True, "資料自上次備份後沒有變更，略過本次上傳。"
+
+        kind = "full" if need_full else "delta"
+        stored = tables if need_full else {sn: tables[sn] for sn in changed}
+        manifest = {
+            "format": FORMAT_VERSION,
+            "kind": kind,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "source": os.path.basename(xlsx_path),
+            "base": "" if need_full else base_id,
+            "sheet_order": list(tables),
+            "tables": {sn: {"hash": hashes[sn], "file": f"tables/{i}.json" if sn in stored else ""}
+                       for i, sn in enumerate(tables)},
+        }
+
+        stem = os.path.splitext(os.path.basename(xlsx_path))[0]
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        name = f"{BACKUP_PREFIX}{stem}_{timestamp}_{kind}{PACKAGE_EXT}"
+
+        fd, tmp = tempfile.mkstemp(suffix=PACKAGE_EXT)
+        os.close(fd)
+        try:
+            write_package(tmp, manifest, stored)
+            size = os.path.getsize(tmp)
+            props = {PROP_KIND: kind, PROP_BASE: manifest["base"], PROP_FORMAT: str(FORMAT_VERSION),
+                     PROP_SHA256: file_sha256(tmp)}
+            new_id = self.target.upload(tmp, name, props)
+        finally:
+            os.remove(tmp)
+
+        if need_full:
+            state = {"base_id": new_id, "base_hashes": hashes, "deltas_since_base": 0}
+        else:
+            state["deltas_since_base"] = state.get("deltas_since_base", 0) + 1
+        state["last_hashes"] = hashes
+        state_all[self.target_key] = state
+        self._save_state(state_all)
+
+        removed = self.prune([{"id": new_id, "appProperties": props}] + existing)
+        detail = "完整備份" if need_full else f"差異備份 (變更分頁: {', '.join(changed)})"
+        return True, (f"系統備份成功\n 檔案: {name}\n 類型: {detail}\n 大小: {size / 1024:,.1f} KB"
+                      f"\n(自動保留最新 {self.keep} 筆，本次清理 {removed} 筆)")
+
+    def prune(self, backups=None):
+        """ 保留最新 keep 筆；被保留的差異備份所依附的完整備份也一併保留。一次批次刪除其餘備份 """
+        ordered = backups if backups is not None else self.target.list_backups()   # 新到舊
+        kept = ordered[:self.keep]
+        keep_ids = {b["id"] for b in kept}
+        keep_ids |= {(b.get("appProperties") or {}).get(PROP_BASE) for b in kept} - {"", None}
+        # 目前的基準完整備份一定要留著，下一次差異備份才有依附對象
+        state = self._load_state().get(self.target_key, {})
+        if state.get("base_id"):
+            keep_ids.add(state["base_id"])
+
+        to_delete = [b["id"] for b in ordered if b["id"] not in keep_ids]
+        if to_delete:
+            self.target.delete_many(to_delete)
+        return len(to_delete)
+
+    # --- 還原 ---
+    def restore(self, backup, dest_path, schema=None, lock=None):
+        """
+        backup 為 list_backups 的項目；舊版 .xlsx 備份直接下載，新版則重組 基準 + 差異。
+        全部先寫到與正式檔同資料夾的暫存檔，通過驗證 (雜湊、可開啟、schema) 後才原子置換；
+        原本的檔案保留為 .bak。驗證失敗時丟出 ValueError，正式檔完全不動。
+        lock: 正式檔的寫入鎖，只在備份 .bak 與置換時持有 (下載與驗證期間不鎖)
+        """
+        props = backup.get("appProperties") or {}
+        kind = props.get(PROP_KIND)
+        work = tempfile.mkdtemp(prefix="oms_restore_")
+        directory = os.path.dirname(os.path.abspath(dest_path))
+        fd, staged = tempfile.mkstemp(suffix=".xlsx", prefix="restore_", dir=directory)
+        os.close(fd)
+        try:
+            if not kind:
+                self.target.download(backup["id"], staged)
+            else:
+                pkg = os.path.join(work, "package" + PACKAGE_EXT)
+                self.target.download(backup["id"], pkg)
+                verify_download(pkg, props.get(PROP_SHA256))
+                base_pkg = None
+                if kind == "delta":
+                    base_meta = self.target.get_metadata(props[PROP_BASE])
+                    base_pkg = os.path.join(work, "base" + PACKAGE_EXT)
+                    self.target.download(base_meta["id"], base_pkg)
+                    verify_download(base_pkg, (base_meta.get("appProperties") or {}).get(PROP_SHA256))
+                sheet_order, frames = assemble(base_pkg, pkg) if base_pkg else assemble(pkg)
+                write_frames(staged, sheet_order, frames)
+
+            verify_workbook(staged, schema)
+            with lock or contextlib.nullcontext():
+                if os.path.exists(dest_path):
+                    shutil.copy2(dest_path, dest_path + ".bak")
+                os.replace(staged, dest_path)
+        finally:
+            if os.path.exists(staged):
+                os.remove(staged)
+            shutil.rmtree(work, ignore_errors=True)
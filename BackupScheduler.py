@@ -0,0 +1,125 @@
+"""
+背景自動備份排程
+1. 存檔 N 次，或最後一次存檔後閒置 M 分鐘，就觸發一次備份。
+2. 同一時間只會有一個備份在跑 (手動 / 自動共用)，避免狀態檔互相覆蓋。
+3. 實際工作由呼叫端提供的 run_backup 交給全域 TaskExecutor 在背景執行；
+   run_backup 應在短暫持有檔案鎖的情況下複製一份活頁簿，再從複本上傳，網路傳輸期間不鎖住正式檔。
+"""
+import threading
+import time
+from datetime import datetime
+
+CHECK_INTERVAL_MS = 30 * 1000   # 閒置檢查頻率
+RETRY_DELAY = 5 * 60            # 失敗後至少等 5 分鐘再自動重試 (秒)
+
+
+class AutoBackupScheduler:
+    def __init__(self, run_backup, executor, schedule, on_status=None, is_ready=None):
+        """
+        run_backup: 無參數，回傳 (成功與否, 訊息)；由 executor 在背景執行緒呼叫
+        executor:   TaskExecutor；submit 執行備份，post 把工作排回 UI 執行緒
+        schedule:   schedule(毫秒, 函式)，定時閒置檢查用 (通常是 root.after)
+        on_status:  狀態改變時在 UI 執行緒呼叫 on_status(scheduler)
+        is_ready:   自動觸發前的檢查 (例如 VIP 已解鎖、目的地可用)
+        """
+        self.run_backup = run_backup
+        self.executor = executor
+        self.post = executor.post
+        self.schedule = schedule
+        self.on_status = on_status
+        self.is_ready = is_ready or (lambda: True)
+
+        self.enabled = False
+        self.writes_threshold = 20
+        self.idle_seconds = 10 * 60
+
+        self.pending_writes = 0
+        self.last_write = 0.0
+        self.last_attempt = 0.0
+        self.last_success = ""     # "YYYY-MM-DD HH:MM:SS"
+        self.last_error = ""
+        self.running = False
+        self._lock = threading.Lock()
+        self._started = False
+
+    def configure(self, enabled, writes_threshold, idle_minutes):
+        self.enabled = bool(enabled)
+        self.writes_threshold = max(1, int(writes_threshold))
+        self.idle_seconds = max(1, int(idle_minutes)) * 60
+
+    def start(self):
+        """ 開始定時檢查 (只需呼叫一次) """
+        if not self._started:
+            self._started = True
+            self.schedule(CHECK_INTERVAL_MS, self._tick)
+
+    # --- 觸發條件 ---
+    def notify_write(self):
+        """ 每次存檔成功後呼叫 (可在任何執行緒) """
+        with self._lock:
+            self.pending_writes += 1
+            self.last_write = time.time()
+            due = self.enabled and self.pending_writes >= self.writes_threshold and self._retry_ok(time.time())
+        if due:
+            self.post(lambda: self.is_ready() and self.trigger("存檔次數"))
+
+    def _tick(self):
+        try:
+            now = time.time()
+            idle_due = (self.enabled and self.pending_writes > 0
+                        and now - self.last_write >= self.idle_seconds
+                        and self._retry_ok(now))
+            if idle_due and self.is_ready():
+                self.trigger("閒置")
+        finally:
+            self.schedule(CHECK_INTERVAL_MS, self._tick)
+
+    def _retry_ok(self, now):
+        """ 上次失敗時，等待 RETRY_DELAY 後才再自動觸發 """
+        return not self.last_error or now - self.last_attempt >= RETRY_DELAY
+
+    # --- 執行 ---
+    def trigger(self, reason="手動", done=None):
+        """ 啟動一次備份；已有備份在跑時回傳 False。done(成功與否, 訊息) 會在 UI 執行緒呼叫 """
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+            taken, self.pending_writes = self.pending_writes, 0
+            self.last_attempt = time.time()
+        print(f"system: backup started ({reason})")
+        self._notify()
+        self.executor.submit(self.run_backup, name="backup",
+                             on_done=lambda result: self._finish(*result, taken, done),
+                             on_error=lambda e: self._finish(False, f"system: failed to upload file: {e}",
+                                                             taken, done))
+        return True
+
+    def _finish(self, success, msg, taken, done):
+        with self._lock:
+            self.running = False
+            if success:
+                self.last_success = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.last_error = ""
+            else:
+                self.pending_writes += taken   # 失敗：這些變更仍待備份，稍後重試
+                self.last_error = msg
+        self._notify()
+        if done:
+            done(success, msg)
+
+    def _notify(self):
+        if self.on_status:
+            self.on_status(self)
+
+    def status_text(self):
+        if self.running:
+            return "備份進行中..."
+        parts = [f"上次成功: {self.last_success or '尚無'}"]
+        if self.enabled:
+            parts.append(f"待備份變更: {self.pending_writes} 次")
+        else:
+            parts.append("自動備份已關閉")
+        if self.last_error:
+            parts.append("上次失敗")
+        return "｜".join(parts)
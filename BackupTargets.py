@@ -0,0 +1,158 @@
+"""
+備份目的地介面 (BackupTarget) 與本機資料夾實作
+備份分頁、保留數量管理與還原流程只透過這組介面操作，
+Google Drive (main.GoogleDriveSync) 與本機 / NAS 資料夾可以互換。
+本機資料夾的備份 / 差異 / 清理 / 還原測試見 tests/test_backup_targets.py
+"""
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+DEFAULT_KEEP = 20        # 預設保留份數 (舊版固定為 20)
+MIN_KEEP, MAX_KEEP = 1, 500
+DEFAULT_AUTO_WRITES = 20         # 自動備份：存檔幾次後備份
+DEFAULT_AUTO_IDLE = 10           # 自動備份：閒置幾分鐘後備份
+
+
+def utc_now_str():
+    """ 與 Google Drive createdTime 相同格式 (UTC) """
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class BackupTarget(ABC):
+    """
+    備份目的地介面。list_backups / get_metadata 回傳的項目格式與 Drive 相同：
+    {"id", "name", "createdTime", "size", "appProperties"}
+    """
+    label = "備份目的地"
+
+    @property
+    @abstractmethod
+    def key(self):
+        """ 增量備份狀態檔中區分不同目的地的鍵值 """
+
+    def is_ready(self):
+        """ 是否可以立即操作 (例如 Drive 需要先登入) """
+        return True
+
+    @abstractmethod
+    def upload(self, local_path, name, properties=None):
+        """ 上傳檔案，回傳目的地上的檔案 ID """
+
+    @abstractmethod
+    def list_backups(self):
+        """ 依建立時間新到舊列出所有備份 """
+
+    def cached_backups(self):
+        """ 不連網即可取得的備份清單 (供畫面立即顯示)；沒有快取時回傳 None """
+        return None
+
+    @abstractmethod
+    def download(self, file_id, dest_path):
+        """ 下載備份到 dest_path """
+
+    @abstractmethod
+    def delete_many(self, file_ids):
+        """ 刪除多個備份 """
+
+    @abstractmethod
+    def get_metadata(self, file_id):
+        """ 回傳單一備份的項目資料 """
+
+
+class LocalFolderTarget(BackupTarget):
+    """ 本機 / NAS 資料夾：每個備份包旁邊放一個 .meta.json 記錄屬性 """
+    label = "本機 / NAS 資料夾"
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    @property
+    def key(self):
+        return "local:" + os.path.normcase(os.path.abspath(self.folder))
+
+    def is_ready(self):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            return os.access(self.folder, os.W_OK)
+        except OSError:
+            return False
+
+    def _meta_path(self, file_id):
+        return os.path.join(self.folder, file_id + ".meta.json")
+
+    def upload(self, local_path, name, properties=None):
+        os.makedirs(self.folder, exist_ok=True)
+        file_id, n = name, 1
+        while os.path.exists(os.path.join(self.folder, file_id)):   # 同一秒內重複備份時避免覆蓋
+            stem, ext = os.path.splitext(name)
+            file_id, n = f"{stem}_{n}{ext}", n + 1
+        shutil.copyfile(local_path, os.path.join(self.folder, file_id))
+        meta = {"id": file_id, "name": name, "createdTime": utc_now_str(),
+                "size": str(os.path.getsize(local_path)), "appProperties": properties or {}}
+        with open(self._meta_path(file_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return file_id
+
+    def list_backups(self):
+        if not os.path.isdir(self.folder):
+            return []
+        items = []
+        for fn in os.listdir(self.folder):
+            if not fn.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.folder, fn), "r", encoding="utf-8") as f:
+                    items.append(json.load(f))
+            except Exception as e:
+                print(f"system: skipped unreadable backup metadata {fn}: {e}")
+        items.sort(key=lambda m: m.get("createdTime", ""), reverse=True)
+        return items
+
+    def download(self, file_id, dest_path):
+        shutil.copyfile(os.path.join(self.folder, file_id), dest_path)
+
+    def delete_many(self, file_ids):
+        for file_id in file_ids:
+            for p in (os.path.join(self.folder, file_id), self._meta_path(file_id)):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def get_metadata(self, file_id):
+        with open(self._meta_path(file_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+# ---------------- 備份設定 (存在本機，不隨資料還原而改變) ----------------
+def load_backup_config(path):
+    """
+    回傳 {"target": "gdrive" / "local", "local_folder": 路徑, "keep": 保留份數,
+          "auto_enabled", "auto_writes", "auto_idle_minutes", "last_success"}
+    """
+    config = {"target": "gdrive", "local_folder": "", "keep": DEFAULT_KEEP,
+              "auto_enabled": True, "auto_writes": DEFAULT_AUTO_WRITES,
+              "auto_idle_minutes": DEFAULT_AUTO_IDLE, "last_success": ""}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    try:
+        config["keep"] = min(MAX_KEEP, max(MIN_KEEP, int(config["keep"])))
+    except (TypeError, ValueError):
+        config["keep"] = DEFAULT_KEEP
+    for key, default in (("auto_writes", DEFAULT_AUTO_WRITES), ("auto_idle_minutes", DEFAULT_AUTO_IDLE)):
+        try:
+            config[key] = max(1, int(config[key]))
+        except (TypeError, ValueError):
+            config[key] = default
+    config["auto_enabled"] = bool(config["auto_enabled"])
+    return config
+
+
+def save_backup_config(path, config):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=1)
+
@@ -0,0 +1,502 @@
+"""
+物流自動追蹤 (asyncio)
+在途進貨的物流單號 (進貨追蹤『物流追蹤』欄) 同時向各物流商查詢，自動推進『物流狀態』並補上『時間_*』欄位。
+
+1. 轉接器 (CarrierAdapter)：每家物流商一個，負責比對單號格式、組出查詢網址與解析回應。
+   一般 JSON API 可直接在 carriers.json 設定 (JsonCarrierAdapter)，特殊格式再寫子類別並 register_adapter。
+2. 每家物流商各自的速率限制 (token bucket) 與同時連線數，收到 429 / Retry-After 時整家暫停。
+3. 快取：CACHE_TTL 內查過的單號不重查；過期後帶 If-None-Match / If-Modified-Since，304 直接沿用上次結果。
+4. 失敗重試：網路錯誤、429、5xx 以指數退避 (含隨機抖動) 重試，超過次數後沿用舊結果。
+5. 內建本機模擬物流商 (StubCarrierServer)，可離線測試與量測：
+
+    python CarrierTracker.py stub --port 8790              # 啟動模擬物流商
+    python CarrierTracker.py bench --numbers 500           # 離線壓測 (併發 vs 逐筆、304、快取)
+
+carriers.json 範例 (放在程式目錄)：
+    [{"name": "SF", "url": "https://api.example.com/track/{number}", "pattern": "SF\\\\d{12}",
+      "rate": 5, "burst": 5, "concurrency": 4, "headers": {"Authorization": "Bearer ..."},
+      "status_map": {"picked_up": "廠商已發貨"}}]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from oms_core.schema import LOGISTICS_STAGES
+
+DEFAULT_STUB_PORT = 8790
+CACHE_TTL = 1800          # 30 分鐘內查過的單號直接使用快取
+REQUEST_TIMEOUT = 15
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5        # 第 n 次重試等待 BACKOFF_BASE * 2^n 秒 (含抖動)
+BACKOFF_MAX = 30
+DONE_STAGE = LOGISTICS_STAGES[-1]
+
+# 通用狀態代碼 -> 系統物流階段 (JsonCarrierAdapter 預設；也接受直接回傳中文階段名稱)
+DEFAULT_STATUS_MAP = {
+    "picked_up": "廠商已發貨",
+    "shipped": "廠商已發貨",
+    "at_warehouse": "貨到集運倉",
+    "departed_warehouse": "集運倉已發貨",
+    "customs": "抵達台灣海關",
+    "out_for_delivery": "國內配送中",
+}
+STUB_EVENTS = ["picked_up", "at_warehouse", "departed_warehouse", "customs", "out_for_delivery"]
+
+
+class CarrierError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+# ================= 轉接器 =================
+class CarrierAdapter:
+    """ 物流商轉接器基底：子類別覆寫 build_request 與 parse """
+    name = "base"
+    pattern = None        # 單號格式 (正規表示式，整串比對)
+    rate = 2.0            # 每秒請求數
+    burst = 2
+    concurrency = 4
+
+    def matches(self, number):
+        return bool(self.pattern) and re.fullmatch(self.pattern, number) is not None
+
+    def build_request(self, number):
+        """ 回傳 (網址, 標頭 dict) """
+        raise NotImplementedError
+
+    def parse(self, number, body):
+        """ 回傳 {"stage": 階段, "times": {階段: YYYY-MM-DD}}；沒有可辨識的事件時回傳 None """
+        raise NotImplementedError
+
+
+class JsonCarrierAdapter(CarrierAdapter):
+    """
+    一般 JSON 查詢 API：GET url (以 {number} 代入單號)，回應格式
+        {"events": [{"status": "picked_up", "time": "2024-03-01T10:00:00"}, ...]}
+    status 透過 status_map 對應到系統階段。
+    """
+
+    def __init__(self, name, url, pattern, status_map=None, rate=2.0, burst=2, concurrency=4, headers=None):
+        self.name = name
+        self.url = url
+        self.pattern = pattern
+        self.status_map = {**DEFAULT_STATUS_MAP, **(status_map or {})}
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.concurrency = int(concurrency)
+        self.headers = dict(headers or {})
+
+    def build_request(self, number):
+        return self.url.format(number=quote(number)), dict(self.headers)
+
+    def parse(self, number, body):
+        data = json.loads(body.decode("utf-8"))
+        rank = {stage: i for i, stage in enumerate(LOGISTICS_STAGES)}
+        times = {}
+        for event in data.get("events", []):
+            code = str(event.get("status", "")).strip()
+            stage = code if code in rank else self.status_map.get(code)
+            if stage is None:
+                continue
+            day = str(event.get("time", ""))[:10]
+            if stage not in times or (day and day < times[stage]):
+                times[stage] = day          # 同一階段取最早的事件時間
+        if not times:
+            return None
+        return {"stage": max(times, key=rank.get), "times": {s: d for s, d in times.items() if d}}
+
+
+_REGISTRY = []
+
+
+def register_adapter(adapter):
+    """ 註冊自訂轉接器 (先註冊者優先比對) """
+    _REGISTRY.append(adapter)
+    return adapter
+
+
+def load_adapters(config_path=None):
+    """ 已註冊的轉接器 + carriers.json 設定的 JSON 轉接器 """
+    adapters = list(_REGISTRY)
+    if config_path and os.path.exists(config_path):
+        with open(config_path, encoding="utf-8") as f:
+            for cfg in json.load(f):
+                adapters.append(JsonCarrierAdapter(**cfg))
+    return adapters
+
+
+# ================= 速率限制與快取 =================
+class RateLimiter:
+    """ token bucket：每秒補充 rate 個、最多累積 burst 個；pause() 讓整家物流商暫停 """
+
+    def __init__(self, rate, burst=1):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = max(int(burst), 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class TrackingCache:
+    """ 單號 -> {"result", "etag", "last_modified", "checked"}；存成 JSON 檔 (原子置換) """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"system: tracking cache unreadable, starting fresh: {e}")
+
+    def get(self, number):
+        return self.entries.get(number)
+
+    def is_fresh(self, number, ttl):
+        entry = self.entries.get(number)
+        return entry is not None and time.time() - entry.get("checked", 0) < ttl
+
+    def put(self, number, result, etag=None, last_modified=None):
+        self.entries[number] = {"result": result, "etag": etag, "last_modified": last_modified, "checked": time.time()}
+
+    def touch(self, number):
+        self.entries[number]["checked"] = time.time()
+
+    def prune(self, keep_numbers):
+        """ 只保留仍在追蹤中的單號 """
+        keep = set(keep_numbers)
+        self.entries = {n: e for n, e in self.entries.items() if n in keep}
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+
+
+# ================= 查詢引擎 =================
+def _fetch(url, headers, timeout):
+    """ 同步 HTTP GET (在執行緒中執行)：回傳 (狀態碼, 回應標頭, 內容)；304 視為正常回應 """
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, dict(e.headers), b""
+        retry_after = e.headers.get("Retry-After")
+        raise CarrierError(e.code, f"HTTP {e.code}",
+                           float(retry_after) if retry_after and retry_after.isdigit() else None) from None
+    except (urllib.error.URLError, OSError) as e:
+        raise CarrierError(None, str(getattr(e, "reason", e))) from None
+
+
+class CarrierPoller:
+    """
+    poll(numbers) 同時查詢所有單號，回傳 {單號: 結果}；查不到 (無對應轉接器 / 無事件 / 失敗且無快取) 的單號不在結果中。
+    stats 紀錄 requests / not_modified / cache_hits / retries / errors / unmatched。
+    """
+
+    def __init__(self, adapters, cache=None, ttl=CACHE_TTL, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES):
+        self.adapters = list(adapters)
+        self.cache = cache or TrackingCache()
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.stats = dict.fromkeys(("requests", "not_modified", "cache_hits", "retries", "errors", "unmatched"), 0)
+
+    def adapter_for(self, number):
+        return next((a for a in self.adapters if a.matches(number)), None)
+
+    def poll_sync(self, numbers):
+        """ 給一般執行緒 (例如 TaskExecutor 背景工作) 呼叫 """
+        return asyncio.run(self.poll(numbers))
+
+    async def poll(self, numbers):
+        numbers = list(dict.fromkeys(n for n in numbers if n))
+        # 速率限制與連線數依物流商分開 (每次 poll 重新建立，綁定目前的事件迴圈)
+        limits = {a.name: (RateLimiter(a.rate, a.burst), asyncio.Semaphore(a.concurrency)) for a in self.adapters}
+        # 阻塞式 HTTP 在專用執行緒池執行，大小等於各物流商連線數總和 (預設執行緒池太小會限制併發)
+        self._pool = ThreadPoolExecutor(max_workers=max(sum(a.concurrency for a in self.adapters), 1),
+                                        thread_name_prefix="carrier")
+        jobs = []
+        for number in numbers:
+            adapter = self.adapter_for(number)
+            if adapter is None:
+                self.stats["unmatched"] += 1
+                continue
+            jobs.append((number, self._check(number, adapter, *limits[adapter.name])))
+        try:
+            # 單一單號的意外錯誤不可連帶丟掉其他物流商已查到的結果
+            results = await asyncio.gather(*(job for _, job in jobs), return_exceptions=True)
+        finally:
+            self._pool.shutdown(wait=False)
+        for i, ((number, _), r) in enumerate(zip(jobs, results)):
+            if isinstance(r, Exception):
+                self.stats["errors"] += 1
+                print(f"system: tracking {number} failed: {r}")
+                entry = self.cache.get(number)
+                results[i] = entry["result"] if entry else None
+        self.cache.save()
+        return {number: r for (number, _), r in zip(jobs, results) if r is not None}
+
+    async def _check(self, number, adapter, limiter, slots):
+        entry = self.cache.get(number)
+        if self.cache.is_fresh(number, self.ttl):
+            self.stats["cache_hits"] += 1
+            return entry["result"]
+
+        url, headers = adapter.build_request(number)
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        for attempt in range(self.max_retries + 1):
+            async with slots:
+                await limiter.acquire()
+                self.stats["requests"] += 1
+                try:
+                    status, resp_headers, body = await asyncio.get_running_loop().run_in_executor(
+                        self._pool, _fetch, url, headers, self.timeout)
+                except CarrierError as e:
+                    error = e
+                else:
+                    error = None
+            if error is None:
+                break
+            if not error.retryable or attempt == self.max_retries:
+                self.stats["errors"] += 1
+                print(f"system: tracking {adapter.name} {number} failed: {error}")
+                return entry["result"] if entry else None     # 失敗時沿用上次結果
+            if error.retry_after:
+                limiter.pause(error.retry_after)                # 被限流：整家物流商一起暫停
+            self.stats["retries"] += 1
+            delay = error.retry_after or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+        if status == 304:
+            if entry:
+                self.stats["not_modified"] += 1
+                self.cache.touch(number)
+                return entry["result"]
+            # 沒送條件標頭卻收到 304 (物流商異常)：沒有內容可解析，下次重新查詢
+            self.stats["errors"] += 1
+            print(f"system: tracking {adapter.name} {number} failed: 304 without cached result")
+            return None
+        try:
+            result = adapter.parse(number, body)
+        except Exception as e:
+            # 例如維護中回傳 HTML：只影響這個單號，沿用上次結果
+            self.stats["errors"] += 1
+            print(f"system: tracking {adapter.name} {number} unparseable response: {e}")
+            return entry["result"] if entry else None
+        self.cache.put(number, result, resp_headers.get("ETag"), resp_headers.get("Last-Modified"))
+        return result
+
+
+def in_transit_numbers(df_track):
+    """ 進貨追蹤中已填物流單號、尚未到達最後階段的單號 """
+    from oms_core import clean_tracking_numbers
+    if df_track.empty or '物流追蹤' not in df_track.columns:
+        return []
+    numbers = clean_tracking_numbers(df_track['物流追蹤'])
+    stage = df_track['物流狀態'].fillna("").astype(str).str.strip() if '物流狀態' in df_track.columns else ""
+    return sorted(set(numbers[(numbers != "") & (stage != DONE_STAGE)]))
+
+
+# ================= 本機模擬物流商 =================
+class StubCarrierHandler(BaseHTTPRequestHandler):
+    """ GET /track/<單號> -> {"number", "events": [...]}；支援 ETag / 304 與 429 限流 """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "track":
+            self._send(404)
+            return
+        if not server.admit():
+            self._send(429, headers={"Retry-After": "1"})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        body = json.dumps({"number": unquote(parts[1]), "events": server.events_for(unquote(parts[1]))},
+                          ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            server.count("not_modified")
+            self._send(304, headers={"ETag": etag})
+            return
+        server.count("ok")
+        self._send(200, body, {"Content-Type": "application/json; charset=utf-8", "ETag": etag})
+
+
+class StubCarrierServer(ThreadingHTTPServer):
+    """
+    模擬物流商：每個單號依雜湊值決定起始階段，之後每 advance_every 秒推進一個階段。
+    rate_limit：每秒最多接受的請求數 (超過回 429)，0 表示不限。
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_STUB_PORT, latency=0.05, rate_limit=0, advance_every=0):
+        super().__init__((host, port), StubCarrierHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.advance_every = advance_every
+        self.started = time.time()
+        self.base_day = datetime.now() - timedelta(days=10)
+        self.counts = {"ok": 0, "not_modified": 0, "throttled": 0}
+        self._lock = threading.Lock()
+        self._window = []
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def admit(self):
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                self.counts["throttled"] += 1
+                return False
+            self._window.append(now)
+            return True
+
+    def events_for(self, number):
+        steps = zlib.crc32(number.encode("utf-8")) % len(STUB_EVENTS)
+        if self.advance_every:
+            steps += int((time.time() - self.started) / self.advance_every)
+        steps = min(steps + 1, len(STUB_EVENTS))
+        return [{"status": code, "time": (self.base_day + timedelta(days=2 * i)).strftime("%Y-%m-%dT%H:%M:%S")}
+                for i, code in enumerate(STUB_EVENTS[:steps])]
+
+
+def start_stub(host="127.0.0.1", port=0, **kwargs):
+    """ 在背景執行緒啟動模擬物流商，回傳 server (結束時呼叫 server.shutdown()) """
+    server = StubCarrierServer(host, port, **kwargs)
+    threading.Thread(target=server.serve_forever, name="carrier-stub", daemon=True).start()
+    return server
+
+
+def stub_adapter(port, rate=50.0, burst=10, concurrency=16):
+    """ 對應模擬物流商的轉接器 (單號格式 ST + 數字) """
+    return JsonCarrierAdapter("STUB", f"http://127.0.0.1:{port}/track/{{number}}", r"ST\d+",
+                              rate=rate, burst=burst, concurrency=concurrency)
+
+
+def run_bench(n_numbers, latency, server_limit, rate, concurrency):
+    server = start_stub(latency=latency, rate_limit=server_limit)
+    port = server.server_address[1]
+    numbers = [f"ST{i:010d}" for i in range(n_numbers)]
+    try:
+        def timed(label, poller, nums):
+            t0 = time.perf_counter()
+            results = poller.poll_sync(nums)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:<22}{len(nums):>6} 筆 {elapsed:>7.2f} 秒 {len(nums) / elapsed:>8.1f} 筆/秒  "
+                  f"結果 {len(results)}  {poller.stats}")
+            return results
+
+        n_seq = min(n_numbers, 50)
+        timed("逐筆 (concurrency=1)", CarrierPoller([stub_adapter(port, rate=1e6, burst=1, concurrency=1)]),
+              numbers[:n_seq])
+        cache = TrackingCache()
+        timed("併發", CarrierPoller([stub_adapter(port, rate, concurrency=concurrency)], cache), numbers)
+        timed("條件式請求 (304)", CarrierPoller([stub_adapter(port, rate, concurrency=concurrency)], cache, ttl=0),
+              numbers)
+        timed("快取", CarrierPoller([stub_adapter(port, rate, concurrency=concurrency)], cache), numbers)
+        print(f"模擬物流商統計：{server.counts}")
+    finally:
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="物流自動追蹤：模擬物流商與壓測")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("stub", help="啟動模擬物流商")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_STUB_PORT)
+    p.add_argument("--latency", type=float, default=0.05, help="每個請求的模擬延遲秒數")
+    p.add_argument("--rate-limit", type=int, default=0, help="每秒最多接受的請求數 (超過回 429)")
+    p.add_argument("--advance-every", type=float, default=60, help="每隔幾秒推進一個物流階段")
+    p = sub.add_parser("bench", help="離線壓測")
+    p.add_argument("--numbers", type=int, default=500)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--server-limit", type=int, default=0, help="模擬物流商的每秒上限 (測試 429 退避)")
+    p.add_argument("--rate", type=float, default=200, help="用戶端每秒請求上限")
+    p.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        run_bench(args.numbers, args.latency, args.server_limit, args.rate, args.concurrency)
+        return 0
+    server = StubCarrierServer(args.host, args.port, args.latency, args.rate_limit, args.advance_every)
+    print(f"system: stub carrier listening on http://{args.host}:{args.port}/track/<number>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+批次匯入共用串流工具 (商品 / 廠商匯入精靈共用)
+1. 預覽只讀前 N 列，不把整份檔案塞進表格元件。
+2. 分段 (chunk) 讀取 CSV / xlsx，記憶體用量與檔案大小無關。
+3. 欄位映射採向量化轉型與預設值，取代逐列 iterrows。
+"""
+import os
+
+import pandas as pd
+
+PREVIEW_ROWS = 200      # 預覽列數
+CHUNK_ROWS = 5000       # 每批處理列數
+CSV_ENCODINGS = ("utf-8-sig", "cp950")  # 常見的 UTF-8 (含 BOM) 與 Big5 匯出檔
+
+FILE_TYPES = [("Excel / CSV", "*.xlsx *.xls *.csv"), ("Excel 活頁簿", "*.xlsx"),
+              ("舊版 Excel", "*.xls"), ("CSV 檔案", "*.csv")]
+
+
+def _is_csv(path):
+    return os.path.splitext(path)[1].lower() == ".csv"
+
+
+def _detect_csv_encoding(path):
+    """ 依序嘗試常見編碼，回傳第一個能讀出標題列的編碼 """
+    for enc in CSV_ENCODINGS:
+        try:
+            pd.read_csv(path, nrows=5, dtype=str, encoding=enc)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[0]
+
+
+def _xlsx_headers(first_row):
+    """ 與 pandas 相同的空白標題命名規則 """
+    return [str(h).strip() if h is not None else f"Unnamed: {i}" for i, h in enumerate(first_row)]
+
+
+def read_preview(path, n_rows=PREVIEW_ROWS):
+    """ 只讀取前 n_rows 列作為預覽，回傳 (標題列表, DataFrame) """
+    if _is_csv(path):
+        df = pd.read_csv(path, nrows=n_rows, dtype=str, encoding=_detect_csv_encoding(path))
+    elif path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True, max_row=n_rows + 1)
+            headers = _xlsx_headers(next(rows, ()))
+            data = [list(r[:len(headers)]) + [None] * (len(headers) - len(r)) for r in rows]
+            df = pd.DataFrame(data, columns=headers)
+        finally:
+            wb.close()
+    else:
+        df = pd.read_excel(path, nrows=n_rows)
+    return df.columns.tolist(), df.fillna("")
+
+
+def estimate_rows(path):
+    """ 估計資料列數 (供進度條使用)；無法得知時回傳 None """
+    try:
+        if _is_csv(path):
+            with open(path, "rb") as f:
+                return max(sum(buf.count(b"\n") for buf in iter(lambda: f.read(1 << 20), b"")) - 1, 0)
+        if path.lower().endswith(".xlsx"):
+            from openpyxl import load_workbook
+            wb = load_workbook(path, read_only=True)
+            try:
+                max_row = wb.worksheets[0].max_row
+            finally:
+                wb.close()
+            return max_row - 1 if max_row else None
+    except Exception:
+        return None
+    return None
+
+
+def iter_chunks(path, chunk_rows=CHUNK_ROWS):
+    """ 逐批產生 DataFrame (欄位順序與預覽相同) """
+    if _is_csv(path):
+        reader = pd.read_csv(path, chunksize=chunk_rows, dtype=str, encoding=_detect_csv_encoding(path))
+        for chunk in reader:
+            yield chunk
+    elif path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            headers = _xlsx_headers(next(rows, ()))
+            width = len(headers)
+            buf = []
+            for r in rows:
+                buf.append(list(r[:width]) + [None] * (width - len(r)))
+                if len(buf) >= chunk_rows:
+                    yield pd.DataFrame(buf, columns=headers)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=headers)
+        finally:
+            wb.close()
+    else:
+        # 舊版 .xls 無法串流，只能整份讀入後分段處理
+        df = pd.read_excel(path)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+
+def map_chunk(chunk, mapping, field_spec, key_field):
+    """
+    向量化欄位映射
+    mapping:    {ERP 欄位: 來源欄位位置}
+    field_spec: {ERP 欄位: (型別, 預設值)}，型別為 text / int / float / num
+    key_field:  主鍵欄位；空白或 nan 的列會被略過
+    """
+    out = {}
+    for label, (kind, default) in field_spec.items():
+        if label not in mapping:
+            out[label] = pd.Series(default, index=chunk.index)
+            continue
+
+        raw = chunk.iloc[:, mapping[label]]
+        if kind == "text":
+            s = raw.fillna("").astype(str).str.strip()
+            out[label] = s.where(s != "", default)
+        else:
+            num = pd.to_numeric(raw, errors="coerce")
+            if kind == "int":
+                # 與 int() 相同：小數直接捨去
+                out[label] = num.fillna(default).astype("int64")
+            elif kind == "float":
+                out[label] = num.fillna(default).astype(float)
+            else:
+                out[label] = num.astype(object).where(num.notna(), default)
+
+    df = pd.DataFrame(out, index=chunk.index)
+    key = df[key_field].astype(str).str.strip()
+    return df[(key != "") & (key.str.lower() != "nan")]
+
+
+def stream_import(path, mapping, field_spec, key_field, progress=None, cancelled=None):
+    """
+    逐批讀取並映射整份來源檔，回傳整理好的 DataFrame。
+    progress(已處理列數, 有效列數)：每批完成後回報 (可在背景執行緒呼叫)
+    cancelled()：回傳 True 時中止並回傳 None
+    """
+    parts = []
+    done = valid = 0
+    for chunk in iter_chunks(path):
+        if cancelled and cancelled():
+            return None
+        mapped = map_chunk(chunk, mapping, field_spec, key_field)
+        parts.append(mapped)
+        done += len(chunk)
+        valid += len(mapped)
+        if progress:
+            progress(done, valid)
+    if not parts:
+        return pd.DataFrame(columns=list(field_spec))
+    return pd.concat(parts, ignore_index=True)
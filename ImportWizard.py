@@ -5,6 +5,10 @@ from datetime import datetime
 import sys
 import os
 
+from ImportStream import FILE_TYPES, PREVIEW_ROWS, read_preview, estimate_rows, stream_import
+from oms_core.schema import PRODUCT_REQUIRED_FIELDS, product_field_spec
+from UpsertEngine import KEEP, ADD, OVERWRITE, TOUCH, POLICY_LABELS, PRODUCT_POLICIES
+
 # 嘗試匯入專業表格套件
 try:
     from tksheet import Sheet
@@ -22,12 +26,16 @@ def resource_path(relative_path):
 
 
 class ImportWizard(tk.Toplevel):
-    def __init__(self, parent, save_callback):
+    def __init__(self, parent, save_callback, executor):
         super().__init__(parent)
         self.title("商品資料批次匯入精靈 (Excel 售價支援版)")
         self.geometry("1200x850")
         self.save_callback = save_callback 
-        self.import_raw_df = pd.DataFrame()
+        self.executor = executor       # 全域 TaskExecutor：背景分批讀取與進度回報
+        self.import_path = None        # 來源檔路徑 (資料於匯入時才分批讀取)
+        self.preview_df = pd.DataFrame()
+        self.merge_policies = {}       # 既有商品的欄位合併策略
+        self._cancelled = False
 
         try:
             # 嘗試讀取圖標
@@ -36,7 +44,7 @@ class ImportWizard(tk.Toplevel):
             pass
 
         # ERP 核心必填欄位 (維持名稱、庫存、成本)
-        self.REQUIRED_FIELDS = ["商品名稱", "目前庫存", "預設成本"]
+        self.REQUIRED_FIELDS = list(PRODUCT_REQUIRED_FIELDS)
         
         self.grab_set()
         self.setup_ui()
@@ -107,23 +115,43 @@ class ImportWizard(tk.Toplevel):
 
         ttk.Label(right_f, text="\n* 每個欄位均可選擇「不匯入」", foreground="#d9534f", font=("", 9)).pack(anchor="w")
 
+        # 既有商品的庫存處理方式 (未匯入的欄位一律保留現有值)
+        stock_f = ttk.Frame(right_f)
+        stock_f.pack(fill="x", pady=(8, 0))
+        ttk.Label(stock_f, text="既有商品庫存:", width=13).pack(side="left")
+        self.var_stock_policy = tk.StringVar(value=POLICY_LABELS[KEEP])
+        ttk.Combobox(stock_f, textvariable=self.var_stock_policy, state="readonly",
+                     values=[POLICY_LABELS[p] for p in (KEEP, ADD, OVERWRITE)]).pack(side="left", fill="x", expand=True)
+
         # 底部：按鈕區
         footer = ttk.Frame(self, padding=20)
         footer.pack(fill="x")
-        ttk.Button(footer, text="✅ 開始執行資料核對與匯入", command=self.execute_import, width=35).pack(side="right")
-        ttk.Button(footer, text="❌ 取消", command=self.destroy).pack(side="right", padx=10)
+        self.btn_import = ttk.Button(footer, text="✅ 開始執行資料核對與匯入", command=self.execute_import, width=35)
+        self.btn_import.pack(side="right")
+        ttk.Button(footer, text="❌ 取消", command=self.cancel).pack(side="right", padx=10)
+
+        # 進度條 (分批讀取時回報)
+        self.progress = ttk.Progressbar(footer, mode="determinate", length=300)
+        self.progress.pack(side="left")
+        self.lbl_progress = ttk.Label(footer, text="", foreground="gray")
+        self.lbl_progress.pack(side="left", padx=10)
+
+    def cancel(self):
+        self._cancelled = True
+        self.destroy()
 
     def load_file(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel 活頁簿", "*.xlsx"), ("舊版 Excel", "*.xls")])
+        path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not path: 
             return
         try:
-            self.lbl_path.config(text=f"已載入: {os.path.basename(path)}", foreground="green")
-            self.import_raw_df = pd.read_excel(path).fillna("")
-            headers = self.import_raw_df.columns.tolist()
+            # 只讀取前幾列作為預覽，完整資料在匯入時才分批讀取
+            headers, self.preview_df = read_preview(path)
+            self.import_path = path
+            self.lbl_path.config(text=f"已載入: {os.path.basename(path)} (預覽前 {PREVIEW_ROWS} 列)", foreground="green")
             
             if Sheet and isinstance(self.sheet, Sheet):
-                self.sheet.set_sheet_data(self.import_raw_df.values.tolist())
+                self.sheet.set_sheet_data(self.preview_df.values.tolist())
                 self.sheet.headers(headers)
 
             options = ["(不匯入 / 留空)"] + [f"列 {i}: {h}" for i, h in enumerate(headers)]
@@ -156,7 +184,7 @@ class ImportWizard(tk.Toplevel):
             messagebox.showerror("讀取失敗", f"Excel 解析錯誤: {e}")
 
     def execute_import(self):
-        if self.import_raw_df.empty:
+        if not self.import_path or self.preview_df.empty:
             messagebox.showwarning("警告", "沒有可匯入的資料。")
             return
 
@@ -173,57 +201,57 @@ class ImportWizard(tk.Toplevel):
             messagebox.showerror("映射不全", f"您漏掉了核心必填欄位：\n{', '.join(missing)}")
             return
 
-        # 3. 逐行資料清洗與轉換
-        new_list = []
+        # 3. 欄位規格：(型別, 預設值)，由 ImportStream 向量化轉換
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+        field_spec = product_field_spec(now_str)
+
+        # 4. 合併策略：未匹配的欄位保留既有商品的現有值，庫存依使用者選擇
+        label_to_policy = {v: k for k, v in POLICY_LABELS.items()}
+        self.merge_policies = {f: KEEP for f in field_spec
+                               if f not in mapping and PRODUCT_POLICIES.get(f) != TOUCH}
+        if "目前庫存" in mapping:
+            self.merge_policies["目前庫存"] = label_to_policy.get(self.var_stock_policy.get(), KEEP)
+
+        # 5. 背景分批讀取，進度回報給主執行緒
+        total = estimate_rows(self.import_path)
+        self.progress.config(mode="determinate" if total else "indeterminate", maximum=total or 100, value=0)
+        if not total:
+            self.progress.start(10)
+        self.btn_import.config(state="disabled")
+        self._cancelled = False
+
+        post = self.executor.post
+        self.executor.submit(
+            stream_import, self.import_path, mapping, field_spec, "商品名稱", name="import",
+            progress=lambda done, valid: post(lambda: self._on_progress(done, valid, total)),
+            cancelled=lambda: self._cancelled,
+            on_done=self._on_import_ready, on_error=self._on_import_failed)
+
+    def _on_progress(self, done, valid, total):
+        if self._cancelled:
+            return
+        if total:
+            self.progress.config(value=min(done, total))
+        self.lbl_progress.config(text=f"已讀取 {done} 列 / 有效 {valid} 筆")
+
+    def _on_import_failed(self, err):
+        if self._cancelled:
+            return
+        self.progress.stop()
+        self.btn_import.config(state="normal")
+        messagebox.showerror("讀取失敗", f"Excel 解析錯誤: {err}")
+
+    def _on_import_ready(self, df_new):
+        if self._cancelled or df_new is None:
+            return
+        self.progress.stop()
+        self.btn_import.config(state="normal")
 
-        for _, row in self.import_raw_df.iterrows():
-            try:
-                p_name = str(row.iloc[mapping["商品名稱"]]).strip()
-                if not p_name or p_name.lower() == "nan": 
-                    continue
-
-                def get_val(key, default):
-                    if key in mapping:
-                        v = row.iloc[mapping[key]]
-                        return str(v).strip() if str(v).strip() != "" else default
-                    return default
-
-                def get_num(key, default, is_float=False):
-                    if key in mapping:
-                        raw_v = row.iloc[mapping[key]]
-                        # pd.to_numeric 會處理空值並轉為 NaN，隨後用 .fillna(default) 補位
-                        val = pd.to_numeric(raw_v, errors='coerce')
-                        if pd.isna(val): 
-                            return default
-                        return float(val) if is_float else int(val)
-                    return default
-
-                item = {
-                    "商品編號": get_val("商品編號", ""),
-                    "分類Tag": get_val("分類Tag", "未分類"),
-                    "商品名稱": p_name,
-                    "預設成本": get_num("預設成本", 0.0, True),
-                    "預設售價": get_num("預設售價", 0.0, True), # <--- 新增
-                    "目前庫存": get_num("目前庫存", 0),
-                    "最後更新時間": now_str,
-                    "初始上架時間": get_val("初始上架時間", now_str),
-                    "最後進貨時間": get_val("最後進貨時間", ""),
-                    "安全庫存": get_num("安全庫存", 0),
-                    "商品連結": get_val("商品連結", "無"),
-                    "商品備註": get_val("商品備註", "無"),
-                    "單位權重": get_num("單位權重", 1.0, True)
-                }
-                new_list.append(item)
-            except Exception:
-                continue
-
-        if not new_list:
+        if df_new.empty:
             messagebox.showwarning("警告", "掃描後無有效商品可匯入。")
             return
 
-        # 4. 最終發射
-        if messagebox.askyesno("匯入確認", f"已完成資料校準，準備匯入 {len(new_list)} 筆商品。\n確定執行嗎？"):
-            if self.save_callback(new_list):
-                messagebox.showinfo("成功", "商品資料庫已完成增量更新。")
-                self.destroy()
\ No newline at end of file
+        # 6. 最終發射 (主程式會先顯示差異摘要再確認寫入)
+        if self.save_callback(df_new, self.merge_policies):
+            messagebox.showinfo("成功", "商品資料庫已完成增量更新。")
+            self.destroy()
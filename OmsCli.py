@@ -0,0 +1,513 @@
+"""
+命令列批次工具 (無介面)
+與介面呼叫同一套核心 (oms_core、ImportStream、UpsertEngine、OrderIngest)，適合排程在夜間處理大量資料：
+
+    python OmsCli.py procure --out 採購建議.csv
+    python OmsCli.py analysis --from 2024-01-01 --to 2024-03-31 --out 營收分析.xlsx
+    python OmsCli.py import products 商品.xlsx --stock add
+    python OmsCli.py import vendors 廠商.csv --dry-run
+    python OmsCli.py import orders 蝦皮匯出.xlsx --fee 蝦皮一般
+    python OmsCli.py complete 2401010001 2401010002 --ids-file 待結案.txt
+    python OmsCli.py allocate 240301 240302 --ship 1850 --tax 320
+    python OmsCli.py track                   # 依 carriers.json 自動查詢在途物流並推進階段
+    python OmsCli.py vendor-scores
+    python OmsCli.py compact
+    python OmsCli.py export 銷售紀錄 商品資料 --format csv --out 匯出
+
+共用參數 --file 指定活頁簿 (預設為程式目錄下的 sales_data.xlsx)。
+寫入指令只讀、寫活頁簿各一次，存檔規則與介面相同 (資料校準、原子置換、保留 .bak)，並記錄本機快照。
+介面或區網伺服器開著同一本活頁簿時，請勿執行寫入指令 (兩邊會互相覆蓋)。
+
+結束代碼：0 成功 / 1 執行失敗 / 2 部分資料有誤 (例如找不到的訂單、匯入錯誤列)
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+import oms_core as S
+from oms_core.analysis import SORT_KEYS
+
+EXPORT_FORMATS = ("csv", "xlsx", "json")
+SORT_CHOICES = {v: k for k, v in SORT_KEYS.items()}     # 命令列代號 -> 介面上的排序名稱
+
+
+def _now_full():
+    return datetime.now().strftime("%Y-%m-%d %H:%M")
+
+
+class Workbook:
+    """ 一次指令的活頁簿存取：開頭讀一次，結尾寫一次 (只有真的有變動才寫) """
+
+    def __init__(self, path, snapshot_dir=None):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.frames = None
+        self.changed = []
+        self._stamp = None
+
+    def load(self, sheet_names=None):
+        """ 唯讀指令只讀需要的分頁；寫入指令讀全部 (存檔時需要完整活頁簿) """
+        self._stamp = self._file_stamp()
+        self.frames = S.read_sheets(self.path, sheet_names)
+        return self.frames
+
+    def get(self, sheet_name, columns=None):
+        df = self.frames.get(sheet_name)
+        if df is None:
+            df = pd.DataFrame(columns=columns or [])
+        return df
+
+    def update(self, sheet_name, df):
+        self.frames[sheet_name] = df
+        if sheet_name not in self.changed:
+            self.changed.append(sheet_name)
+
+    def _file_stamp(self):
+        if not os.path.exists(self.path):
+            return None
+        st = os.stat(self.path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def save(self):
+        if not self.changed:
+            print("system: nothing changed, workbook not written")
+            return True
+        if self._file_stamp() != self._stamp:
+            print("system: workbook was modified by another program during this run, aborting save")
+            return False
+        S.scrub_frames(self.frames)
+        sheet_order = S.write_workbook(self.path, self.frames)
+        print(f"system: saved {', '.join(self.changed)} -> {self.path}")
+        self._record_snapshot(sheet_order)
+        return True
+
+    def _record_snapshot(self, sheet_order):
+        """ 與介面相同：快照失敗不影響存檔本身 """
+        if not self.snapshot_dir:
+            return
+        try:
+            from SnapshotStore import SnapshotStore
+            store = SnapshotStore(self.snapshot_dir)
+            snap_id, written = store.snapshot(self.frames, sheet_order, self.changed, self.path, self._stamp)
+            print(f"system: snapshot {snap_id} (+{written / 1024:.1f} KB)")
+        except Exception as e:
+            print(f"system: failed to record snapshot: {e}")
+
+
+def _write_table(df, out):
+    """ 依副檔名輸出 (.csv 以 utf-8-sig 寫入，Excel 可直接開啟) """
+    if out.lower().endswith(".xlsx"):
+        df.to_excel(out, index=False)
+    elif out.lower().endswith(".json"):
+        df.to_json(out, orient="records", force_ascii=False, indent=1)
+    else:
+        df.to_csv(out, index=False, encoding="utf-8-sig")
+    print(f"system: wrote {len(df)} rows -> {out}")
+
+
+def _print_table(df, limit=None):
+    if df.empty:
+        print("(無資料)")
+        return
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200,
+                           "display.unicode.east_asian_width", True):
+        print(df.head(limit).to_string(index=False) if limit else df.to_string(index=False))
+
+
+# ================= 報表 =================
+def cmd_procure(wb, args):
+    """ 採購建議 (與 ProcurementManager 相同的補貨點計算) """
+    frames = wb.load([S.SHEET_SALES, S.SHEET_PRODUCTS])
+    report = S.procurement_report(wb.get(S.SHEET_SALES, ["商品名稱", "數量", "日期"]), frames[S.SHEET_PRODUCTS],
+                                  args.velocity, args.days, args.safety)
+    df = pd.DataFrame(report, columns=["name", "stock", "reorder_point", "velocity", "status", "suggest_qty"])
+    df["velocity"] = df["velocity"].round(2)
+    df.columns = ["商品名稱", "目前庫存", "補貨點", "日均銷量", "狀態", "建議採購量"]
+    print(f"system: {len(df)} products need restocking")
+    if args.out:
+        _write_table(df, args.out)
+    else:
+        _print_table(df)
+    return 0
+
+
+def cmd_analysis(wb, args):
+    """ 營收分析 (與 calculate_analysis_data 相同的運算，可指定日期區間) """
+    from oms_core.analysis import compute_analysis
+    result = compute_analysis(wb.path, S.SHEET_SALES, S.SHEET_PRODUCTS, S.SHEET_AFTER_SALES,
+                              SORT_CHOICES[args.sort], date_from=args.date_from, date_to=args.date_to,
+                              daily_limit=None if (args.date_from or args.date_to) else 10)
+    if result is None:
+        print("system: no sales data in range")
+        return 0
+
+    period_cols = ["期間", "營收", "實質淨利", "訂單數"]
+    df_month = pd.DataFrame(result["monthly"], columns=period_cols)
+    df_day = pd.DataFrame(result["daily"], columns=period_cols)
+    df_prod = pd.DataFrame(result["products"], columns=["name", "qty", "profit", "margin", "velocity"])
+    df_prod.columns = ["商品名稱", "總銷量", "實質淨利", "毛利率%", "日均銷量"]
+    for df in (df_month, df_day):
+        df[["營收", "實質淨利"]] = df[["營收", "實質淨利"]].astype(float)
+    df_prod[["實質淨利", "毛利率%", "日均銷量"]] = df_prod[["實質淨利", "毛利率%", "日均銷量"]].astype(float).round(2)
+
+    if args.out:
+        if args.out.lower().endswith(".xlsx"):
+            with pd.ExcelWriter(args.out, engine="openpyxl") as writer:
+                df_month.to_excel(writer, sheet_name="月報", index=False)
+                df_day.to_excel(writer, sheet_name="日報", index=False)
+                df_prod.to_excel(writer, sheet_name="商品排行", index=False)
+            print(f"system: wrote analysis -> {args.out}")
+        else:
+            _write_table(df_prod, args.out)
+    else:
+        print("== 月報 ==")
+        _print_table(df_month)
+        print("\n== 日報 ==")
+        _print_table(df_day)
+        print(f"\n== 商品排行 ({args.sort}) ==")
+        _print_table(df_prod, args.top)
+    return 0
+
+
+# ================= 匯入 =================
+def _map_by_header(path, field_spec, overrides):
+    """ 以標題名稱自動對應欄位，--map 欄位=來源標題 可覆寫；回傳 {ERP 欄位: 來源欄位位置} """
+    from ImportStream import read_preview
+    headers, _ = read_preview(path, n_rows=1)
+    headers = [str(h).strip() for h in headers]
+    mapping = {f: headers.index(f) for f in field_spec if f in headers}
+    for item in overrides or []:
+        field, _, source = item.partition("=")
+        field, source = field.strip(), source.strip()
+        if field not in field_spec:
+            raise ValueError(f"未知的欄位：{field}")
+        if source not in headers:
+            raise ValueError(f"來源檔沒有標題：{source}")
+        mapping[field] = headers.index(source)
+    return mapping
+
+
+def _import_master(wb, args, sheet_name, field_spec, required, keys, base_policies, label):
+    """ 商品 / 廠商主檔：與匯入精靈相同的欄位規格與合併策略，以 UpsertEngine 依主鍵增量更新 """
+    from ImportStream import stream_import
+    from UpsertEngine import TOUCH, KEEP, format_summary, upsert
+
+    mapping = _map_by_header(args.source, field_spec, args.map)
+    missing = [f for f in required if f not in mapping]
+    if missing:
+        print(f"system: missing required columns: {', '.join(missing)} (use --map 欄位=來源標題)")
+        return 1
+
+    # 未對應的欄位保留既有值，避免預設值蓋掉現有資料
+    policies = {f: KEEP for f in field_spec if f not in mapping and base_policies.get(f) != TOUCH}
+    if args.stock and "目前庫存" in mapping:
+        policies["目前庫存"] = args.stock
+    policies = {**base_policies, **policies}
+
+    df_new = stream_import(args.source, mapping, field_spec, required[0],
+                           progress=lambda done, valid: print(f"system: read {done} rows ({valid} valid)"))
+    if df_new.empty:
+        print(f"system: no valid {label} rows in {args.source}")
+        return 1
+
+    wb.load()
+    df_merged, summary = upsert(wb.get(sheet_name, list(field_spec)), df_new, keys, policies)
+    print(format_summary(summary, policies))
+    if args.dry_run or (summary["inserted"] == 0 and summary["updated"] == 0):
+        return 0
+    wb.update(sheet_name, df_merged)
+    return 0 if wb.save() else 1
+
+
+def cmd_import(wb, args):
+    now_str = _now_full()
+    if args.kind == "products":
+        from UpsertEngine import PRODUCT_POLICIES
+        return _import_master(wb, args, S.SHEET_PRODUCTS, S.product_field_spec(now_str), S.PRODUCT_REQUIRED_FIELDS,
+                              ["商品編號", "商品名稱"], PRODUCT_POLICIES, "product")
+    if args.kind == "vendors":
+        from UpsertEngine import VENDOR_POLICIES
+        return _import_master(wb, args, S.SHEET_VENDORS, S.vendor_field_spec(now_str), S.VENDOR_REQUIRED_FIELDS,
+                              ["廠商名稱"], VENDOR_POLICIES, "vendor")
+    return _import_orders(wb, args, now_str)
+
+
+def _import_orders(wb, args, now_str):
+    """ 平台訂單匯出檔 -> 訂單追蹤 (與介面「匯入平台訂單」相同的驗證、費用分攤與扣庫存) """
+    import OrderIngest
+
+    lines, _ = OrderIngest.read_export(args.source, progress=lambda done: print(f"system: read {done} rows"))
+    wb.load()
+    fees = S.fee_table(wb.frames.get(S.SHEET_FEES))
+    if args.fee and args.fee not in fees:
+        print(f"system: unknown fee rule: {args.fee} (available: {', '.join(fees) or '-'})")
+        return 1
+    rate, fixed = fees.get(args.fee, (0.0, 0.0))
+
+    df_track = wb.get(S.SHEET_TRACKING, ["訂單編號"])
+    existing = set()
+    for df in (df_track, wb.get(S.SHEET_SALES, ["訂單編號"])):
+        existing.update(S.clean_ids(df["訂單編號"]))
+    existing.discard("")
+
+    df_rows, stock_out, errors = OrderIngest.build_tracking_rows(
+        lines, wb.frames[S.SHEET_PRODUCTS], existing, fee_rate=rate, fee_fixed=fixed,
+        platform=args.platform, fee_tag=args.fee or "")
+    n_orders = df_rows["訂單編號"].nunique() if not df_rows.empty else 0
+    print(f"system: {n_orders} orders / {len(df_rows)} lines valid, {len(errors)} rows skipped")
+    if errors:
+        report_path = os.path.splitext(args.source)[0] + "_匯入錯誤報告.csv"
+        OrderIngest.write_error_report(errors, report_path)
+        print(f"system: error report -> {report_path}")
+    if df_rows.empty or args.dry_run:
+        return 2 if errors else 0
+
+    df_prods, df_track, df_rows = OrderIngest.merge_into_tracking(
+        wb.frames[S.SHEET_PRODUCTS], df_track, df_rows, stock_out, now_str, wb.get(S.SHEET_SALES, ["訂單編號"]))
+    if df_rows.empty:
+        return 2 if errors else 0
+    wb.update(S.SHEET_PRODUCTS, df_prods)
+    wb.update(S.SHEET_TRACKING, df_track)
+    if not wb.save():
+        return 1
+    return 2 if errors else 0
+
+
+# ================= 訂單 / 廠商 =================
+def cmd_complete(wb, args):
+    """ 批次結案：所有訂單一次移到銷售紀錄，全表只排序、存檔一次 """
+    ids = list(args.ids)
+    if args.ids_file:
+        with open(args.ids_file, encoding="utf-8-sig") as f:
+            ids += [line.strip() for line in f if line.strip()]
+    if not ids:
+        print("system: no order IDs given")
+        return 1
+
+    wb.load()
+    df_track = S.normalize_order_ids(wb.get(S.SHEET_TRACKING, ["訂單編號"]))
+    df_track, df_sales, missing = S.complete_orders(df_track, wb.get(S.SHEET_SALES), ids)
+    for oid in missing:
+        print(f"system: order not found in tracking: {oid}")
+    done = len(set(S.clean_id(o) for o in ids)) - len(missing)
+    if done:
+        wb.update(S.SHEET_TRACKING, df_track)
+        wb.update(S.SHEET_SALES, df_sales)
+        if not wb.save():
+            return 1
+    print(f"system: {done} orders completed")
+    return 2 if missing else 0
+
+
+def cmd_allocate(wb, args):
+    """ 集運併箱：多張進貨單共用的運費與關稅一起分攤，一次存檔 """
+    wb.load()
+    df_track = wb.get(S.SHEET_PUR_TRACKING, ["進貨單號", "商品名稱", "數量"])
+    pur_ids = S.shipment_orders(df_track, args.pur_ids) if args.same_shipment else args.pur_ids
+    df_track, df_hist = S.allocate_landed_cost(df_track, wb.get(S.SHEET_PURCHASES, ["進貨單號", "商品名稱"]),
+                                               wb.get(S.SHEET_PRODUCTS, ["商品名稱"]), pur_ids, args.ship, args.tax)
+    wb.update(S.SHEET_PUR_TRACKING, df_track)
+    wb.update(S.SHEET_PURCHASES, df_hist)
+    if not wb.save():
+        return 1
+    print(f"system: freight {args.ship} / duty {args.tax} allocated across {', '.join(S.clean_id(p) for p in pur_ids)}")
+    return 0
+
+
+def cmd_track(wb, args):
+    """ 在途進貨的物流單號一次併發查詢 (CarrierTracker)，階段與時間欄位批次寫回 """
+    import CarrierTracker
+    base_dir = os.path.dirname(wb.path)
+    adapters = CarrierTracker.load_adapters(args.carriers or os.path.join(base_dir, "carriers.json"))
+    if args.stub:
+        adapters.append(CarrierTracker.stub_adapter(urlsplit(args.stub).port or CarrierTracker.DEFAULT_STUB_PORT))
+    if not adapters:
+        print("system: no carrier adapters configured (carriers.json)")
+        return 1
+
+    wb.load()
+    numbers = CarrierTracker.in_transit_numbers(wb.get(S.SHEET_PUR_TRACKING))
+    cache = CarrierTracker.TrackingCache(os.path.join(base_dir, "tracking_cache.json"))
+    cache.prune(numbers)
+    poller = CarrierTracker.CarrierPoller(adapters, cache, ttl=CarrierTracker.CACHE_TTL if not args.force else 0)
+    results = poller.poll_sync(numbers)
+    print(f"system: polled {len(numbers)} tracking numbers, {len(results)} with status ({poller.stats})")
+
+    df_track, df_hist, n = S.advance_logistics(wb.get(S.SHEET_PUR_TRACKING), wb.get(S.SHEET_PURCHASES, ["進貨單號", "商品名稱"]),
+                                               results, datetime.now().strftime("%Y-%m-%d"))
+    if n:
+        wb.update(S.SHEET_PUR_TRACKING, df_track)
+        wb.update(S.SHEET_PURCHASES, df_hist)
+        if not wb.save():
+            return 1
+    print(f"system: {n} purchase lines updated")
+    return 0
+
+
+def cmd_vendor_scores(wb, args):
+    """ 依已入庫的進貨紀錄重新計算廠商績效 (全部廠商一次存檔) """
+    wb.load()
+    df_hist = wb.get(S.SHEET_PURCHASES, ["供應商", "入庫日期", "採購日期", "數量"])
+    df_v = wb.get(S.SHEET_VENDORS, ["廠商名稱"])
+    vendors = args.vendor or [v for v in df_v["廠商名稱"].dropna().astype(str).str.strip().unique() if v]
+    now_full = _now_full()
+    updated = 0
+    for vendor in vendors:
+        perf = S.vendor_performance(df_hist, vendor, args.stars)
+        if perf is None:
+            print(f"system: {vendor}: no received purchases, skipped")
+            continue
+        result = S.apply_vendor_score(df_v, vendor, perf, now_full)
+        if result is None:
+            print(f"system: {vendor}: not in vendor sheet, skipped")
+            continue
+        df_v = result
+        updated += 1
+        print(f"system: {vendor}: score {round(perf['score'], 1)} / {perf['stars']} stars, "
+              f"lead time {perf['lead_time']}d, quality {perf['quality_rate']}%, fulfillment {perf['fulfillment_rate']}%")
+    if updated:
+        wb.update(S.SHEET_VENDORS, df_v)
+        if not wb.save():
+            return 1
+    print(f"system: {updated} vendors updated")
+    return 0
+
+
+# ================= 維護 =================
+def cmd_compact(wb, args):
+    """ 重寫活頁簿 (移除整列空白、重新校準) 並清理快照庫與殘留暫存檔 """
+    if not args.snapshots_only:
+        size_before = os.path.getsize(wb.path)
+        wb.load()
+        for sn, df in list(wb.frames.items()):
+            blank = df.isna() | (df.astype(str).apply(lambda s: s.str.strip()) == "")
+            keep = ~blank.all(axis=1)
+            if not keep.all():
+                print(f"system: {sn}: dropped {int((~keep).sum())} empty rows")
+            wb.update(sn, df[keep].reset_index(drop=True))
+        if not wb.save():
+            return 1
+        print(f"system: workbook {size_before / 1024:.1f} KB -> {os.path.getsize(wb.path) / 1024:.1f} KB")
+
+    temp_file = os.path.join(os.path.dirname(wb.path), "temp_" + os.path.basename(wb.path))
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+        print(f"system: removed stale {temp_file}")
+
+    if wb.snapshot_dir and os.path.isdir(wb.snapshot_dir):
+        from SnapshotStore import SnapshotStore
+        store = SnapshotStore(wb.snapshot_dir)
+        removed, freed = store.prune()
+        freed += store.collect_garbage()
+        print(f"system: snapshots pruned {removed}, freed {freed / 1024:.1f} KB, "
+              f"store now {store.disk_usage() / 1024:.1f} KB ({len(store.list_snapshots())} snapshots)")
+    return 0
+
+
+def cmd_export(wb, args):
+    frames = wb.load(args.sheets or None)
+    missing = [sn for sn in args.sheets if sn not in frames]
+    for sn in missing:
+        print(f"system: sheet not found: {sn}")
+    os.makedirs(args.out, exist_ok=True)
+    for sn, df in frames.items():
+        _write_table(df, os.path.join(args.out, f"{sn}.{args.format}"))
+    return 2 if missing else 0
+
+
+COMMANDS = {
+    "procure": cmd_procure,
+    "analysis": cmd_analysis,
+    "import": cmd_import,
+    "complete": cmd_complete,
+    "allocate": cmd_allocate,
+    "track": cmd_track,
+    "vendor-scores": cmd_vendor_scores,
+    "compact": cmd_compact,
+    "export": cmd_export,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="蝦皮進銷存 命令列批次工具")
+    parser.add_argument("--file", default=None, help="活頁簿路徑 (預設為程式目錄下的 sales_data.xlsx)")
+    parser.add_argument("--snapshots", default=None, help="快照庫目錄 (預設為活頁簿旁的 snapshots)")
+    parser.add_argument("--no-snapshot", action="store_true", help="寫入後不記錄快照")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("procure", help="採購建議報表")
+    p.add_argument("--velocity", type=float, default=0.1, help="只列出日均銷量不低於此值的商品")
+    p.add_argument("--days", type=int, default=30, help="備貨天數")
+    p.add_argument("--safety", type=float, default=1.0, help="安全庫存加權係數")
+    p.add_argument("--out", help="輸出檔 (.csv / .xlsx / .json)；不指定則印在畫面上")
+
+    p = sub.add_parser("analysis", help="營收分析")
+    p.add_argument("--from", dest="date_from", help="起始日期 YYYY-MM-DD (含)")
+    p.add_argument("--to", dest="date_to", help="結束日期 YYYY-MM-DD (含)")
+    p.add_argument("--sort", choices=list(SORT_CHOICES), default="profit", help="商品排行依據")
+    p.add_argument("--top", type=int, default=20, help="畫面上列出的商品數")
+    p.add_argument("--out", help="輸出檔 (.xlsx 含月報 / 日報 / 商品排行；.csv 只含商品排行)")
+
+    p = sub.add_parser("import", help="匯入商品 / 廠商 / 平台訂單")
+    p.add_argument("kind", choices=["products", "vendors", "orders"])
+    p.add_argument("source", help="來源檔 (.xlsx / .xls / .csv)")
+    p.add_argument("--map", action="append", metavar="欄位=來源標題", help="手動指定欄位對應 (可重複)")
+    p.add_argument("--stock", choices=["keep", "add", "overwrite"], help="商品庫存合併策略 (預設保留現有)")
+    p.add_argument("--fee", help="訂單匯入使用的手續費設定名稱")
+    p.add_argument("--platform", default="蝦皮購物", help="訂單匯入的交易平台")
+    p.add_argument("--dry-run", action="store_true", help="只試算差異，不寫入")
+
+    p = sub.add_parser("complete", help="批次結案")
+    p.add_argument("ids", nargs="*", help="訂單編號")
+    p.add_argument("--ids-file", help="每行一個訂單編號的文字檔")
+
+    p = sub.add_parser("allocate", help="運費 / 關稅分攤 (多張進貨單合併集運)")
+    p.add_argument("pur_ids", nargs="+", help="進貨單號")
+    p.add_argument("--ship", type=float, default=0.0, help="總運費")
+    p.add_argument("--tax", type=float, default=0.0, help="總關稅")
+    p.add_argument("--same-shipment", action="store_true", help="一併分攤共用物流單號的其他進貨單")
+
+    p = sub.add_parser("track", help="自動查詢在途物流並推進階段")
+    p.add_argument("--carriers", help="物流商設定檔 (預設為活頁簿旁的 carriers.json)")
+    p.add_argument("--stub", metavar="URL", help="加入本機模擬物流商 (例如 http://127.0.0.1:8790)")
+    p.add_argument("--force", action="store_true", help="忽略快取時效，全部重新查詢 (仍使用條件式請求)")
+
+    p = sub.add_parser("vendor-scores", help="重新計算廠商績效")
+    p.add_argument("--vendor", action="append", help="只計算指定廠商 (可重複)")
+    p.add_argument("--stars", type=int, default=5, help="人為印象分數 1-5 (佔 20%%)")
+
+    p = sub.add_parser("compact", help="重寫活頁簿並清理快照庫")
+    p.add_argument("--snapshots-only", action="store_true", help="只清理快照庫，不重寫活頁簿")
+
+    p = sub.add_parser("export", help="匯出分頁")
+    p.add_argument("sheets", nargs="*", help="分頁名稱 (不指定則匯出全部)")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    p.add_argument("--out", default=f"export_{datetime.now():%Y%m%d}", help="輸出資料夾")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    path = args.file or os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "sales_data.xlsx")
+    if not os.path.exists(path):
+        print(f"system: workbook not found: {path}")
+        return 1
+    snapshot_dir = None if args.no_snapshot else (args.snapshots or os.path.join(os.path.dirname(path), "snapshots"))
+
+    wb = Workbook(path, snapshot_dir)
+    try:
+        return COMMANDS[args.command](wb, args)
+    except PermissionError:
+        print("system: workbook is locked by another program (close Excel first)")
+        return 1
+    except (ValueError, KeyError, S.OrderNotFound) as e:
+        print(f"system: {args.command} failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+蝦皮訂單匯出檔批次匯入 (寫入『訂單追蹤』)
+1. 以 ImportStream 分批讀取 CSV / xlsx 匯出檔。
+2. 自動辨識匯出欄位，轉成『訂單追蹤』的明細格式。
+3. 以 商品編號 → 商品名稱 索引對應商品主檔，帶入成本。
+4. 手續費與分攤直接使用 oms_core (platform_fee / build_order_rows)，與介面及伺服器送出的訂單一致。
+5. 以平台訂單編號去重，逐列回報錯誤；整批由呼叫端一次寫入。
+"""
+from decimal import Decimal
+
+import pandas as pd
+
+from ImportStream import iter_chunks, read_preview
+from oms_core.common import clean_ids
+from oms_core.orders import build_order_rows, platform_fee, restock_products
+
+# 『訂單追蹤』欄位 -> 匯出檔可能的標題 (中文版 / 英文版)
+SHOPEE_COLUMNS = {
+    "訂單編號": ["訂單編號", "訂單號碼", "Order ID"],
+    "日期": ["訂單成立日期", "訂單成立時間", "Order Creation Date"],
+    "買家名稱": ["買家帳號", "收件者姓名", "Username (Buyer)", "Receiver Name"],
+    "寄送方式": ["寄送方式", "Shipping Option"],
+    "取貨地點": ["取件門市", "收件地址", "Delivery Address"],
+    "商品編號": ["商品選項貨號", "主商品貨號", "SKU Reference No.", "Parent SKU Reference No."],
+    "商品名稱": ["商品名稱", "Product Name"],
+    "數量": ["數量", "Quantity"],
+    "單價(售)": ["商品活動價格", "商品原價", "Deal Price", "Original Price"],
+}
+REQUIRED_COLUMNS = ["訂單編號", "商品名稱", "數量", "單價(售)"]
+HEADER_OFFSET = 2   # 錯誤報告列號：標題列佔第 1 列
+
+
+def detect_columns(headers):
+    """ 依 SHOPEE_COLUMNS 比對匯出檔標題，回傳 {欄位: 來源欄位位置} """
+    normalized = [str(h).strip() for h in headers]
+    mapping = {}
+    for field, aliases in SHOPEE_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized.index(alias)
+                break
+    return mapping
+
+
+def build_product_index(df_prods):
+    """ 建立 商品編號 / 商品名稱 -> (商品名稱, 預設成本) 索引 """
+    df = df_prods.copy()
+    df["_name"] = df["商品名稱"].fillna("").astype(str).str.strip()
+    df["_cost"] = pd.to_numeric(df.get("預設成本", 0), errors="coerce").fillna(0.0)
+    df = df[df["_name"] != ""]
+
+    by_name = df.drop_duplicates("_name").set_index("_name")["_cost"]
+    if "商品編號" in df.columns:
+        df["_sku"] = clean_ids(df["商品編號"]).str.upper()
+        skus = df[df["_sku"] != ""].drop_duplicates("_sku").set_index("_sku")
+        by_sku = skus[["_name", "_cost"]]
+    else:
+        by_sku = pd.DataFrame(columns=["_name", "_cost"])
+    return by_sku, by_name
+
+
+def _map_chunk(chunk, mapping, offset):
+    """ 將一批原始列轉成標準欄位 (全部先保留文字，之後統一驗證) """
+    out = {"_row": pd.RangeIndex(offset, offset + len(chunk)) + HEADER_OFFSET}
+    for field in SHOPEE_COLUMNS:
+        if field in mapping:
+            out[field] = chunk.iloc[:, mapping[field]].fillna("").astype(str).str.strip().to_numpy()
+        else:
+            out[field] = ""
+    return pd.DataFrame(out)
+
+
+def read_export(path, progress=None):
+    """ 分批讀取整份匯出檔，回傳 (標準化明細 DataFrame, 欄位對應) """
+    headers, _ = read_preview(path, n_rows=1)
+    mapping = detect_columns(headers)
+    missing = [f for f in REQUIRED_COLUMNS if f not in mapping]
+    if missing:
+        raise ValueError(f"匯出檔缺少必要欄位：{', '.join(missing)}")
+
+    parts, done = [], 0
+    for chunk in iter_chunks(path):
+        parts.append(_map_chunk(chunk, mapping, done))
+        done += len(chunk)
+        if progress:
+            progress(done)
+    if not parts:
+        return pd.DataFrame(columns=["_row"] + list(SHOPEE_COLUMNS)), mapping
+    return pd.concat(parts, ignore_index=True), mapping
+
+
+def build_tracking_rows(lines, df_prods, existing_ids, fee_rate=0.0, fee_fixed=0.0,
+                        platform="蝦皮購物", fee_tag=""):
+    """
+    驗證並轉換明細，回傳 (訂單追蹤新列 DataFrame, 庫存扣除 Series(商品名稱 -> 數量), 錯誤清單)
+    錯誤清單每筆為 {"列號", "訂單編號", "原因"}；任何一列有誤，整筆訂單都不匯入。
+    """
+    df = lines.copy()
+    df["訂單編號"] = clean_ids(df["訂單編號"])
+    df["_qty"] = pd.to_numeric(df["數量"].str.replace(",", ""), errors="coerce")
+    df["_price"] = pd.to_numeric(df["單價(售)"].str.replace(r"[$,NT\s]", "", regex=True), errors="coerce")
+
+    # 1. 商品對應：先用編號，再用名稱
+    by_sku, by_name = build_product_index(df_prods)
+    sku = clean_ids(df["商品編號"]).str.upper()
+    df["_pname"] = sku.map(by_sku["_name"])
+    df["_cost"] = sku.map(by_sku["_cost"])
+    name = df["商品名稱"].str.strip()
+    by_name_hit = df["_pname"].isna() & name.isin(by_name.index)
+    df.loc[by_name_hit, "_pname"] = name[by_name_hit]
+    df.loc[by_name_hit, "_cost"] = name[by_name_hit].map(by_name)
+
+    # 2. 逐列驗證 (向量化)
+    reason = pd.Series("", index=df.index)
+    reason = reason.mask(df["_pname"].isna(), "找不到對應商品 (編號/名稱)")
+    reason = reason.mask(df["_price"].isna() | (df["_price"] < 0), "單價格式錯誤")
+    reason = reason.mask(df["_qty"].isna() | (df["_qty"] <= 0) | (df["_qty"] % 1 != 0), "數量格式錯誤")
+    reason = reason.mask(df["訂單編號"] == "", "缺少訂單編號")
+
+    dup = (df["訂單編號"] != "") & df["訂單編號"].isin(existing_ids)
+    reason = reason.mask(dup & (reason == ""), "訂單已存在，略過")
+
+    # 3. 整筆訂單連坐：同一訂單任一列有誤就全部不匯入
+    bad_orders = set(df.loc[reason != "", "訂單編號"]) - {""}
+    sibling = (reason == "") & df["訂單編號"].isin(bad_orders)
+    reason = reason.mask(sibling, "同訂單其他明細有誤")
+
+    errors = [{"列號": int(r), "訂單編號": o, "原因": m}
+              for r, o, m in zip(df.loc[reason != "", "_row"], df.loc[reason != "", "訂單編號"],
+                                 reason[reason != ""])]
+
+    ok = df[reason == ""]
+    if ok.empty:
+        return pd.DataFrame(), pd.Series(dtype="int64"), errors
+
+    # 4. 日期：只保留 YYYY-MM-DD
+    dates = pd.to_datetime(ok["日期"], errors="coerce")
+    date_str = dates.dt.strftime("%Y-%m-%d").where(dates.notna(), ok["日期"])
+
+    # 5. 每筆訂單交給 build_order_rows 分攤 (手續費 = 總額 * 費率 + 固定費，與 submit_order 相同)
+    #    依訂單首次出現的順序產生，同一訂單的明細排在一起 (匯出檔偶爾會把同一訂單拆在不相鄰的列)
+    #    欄位先轉成 list 再依訂單分組，避免逐組 groupby 與逐格存取
+    orders = {}
+    for i, oid in enumerate(ok["訂單編號"].tolist()):
+        orders.setdefault(oid, []).append(i)
+    cols = {c: ok[c].tolist() for c in ("商品編號", "_pname", "_price", "_cost", "買家名稱", "寄送方式", "取貨地點")}
+    qtys = ok["_qty"].astype(int).tolist()
+    dates = date_str.tolist()
+    rows = []
+    for oid, idx in orders.items():
+        items = [{"sku": cols["商品編號"][i], "name": cols["_pname"][i], "qty": qtys[i],
+                  "unit_price": cols["_price"][i], "unit_cost": cols["_cost"][i],
+                  "total_sales": Decimal(str(cols["_price"][i])) * qtys[i],
+                  "total_cost": Decimal(str(cols["_cost"][i])) * qtys[i]} for i in idx]
+        t_sales = sum((item["total_sales"] for item in items), Decimal("0.00"))
+        i = idx[0]
+        header = {"date": dates[i], "buyer": cols["買家名稱"][i], "platform": platform,
+                  "ship_method": cols["寄送方式"][i], "location": cols["取貨地點"][i]}
+        rows.extend(build_order_rows(items, header, f"'{oid}", t_sales, platform_fee(t_sales, fee_rate, fee_fixed),
+                                     fee_tag=fee_tag))
+    df_rows = pd.DataFrame(rows)
+
+    stock_out = ok.groupby("_pname")["_qty"].sum().astype(int)
+    return df_rows, stock_out, errors
+
+
+def merge_into_tracking(df_prods, df_track, df_rows, stock_out, now_str, df_sales=None):
+    """
+    寫入前的最後合併：以最新的追蹤表與銷售紀錄再去重一次、依商品名稱扣庫存 (向量化，同名只扣第一筆)、接到追蹤表尾端。
+    被略過的訂單不扣庫存 (依實際寫入的明細重新彙總)。
+    回傳 (商品資料, 訂單追蹤, 實際寫入的明細)；實際寫入為空時不需存檔。
+    """
+    # 讀檔期間若有人手動建立或結案相同訂單，這裡再擋一次
+    existing = set()
+    for df in (df_track, df_sales):
+        if df is not None and not df.empty and "訂單編號" in df.columns:
+            existing.update(clean_ids(df["訂單編號"]))
+    existing.discard("")
+    keep = ~clean_ids(df_rows["訂單編號"]).isin(existing)
+    if not keep.all():
+        df_rows = df_rows[keep]
+        print(f"system: {int((~keep).sum())} ingested lines skipped (order already exists)")
+        stock_out = df_rows.groupby("商品名稱")["數量"].sum().astype(int) if not df_rows.empty else stock_out.iloc[0:0]
+    if df_rows.empty:
+        return df_prods, df_track, df_rows
+
+    # 同名商品只扣第一筆 (與 submit_order 的 apply_sale_to_products 相同)
+    restock_products(df_prods, -stock_out[stock_out != 0], now_str)
+
+    return df_prods, pd.concat([df_track, df_rows], ignore_index=True), df_rows
+
+
+def write_error_report(errors, path):
+    """ 將錯誤清單寫成 CSV (Excel 可直接開啟) """
+    pd.DataFrame(errors, columns=["列號", "訂單編號", "原因"]).to_csv(path, index=False, encoding="utf-8-sig")
@@ -0,0 +1,180 @@
+"""
+訂單伺服器壓力測試
+預設會在暫存資料夾建立測試活頁簿並在本機啟動伺服器，多個用戶端執行緒同時
+送出訂單 / 查庫存 / 搜尋商品 / 結案，最後列出每秒處理量與延遲分佈。
+
+    python OrderLoadTest.py                          # 本機自動起伺服器
+    python OrderLoadTest.py --clients 8 --seconds 20
+    python OrderLoadTest.py --url http://192.168.1.10:8765   # 對既有伺服器測試 (會真的下單！)
+    python OrderLoadTest.py --baseline               # 另外量測「每筆讀整本 + 寫整本」的舊存檔方式
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from OrderServer import OmsClient, OmsClientError, start_server
+
+MIX = (("stock", 40), ("search", 30), ("submit", 25), ("complete", 5))
+
+
+def make_workbook(path, n_products=500, n_sales=5000):
+    """ 建立測試用活頁簿 (商品、歷史銷售、手續費設定) """
+    import pandas as pd
+    import oms_core as S
+
+    rng = random.Random(7)
+    prods = pd.DataFrame({
+        "商品編號": [f"P{i:05d}" for i in range(n_products)],
+        "分類Tag": [rng.choice(["文具", "玩具", "3C", "居家"]) for _ in range(n_products)],
+        "商品名稱": [f"測試商品{i}" for i in range(n_products)],
+        "預設成本": [rng.randint(20, 400) for _ in range(n_products)],
+        "預設售價": [rng.randint(450, 900) for _ in range(n_products)],
+        "目前庫存": [100000] * n_products,
+        "最後更新時間": "", "初始上架時間": "2024-01-01", "最後進貨時間": "", "安全庫存": 5,
+        "商品連結": "", "商品備註": "", "單位權重": 1.0,
+    })
+    sales_rows = []
+    for i in range(n_sales):
+        sales_rows.append({"訂單編號": f"'2024{i:010d}", "日期": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                           "買家名稱": f"買家{i % 300}", "交易平台": "蝦皮購物", "寄送方式": "7-11", "取貨地點": "臺北市",
+                           "商品名稱": f"測試商品{i % n_products}", "數量": 1, "單價(售)": 500, "單價(進)": 200,
+                           "總銷售額": 500, "總成本": 200, "分攤手續費": 30, "扣費項目": "", "總淨利": 270,
+                           "毛利率": 54.0, "稅額": 0})
+    sales = pd.DataFrame(sales_rows)
+    frames = {
+        S.SHEET_PRODUCTS: prods,
+        S.SHEET_SALES: sales,
+        S.SHEET_TRACKING: sales.iloc[0:0].copy(),
+        S.SHEET_RETURNS: sales.iloc[0:0].copy(),
+        S.SHEET_FEES: pd.DataFrame({"設定名稱": ["蝦皮一般"], "費率百分比": [6.0], "固定金額": [0.0]}),
+    }
+    S.write_workbook(path, S.scrub_frames(frames))
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_load(client, seconds, clients, n_products):
+    latencies = {op: [] for op, _ in MIX}
+    errors = []
+    open_orders = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    ops, weights = zip(*MIX)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                if op == "stock":
+                    client.stock(name=f"測試商品{rng.randrange(n_products)}")
+                elif op == "search":
+                    client.search_products(f"商品{rng.randrange(100)}", 20)
+                elif op == "submit":
+                    items = [{"name": f"測試商品{rng.randrange(n_products)}", "qty": rng.randint(1, 3)}
+                             for _ in range(rng.randint(1, 3))]
+                    res = client.submit_order({"items": items, "buyer": f"壓測{seed}", "fee": "蝦皮一般"})
+                    with lock:
+                        open_orders.append(res["order_id"])
+                elif op == "complete":
+                    with lock:
+                        oid = open_orders.pop(0) if open_orders else None
+                    if oid is None:
+                        continue
+                    client.complete_order(oid)
+            except (OmsClientError, OSError) as e:
+                errors.append(f"{op}: {e}")
+                continue
+            with lock:
+                latencies[op].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    t_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{clients} 個用戶端，{elapsed:.1f} 秒，共 {total} 個請求 ({total / elapsed:.1f} req/s)，錯誤 {len(errors)}")
+    print(f"{'操作':<10}{'次數':>8}{'每秒':>9}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for op, vals in latencies.items():
+        if vals:
+            print(f"{op:<10}{len(vals):>8}{len(vals) / elapsed:>9.1f}{_percentile(vals, .5) * 1000:>10.1f}"
+                  f"{_percentile(vals, .95) * 1000:>10.1f}{max(vals) * 1000:>10.1f}")
+    for e in errors[:5]:
+        print(f"  error: {e}")
+    return total / elapsed
+
+
+def run_baseline(path, orders):
+    """ 舊存檔方式：每筆訂單都讀整本、清洗、寫整本 """
+    import pandas as pd
+    import oms_core as S
+
+    t0 = time.perf_counter()
+    for i in range(orders):
+        with pd.ExcelFile(path) as xls:
+            frames = {sn: pd.read_excel(xls, sheet_name=sn) for sn in xls.sheet_names}
+        cart = S.cart_from_request(frames[S.SHEET_PRODUCTS], [{"name": f"測試商品{i}", "qty": 1}])
+        t_sales = Decimal(str(cart[0]['total_sales']))
+        rows = S.build_order_rows(cart, {"date": "2024-01-01"}, str(i), t_sales, S.platform_fee(t_sales, 6, 0))
+        S.apply_sale_to_products(frames[S.SHEET_PRODUCTS], cart, "2024-01-01 00:00")
+        frames[S.SHEET_TRACKING] = S.append_to_tracking(frames[S.SHEET_TRACKING], rows)
+        S.write_workbook(path, S.scrub_frames(frames))
+    elapsed = time.perf_counter() - t0
+    print(f"\n舊存檔方式 (單一程序逐筆讀寫整本)：{orders} 筆訂單 {elapsed:.1f} 秒 ({orders / elapsed:.2f} 筆/秒)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="訂單伺服器壓力測試")
+    parser.add_argument("--url", help="測試既有伺服器 (不指定則在本機建立測試資料並啟動伺服器)")
+    parser.add_argument("--token", default=os.environ.get("OMS_TOKEN"))
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=5000, help="測試活頁簿的歷史銷售筆數")
+    parser.add_argument("--flush-delay", type=float, default=0.0)
+    parser.add_argument("--baseline", type=int, nargs="?", const=20, default=0, help="另外量測舊存檔方式 N 筆")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = OmsClient(args.url, args.token)
+        run_load(client, args.seconds, args.clients, args.products)
+        return 0
+
+    work = tempfile.mkdtemp(prefix="oms_load_")
+    path = os.path.join(work, "sales_data.xlsx")
+    try:
+        make_workbook(path, args.products, args.sales)
+        server, store = start_server(path, port=0, flush_delay=args.flush_delay)
+        client = OmsClient(f"http://127.0.0.1:{server.server_address[1]}")
+        run_load(client, args.seconds, args.clients, args.products)
+        server.shutdown()
+        store.close()
+        s = store.stats
+        if s["flushes"]:
+            print(f"寫入 {s['writes']} 次，合併為 {s['flushes']} 次存檔 (平均每次存檔 {s['flush_ms'] / s['flushes']:.0f} ms)")
+        if args.baseline:
+            make_workbook(path, args.products, args.sales)
+            run_baseline(path, args.baseline)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
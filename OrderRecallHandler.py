@@ -8,16 +8,22 @@ class RecallManager:
     專門處理將『已送出但未結案』的數據抓回輸入頁面，並補償相關庫存或狀態。
     """
 
+    @staticmethod
+    def _selected_ids(tree):
+        """ 多選列的編號 (依選取順序去重) """
+        return [i for i in dict.fromkeys(
+            str(tree.item(sel)['values'][0]).replace("'", "").strip() for sel in tree.selection()) if i]
+
     @staticmethod
     def recall_sales_order(app):
-        """ 將訂單追蹤區的資料退回至『銷售輸入』 """
-        sel = app.tree_track.selection()
-        if not sel:
+        """ 將訂單追蹤區的資料退回至『銷售輸入』；多選時須為同一買家與平台，合併成一張購物車 """
+        order_ids = RecallManager._selected_ids(app.tree_track)
+        if not order_ids:
             messagebox.showwarning("提示", "請先選擇要退回修改的訂單項目")
             return
-            
-        item = app.tree_track.item(sel[0])
-        order_id = str(item['values'][0]).replace("'", "").strip()
+        if len(order_ids) > 1 and not messagebox.askyesno(
+                "多筆退回", f"將 {len(order_ids)} 筆訂單合併退回銷售輸入，送出後成為同一張訂單，是否繼續？"):
+            return
 
         # 1. 檢查目標頁面是否有資料
         if app.cart_data:
@@ -25,28 +31,28 @@ class RecallManager:
                 return
 
         try:
+            import oms_core
+            # 銷售輸入分頁為延遲建立，填回購物車前先確保介面存在
+            app.ensure_tab_built('tab_sales')
+
             # 2. 讀取所需資料
             with pd.ExcelFile(app.FILE_NAME) as xls:
-                df_track = pd.read_excel(xls, sheet_name='訂單追蹤')
-                df_prods = pd.read_excel(xls, sheet_name='商品資料')
-            
-            # 格式化編號
-            df_track['訂單編號'] = df_track['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True).str.strip()
-            
-            mask = df_track['訂單編號'] == order_id
-            target_rows = df_track[mask].copy()
-            if target_rows.empty: 
+                df_track = oms_core.normalize_order_ids(pd.read_excel(xls, sheet_name=app.SHEET_TRACKING))
+                df_prods = pd.read_excel(xls, sheet_name=app.SHEET_PRODUCTS)
+
+            # 3. 移出追蹤表，庫存依商品彙總後一次補回
+            df_track_new, df_prods, target_rows, restored, missing = oms_core.recall_orders(df_track, df_prods, order_ids)
+            if target_rows.empty:
+                messagebox.showwarning("提示", "找不到選取的訂單，請重新整理列表")
                 return
+            order_ids = [o for o in order_ids if o not in missing]
 
-            # --- 3. 庫存補償邏輯 ---
-            restored_log = []
-            for _, row in target_rows.iterrows():
-                p_name = row['商品名稱']
-                qty = int(row['數量'])
-                p_idx = df_prods[df_prods['商品名稱'] == p_name].index
-                if not p_idx.empty:
-                    df_prods.at[p_idx[0], '目前庫存'] += qty
-                    restored_log.append(f"{p_name}(+{qty})")
+            # 多筆合併成一張新訂單：買家與平台必須相同，否則會被改成同一位買家的訂單
+            headers = [app._get_full_order_info(target_rows, o) for o in order_ids]
+            buyers = {(str(h.get('買家名稱', '')).strip(), str(h.get('交易平台', '')).strip()) for h in headers}
+            if len(buyers) > 1:
+                messagebox.showwarning("提示", "選取的訂單來自不同買家或平台，無法合併成同一張訂單，請分開退回")
+                return
 
             # --- 4. 重新填充主程式購物車與介面 ---
             app.cart_data = []
@@ -67,7 +73,7 @@ class RecallManager:
                 app.tree.insert("", "end", values=(sku if sku else "--", row['商品名稱'], int(qty), float(s_price), float(s_price * qty)))
 
             # --- 5. 帶回買家與平台資訊 ---
-            header_info = app._get_full_order_info(df_track, order_id)
+            header_info = headers[0]
             app.var_enable_cust.set(True)
             app.toggle_cust_info() 
             app.var_cust_name.set(header_info.get('買家名稱', ''))
@@ -75,46 +81,50 @@ class RecallManager:
             app.var_ship_method.set(header_info.get('寄送方式', ''))
             app.var_platform.set(header_info.get('交易平台', '蝦皮購物'))
 
-            # --- 6. 存檔並移除追蹤紀錄 ---
-            df_track_new = df_track[~mask]
-            if app._universal_save({'訂單追蹤': df_track_new, '商品資料': df_prods}):
+            # --- 6. 追蹤表與商品庫存一次存檔 ---
+            if app._universal_save({app.SHEET_TRACKING: df_track_new, app.SHEET_PRODUCTS: df_prods}):
                 app.products_df = df_prods
                 app.update_sales_prod_list()
                 app.load_tracking_data()
 
-                # 跳轉分頁 (假設銷售輸入在 index 3)
-                app.root.nametowidget(app.root.winfo_children()[0]).select(3) 
+                app.tab_control.select(app.tab_sales)
                 app.update_totals()
-                messagebox.showinfo("成功", f"訂單 {order_id} 已退回修改並重填回庫存。")
+                print(f"system: recalled orders {order_ids}, restock {dict(restored)}")
+                messagebox.showinfo("成功", f"訂單 {'、'.join(order_ids)} 已退回修改並重填回庫存。")
 
         except Exception as e:
             messagebox.showerror("撤回失敗", f"錯誤: {e}")
 
     @staticmethod
     def recall_purchase_order(app):
-        """ 將進貨追蹤區的資料退回至『進貨管理』 """
-        sel = app.tree_pur_track.selection()
-        if not sel:
+        """ 將進貨追蹤區的資料退回至『進貨管理』；多選時須為同一供應商 """
+        pur_ids = RecallManager._selected_ids(app.tree_pur_track)
+        if not pur_ids:
             messagebox.showwarning("提示", "請先選擇要退回的進貨單")
             return
-            
-        item = app.tree_pur_track.item(sel[0])
-        pur_id = str(item['values'][0]).replace("'", "").strip()
 
         if app.pur_cart_data:
             if not messagebox.askyesno("警告", "採購清單已有資料，抓回將會覆蓋，是否繼續？"):
                 return
 
         try:
-            with pd.ExcelFile(app.FILE_NAME) as xls:
-                df_pt = pd.read_excel(xls, sheet_name='進貨追蹤')
-                df_hist = pd.read_excel(xls, sheet_name='進貨紀錄')
+            import oms_core
+            app.ensure_tab_built('tab_purchase')
 
-            df_pt['進貨單號'] = df_pt['進貨單號'].astype(str).str.replace("'", "").str.strip()
-            mask = df_pt['進貨單號'] == pur_id
-            target_rows = df_pt[mask].copy()
+            with pd.ExcelFile(app.FILE_NAME) as xls:
+                df_pt = pd.read_excel(xls, sheet_name=app.SHEET_PUR_TRACKING)
+                df_hist = pd.read_excel(xls, sheet_name=app.SHEET_PURCHASES)
 
+            # 追蹤與歷史紀錄一起移除 (因為還沒入庫，這算撤銷下單)
+            df_pt_new, df_hist_new, target_rows, missing = oms_core.recall_purchases(df_pt, df_hist, pur_ids)
             if target_rows.empty: 
+                messagebox.showwarning("提示", "找不到選取的進貨單，請重新整理列表")
+                return
+            pur_ids = [p for p in pur_ids if p not in missing]
+
+            suppliers = target_rows['供應商'].fillna("").astype(str).str.strip().unique()
+            if len(suppliers) > 1:
+                messagebox.showwarning("提示", f"選取的進貨單來自不同供應商 ({'、'.join(suppliers)})，無法合併成同一張採購單")
                 return
 
             # --- 重新填充採購清單 ---
@@ -133,17 +143,12 @@ class RecallManager:
                 app.tree_pur_cart.insert("", "end", values=(row['商品名稱'], qty, cost, tax, cost * qty))
 
             app.var_pur_supplier.set(target_rows.iloc[0]['供應商'])
-            
-            # --- 移除追蹤與歷史紀錄 (因為還沒入庫，這算撤銷下單) ---
-            df_pt_new = df_pt[~mask]
-            df_hist['tmp_id'] = df_hist['進貨單號'].astype(str).str.replace("'", "").str.strip()
-            df_hist_new = df_hist[df_hist['tmp_id'] != pur_id].drop(columns=['tmp_id'])
-
-            if app._universal_save({'進貨追蹤': df_pt_new, '進貨紀錄': df_hist_new}):
-                app.root.nametowidget(app.root.winfo_children()[0]).select(0) # 跳轉到進貨
+
+            if app._universal_save({app.SHEET_PUR_TRACKING: df_pt_new, app.SHEET_PURCHASES: df_hist_new}):
+                app.tab_control.select(app.tab_purchase)
                 app.update_pur_cart_total()
                 app.load_purchase_tracking()
-                messagebox.showinfo("成功", f"進貨單 {pur_id} 已退回編輯頁面。")
+                messagebox.showinfo("成功", f"進貨單 {'、'.join(pur_ids)} 已退回編輯頁面。")
 
         except Exception as e:
-            messagebox.showerror("撤回失敗", f"錯誤: {e}")
\ No newline at end of file
+            messagebox.showerror("撤回失敗", f"錯誤: {e}")
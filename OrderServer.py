@@ -0,0 +1,284 @@
+"""
+區網訂單伺服器 (無介面模式) 與連線用戶端
+一台電腦執行 `python OrderServer.py --host 0.0.0.0` 擁有活頁簿，其他工作站 (打包站、接單電腦)
+以 `python main.py --server http://主機:8765` 或環境變數 OMS_SERVER 啟動，核心操作改由伺服器處理。
+
+API (JSON)：
+    GET  /api/health                         狀態與寫入統計
+    GET  /api/products?q=關鍵字&limit=50      商品搜尋
+    GET  /api/stock?name=商品名稱 (或 sku=)   庫存查詢
+    GET  /api/sheet/<分頁名稱>                整個分頁 (pandas split 格式)
+    POST /api/orders                         送出訂單 (格式見 oms_core.store.OrderStore.submit_order)
+    POST /api/orders/<編號>/complete          訂單結案
+    POST /api/orders/<編號>/return            整筆退貨 {"reason": "..."}
+    POST /api/purchases/<單號>/inbound        進貨整筆入庫
+
+設定 OMS_TOKEN (或 --token) 後，請求需帶 X-OMS-Token 標頭。
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+DEFAULT_PORT = 8765
+MAX_BODY = 5 * 1024 * 1024
+CLIENT_TIMEOUT = 60
+
+
+def _frame_to_json(df):
+    return json.loads(df.to_json(orient="split", force_ascii=False, date_format="iso", index=False))
+
+
+class OmsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"        # 保持連線，用戶端可重複使用同一條連線
+    server_version = "ShopeeOMS/1.0"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # --- 回應 ---
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        if token and self.headers.get("X-OMS-Token") != token:
+            self._send(401, {"error": "unauthorized"})
+            return False
+        return True
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.close_connection = True
+            raise ValueError("request body too large")
+        return json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+
+    def _dispatch(self, method):
+        from oms_core import OrderNotFound
+        t0 = time.perf_counter()
+        try:
+            body = self._read_json() if method == "POST" else {}   # 先讀完本文，保持連線可重複使用
+            if not self._authorized():
+                return
+            url = urlsplit(self.path)
+            parts = [unquote(p) for p in url.path.strip("/").split("/")]
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, payload = self._route(method, parts, query, body)
+            self._send(status, payload)
+        except OrderNotFound as e:
+            self._send(404, {"error": str(e)})
+        except (ValueError, KeyError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            print(f"system: api {method} {self.path} failed: {e}")
+            self._send(500, {"error": str(e)})
+        finally:
+            self.server.record(method, time.perf_counter() - t0)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # --- 路由 ---
+    def _route(self, method, parts, query, body):
+        store = self.server.store
+        if parts[:1] != ["api"]:
+            return 404, {"error": "not found"}
+        route = parts[1:]
+        if method == "GET":
+            if route == ["health"]:
+                return 200, {"status": "ok", "store": store.stats, "requests": self.server.stats()}
+            if route == ["products"]:
+                df = store.search_products(query.get("q", ""), int(query.get("limit", 50)))
+                return 200, _frame_to_json(df)
+            if route == ["stock"]:
+                return 200, store.stock(name=query.get("name"), sku=query.get("sku"))
+            if len(route) == 2 and route[0] == "sheet":
+                return 200, _frame_to_json(store.sheet(route[1]))
+        elif method == "POST":
+            if route == ["orders"]:
+                return 201, store.submit_order(body)
+            if len(route) == 3 and route[0] == "orders" and route[2] == "complete":
+                return 200, store.complete_order(route[1])
+            if len(route) == 3 and route[0] == "orders" and route[2] == "return":
+                return 200, store.return_order(route[1], body.get("reason", ""))
+            if len(route) == 3 and route[0] == "purchases" and route[2] == "inbound":
+                return 200, store.confirm_inbound(route[1])
+        return 404, {"error": "not found"}
+
+
+class OmsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, store, host="127.0.0.1", port=DEFAULT_PORT, token=None, verbose=False):
+        super().__init__((host, port), OmsRequestHandler)
+        self.store = store
+        self.token = token
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._stats = {}      # 方法 -> [次數, 總秒數]
+
+    def record(self, method, seconds):
+        with self._lock:
+            s = self._stats.setdefault(method, [0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {m: {"count": c, "avg_ms": round(t / c * 1000, 1)} for m, (c, t) in self._stats.items()}
+
+
+def start_server(path, host="127.0.0.1", port=DEFAULT_PORT, token=None, flush_delay=0.0, verbose=False):
+    """ 在背景執行緒啟動伺服器，回傳 (server, store)；結束時呼叫 server.shutdown() 與 store.close() """
+    from oms_core.store import OrderStore
+    store = OrderStore(path, flush_delay=flush_delay)
+    server = OmsServer(store, host, port, token, verbose)
+    threading.Thread(target=server.serve_forever, name="oms-http", daemon=True).start()
+    return server, store
+
+
+# ================= 用戶端 =================
+class OmsClientError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class OmsClient:
+    """
+    執行緒安全的 API 用戶端：每個執行緒保留一條持續連線 (keep-alive)，不必每次重新握手。
+    閒置連線被伺服器關閉時：GET 自動重試；POST 只在請求尚未送出時重試，避免重複下單。
+    """
+
+    def __init__(self, base_url, token=None, timeout=CLIENT_TIMEOUT):
+        url = urlsplit(base_url if "://" in base_url else "http://" + base_url)
+        self.host = url.hostname
+        self.port = url.port or DEFAULT_PORT
+        self.token = token if token is not None else os.environ.get("OMS_TOKEN")
+        self.timeout = timeout
+        self.base_url = f"http://{self.host}:{self.port}"
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["X-OMS-Token"] = self.token
+        for attempt in (1, 2):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+            except (ConnectionError, http.client.HTTPException, OSError):
+                self._drop()
+                if attempt == 2:
+                    raise
+                continue
+            try:
+                resp = conn.getresponse()
+                data = resp.read()
+            except (ConnectionError, http.client.HTTPException, OSError):
+                self._drop()
+                if attempt == 2 or method != "GET":
+                    raise
+                continue
+            if resp.getheader("Connection", "").lower() == "close":
+                self._drop()
+            result = json.loads(data.decode("utf-8")) if data else {}
+            if resp.status >= 400:
+                raise OmsClientError(resp.status, result.get("error", f"HTTP {resp.status}"))
+            return result
+
+    def close(self):
+        self._drop()
+
+    # --- API ---
+    def health(self):
+        return self.request("GET", "/api/health")
+
+    def search_products(self, keyword="", limit=50):
+        return self.request("GET", f"/api/products?q={quote(keyword)}&limit={int(limit)}")
+
+    def stock(self, name=None, sku=None):
+        return self.request("GET", f"/api/stock?sku={quote(str(sku))}" if sku else f"/api/stock?name={quote(str(name))}")
+
+    def sheet(self, name):
+        """ 回傳 pandas DataFrame """
+        import pandas as pd
+        data = self.request("GET", f"/api/sheet/{quote(name)}")
+        return pd.read_json(StringIO(json.dumps(data, ensure_ascii=False)), orient="split",
+                            dtype=False, convert_dates=False)
+
+    def submit_order(self, order):
+        return self.request("POST", "/api/orders", order)
+
+    def complete_order(self, order_id):
+        return self.request("POST", f"/api/orders/{quote(str(order_id))}/complete", {})
+
+    def return_order(self, order_id, reason=""):
+        return self.request("POST", f"/api/orders/{quote(str(order_id))}/return", {"reason": reason})
+
+    def confirm_inbound(self, pur_id):
+        return self.request("POST", f"/api/purchases/{quote(str(pur_id))}/inbound", {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="蝦皮進銷存 區網訂單伺服器")
+    parser.add_argument("--file", default=None, help="活頁簿路徑 (預設為程式目錄下的 sales_data.xlsx)")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽位址；區網使用請設為 0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", default=os.environ.get("OMS_TOKEN"), help="存取權杖 (X-OMS-Token)")
+    parser.add_argument("--flush-delay", type=float, default=0.0, help="寫檔前等待秒數，合併更多請求")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    path = args.file or os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "sales_data.xlsx")
+    if not os.path.exists(path):
+        print(f"system: workbook not found: {path}")
+        return 1
+    if args.host not in ("127.0.0.1", "localhost") and not args.token:
+        print("system: warning - listening on the network without --token")
+    server, store = start_server(path, args.host, args.port, args.token, args.flush_delay, args.verbose)
+    print(f"system: order server listening on http://{args.host}:{args.port} ({path})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        store.close()
+        print(f"system: order server stopped, store stats: {store.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import math
 import os
 from datetime import datetime
 
@@ -6,6 +5,8 @@ import pandas as pd
 import tkinter as tk
 from tkinter import messagebox, ttk
 
+from oms_core import procurement_report
+
 
 class ProcurementManager:
     """
@@ -16,7 +17,7 @@ class ProcurementManager:
     @staticmethod
     def generate_report(app):
         """
-        核心運算：根據銷售速率、前置時間與安全權重生成採購建議清單。
+        根據銷售速率、前置時間與安全權重生成採購建議清單 (運算見 oms_core.procurement)。
         """
         if not hasattr(app, "tree_procure"):
             return
@@ -33,84 +34,27 @@ class ProcurementManager:
                 df_sales = pd.read_excel(xls, sheet_name="銷售紀錄")
                 df_prods = pd.read_excel(xls, sheet_name="商品資料")
 
-            if df_prods.empty:
-                return
-
-            # 資料清洗：將空值填補並轉換為正確型別
-            df_prods["目前庫存"] = pd.to_numeric(df_prods["目前庫存"], errors="coerce").fillna(0)
-            df_prods["安全庫存"] = pd.to_numeric(df_prods["安全庫存"], errors="coerce").fillna(0)
-            df_sales["數量"] = pd.to_numeric(df_sales["數量"], errors="coerce").fillna(0)
-            df_sales["日期"] = pd.to_datetime(df_sales["日期"], errors="coerce")
-
-            now = pd.Timestamp.now()
-            # 建立商品第一筆成交日期地圖 (作為銷售速率的分母參考)
-            first_sale_map = df_sales.groupby("商品名稱")["日期"].min().to_dict()
-            qty_sum = df_sales.groupby("商品名稱")["數量"].sum()
-
-            # 讀取介面配置參數
-            v_threshold = app.var_filter_velocity.get()
-            cover_days = app.var_days_to_cover.get()
-            s_multiplier = app.var_safety_multiplier.get()
-
-            for _, row in df_prods.iterrows():
-                p_name = str(row["商品名稱"])
-                curr_stock = float(row["目前庫存"])
-                base_safety = float(row["安全庫存"])
-
-                # A. 計算銷售速率 (Velocity)
-                st_date = pd.to_datetime(row.get("初始上架時間"), errors="coerce")
-                if pd.isna(st_date):
-                    st_date = first_sale_map.get(p_name, now)
-                
-                days_diff = max((now - st_date).days, 1)
-                velocity = float(qty_sum.get(p_name, 0)) / days_diff
-
-                # 執行嚴格速率過濾 (優先級最高)
-                if velocity < v_threshold:
-                    continue
-
-                # B. 計算動態補貨點 (Reorder Point, ROP)
-                # 補貨點 = (日均銷量 * 備貨天數) + (安全庫存 * 加權係數)
-                reorder_point = (velocity * cover_days) + (base_safety * s_multiplier)
-
-                # C. 判定缺貨狀態與視覺標籤
-                is_needed = False
-                status = ""
-                row_tag = ""
-
-                if curr_stock < 0:
-                    status = "⚠️ 帳面超賣"
-                    row_tag = "urgent"
-                    is_needed = True
-                elif curr_stock == 0:
-                    status = "🚫 缺貨中"
-                    row_tag = "urgent"
-                    is_needed = True
-                elif curr_stock <= reorder_point:
-                    status = "🔴 需補貨"
-                    row_tag = "urgent"
-                    is_needed = True
-                elif curr_stock <= (base_safety * s_multiplier) and base_safety > 0:
-                    status = "🟡 庫存偏低"
-                    row_tag = "warning"
-                    is_needed = True
-
-                # D. 寫入清單
-                if is_needed:
-                    suggest_qty = math.ceil(max(reorder_point - curr_stock, 0))
-                    app.tree_procure.insert(
-                        "",
-                        "end",
-                        values=(
-                            p_name,
-                            int(curr_stock),
-                            round(reorder_point, 1),
-                            f"{round(velocity, 2)}件/日",
-                            status,
-                            int(suggest_qty),
-                        ),
-                        tags=(row_tag,),
-                    )
+            # 運算交給 oms_core (與命令列工具共用)，這裡只讀取介面參數並填入清單
+            report = procurement_report(
+                df_sales, df_prods,
+                velocity_threshold=app.var_filter_velocity.get(),
+                cover_days=app.var_days_to_cover.get(),
+                safety_multiplier=app.var_safety_multiplier.get(),
+            )
+            for r in report:
+                app.tree_procure.insert(
+                    "",
+                    "end",
+                    values=(
+                        r["name"],
+                        r["stock"],
+                        r["reorder_point"],
+                        f"{round(r['velocity'], 2)}件/日",
+                        r["status"],
+                        r["suggest_qty"],
+                    ),
+                    tags=(r["tag"],),
+                )
 
         except Exception as e:
             print(f"Procurement analysis error: {e}")
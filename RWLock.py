@@ -0,0 +1,116 @@
+"""
+讀寫鎖 (取代全域 RLock)
+1. 讀取可以多個執行緒同時進行，寫入 (存檔) 才獨佔。
+2. 寫入優先：有寫入在等待時，新的讀取先排隊，避免存檔被連續讀取餓死。
+3. 同一執行緒可重入：寫入中可再取得寫入或讀取；讀取中可再取得讀取。
+   讀取中升級為寫入同一時間只允許一個執行緒 (兩個讀取者同時升級會互相等待對方釋放)，
+   第二個升級者會收到 RuntimeError，應先釋放讀取鎖再取得寫入鎖。
+4. 記錄每次等待時間，超過 SLOW_WAIT 秒會印出提示，stats() 可查詢累計數據。
+`with lock:` 等同寫入鎖，與原本的 RLock 用法相容；讀取使用 `with lock.read():`。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+SLOW_WAIT = 0.2   # 等待超過此秒數就記錄
+
+
+class ReadWriteLock:
+    def __init__(self, name="file"):
+        self.name = name
+        self._cond = threading.Condition(threading.Lock())
+        self._writer = None          # 持有寫入鎖的執行緒
+        self._write_depth = 0
+        self._readers = {}           # 執行緒 -> 讀取重入層數
+        self._waiting_writers = 0
+        self._upgrader = None        # 正在由讀取升級為寫入的執行緒
+        self._stats = {"read": [0, 0.0, 0.0], "write": [0, 0.0, 0.0]}   # 次數, 總等待, 最長等待
+
+    # --- 讀取 ---
+    def acquire_read(self):
+        me = threading.get_ident()
+        t0 = time.perf_counter()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers[me] = 1
+        self._record("read", time.perf_counter() - t0)
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            depth = self._readers[me] - 1
+            if depth:
+                self._readers[me] = depth
+            else:
+                del self._readers[me]
+                # 最後一個讀取者離開，或有升級中的寫入者在等其他讀取者時喚醒
+                if not self._readers or self._upgrader is not None:
+                    self._cond.notify_all()
+
+    # --- 寫入 ---
+    def acquire_write(self):
+        me = threading.get_ident()
+        t0 = time.perf_counter()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            upgrading = me in self._readers
+            if upgrading:
+                if self._upgrader is not None:
+                    raise RuntimeError(f"{self.name} lock: 另一個執行緒正在由讀取升級為寫入，無法同時升級")
+                self._upgrader = me
+            self._waiting_writers += 1
+            try:
+                # 自己持有的讀取鎖不算 (讀取中升級為寫入)
+                while self._writer is not None or any(t != me for t in self._readers):
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+                if upgrading:
+                    self._upgrader = None
+            self._writer = me
+            self._write_depth = 1
+        self._record("write", time.perf_counter() - t0)
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire_write()
+        return self
+
+    def __exit__(self, *exc):
+        self.release_write()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    # --- 等待時間統計 ---
+    def _record(self, kind, waited):
+        with self._cond:
+            s = self._stats[kind]
+            s[0] += 1
+            s[1] += waited
+            s[2] = max(s[2], waited)
+        if waited >= SLOW_WAIT:
+            print(f"system: {self.name} {kind} lock waited {waited * 1000:.0f} ms")
+
+    def stats(self):
+        """ 回傳 {"read"/"write": {"count", "total_ms", "max_ms"}} """
+        with self._cond:
+            return {k: {"count": c, "total_ms": round(t * 1000, 1), "max_ms": round(m * 1000, 1)}
+                    for k, (c, t, m) in self._stats.items()}
@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import pandas as pd
-from decimal import Decimal
+
+from oms_core import OrderNotFound, allocate_landed_cost, shipment_orders
 
 class ShippingDistributor(tk.Toplevel):
     def __init__(self, parent, app_instance):
@@ -10,14 +11,14 @@ class ShippingDistributor(tk.Toplevel):
         
         # 1. 初始化視窗基本設定
         self.title("⚖️ 整單費用自動分攤")
-        self.geometry("450x400")
+        self.geometry("450x460")
         self.resizable(False, False)
         
         # 讓視窗出現在螢幕中央
         self.transient(parent) 
         self.grab_set()
 
-        # 2. 取得選中的單號邏輯
+        # 2. 取得選中的單號邏輯 (可複選多張進貨單：同一批集運出貨一起分攤)
         try:
             sel = self.app.tree_pur_track.selection()
             if not sel:
@@ -25,9 +26,9 @@ class ShippingDistributor(tk.Toplevel):
                 self.destroy()
                 return
                 
-            item = self.app.tree_pur_track.item(sel[0])
             # 確保抓到的是『進貨單號』
-            self.target_pur_id = str(item['values'][0]).replace("'", "").strip()
+            self.selected_pur_ids = list(dict.fromkeys(
+                str(self.app.tree_pur_track.item(i)['values'][0]).replace("'", "").strip() for i in sel))
             
             # 從主程式抓取正確的分頁名稱常數
             self.FILE_NAME = getattr(self.app, 'FILE_NAME', 'sales_data.xlsx')
@@ -35,6 +36,11 @@ class ShippingDistributor(tk.Toplevel):
             self.SHEET_HIST = getattr(self.app, 'SHEET_PURCHASES', '進貨紀錄')
             self.SHEET_PROD = getattr(self.app, 'SHEET_PRODUCTS', '商品資料')
 
+            # 共用同一個物流單號的進貨單 (集運倉併箱)，勾選後一併分攤
+            df_track = pd.read_excel(self.FILE_NAME, sheet_name=self.SHEET_TRACK)
+            self.shipment_pur_ids = shipment_orders(df_track, self.selected_pur_ids)
+            self.var_same_shipment = tk.BooleanVar(value=False)
+
             # 3. 執行 UI 繪製
             self._setup_ui()
             
@@ -51,8 +57,15 @@ class ShippingDistributor(tk.Toplevel):
         # 顯示單號
         header_f = ttk.Frame(main_frame)
         header_f.pack(fill="x", pady=(0, 15))
-        ttk.Label(header_f, text="正在處理單號：", font=("", 10)).pack(side="left")
-        ttk.Label(header_f, text=self.target_pur_id, font=("Arial", 11, "bold"), foreground="blue").pack(side="left")
+        ttk.Label(header_f, text="正在處理單號：", font=("", 10)).pack(side="left", anchor="n")
+        self.lbl_pur_ids = ttk.Label(header_f, font=("Arial", 11, "bold"), foreground="blue", wraplength=300)
+        self.lbl_pur_ids.pack(side="left")
+        self._refresh_targets()
+
+        extra = len(self.shipment_pur_ids) - len(set(self.selected_pur_ids))
+        if extra > 0:
+            ttk.Checkbutton(main_frame, text=f"一併分攤同物流單號的其他 {extra} 張進貨單 (集運併箱)",
+                            variable=self.var_same_shipment, command=self._refresh_targets).pack(anchor="w", pady=(0, 5))
 
         # 輸入區域 (用 LabelFrame 包起來更清楚)
         input_box = ttk.LabelFrame(main_frame, text="請輸入整箱貨物總額", padding=15)
@@ -75,7 +88,7 @@ class ShippingDistributor(tk.Toplevel):
         ttk.Entry(row2, textvariable=self.var_total_tax).pack(side="left", fill="x", expand=True)
 
         # 說明
-        ttk.Label(main_frame, text="* 系統將讀取商品資料庫中的「單位權重」自動分攤", 
+        ttk.Label(main_frame, text="* 系統將讀取商品資料庫中的「單位權重」，所有單號的品項一起分攤", 
                   foreground="gray", font=("微軟正黑體", 9)).pack(pady=10)
 
         # 按鈕區
@@ -87,78 +100,32 @@ class ShippingDistributor(tk.Toplevel):
         
         ttk.Button(btn_f, text="取消", command=self.destroy).pack(fill="x", pady=5)
 
+    @property
+    def target_pur_ids(self):
+        return self.shipment_pur_ids if self.var_same_shipment.get() else self.selected_pur_ids
+
+    def _refresh_targets(self):
+        self.lbl_pur_ids.config(text="、".join(self.target_pur_ids))
+
     def calculate_and_save(self):
-        """ 執行權重分攤計算法 """
+        """ 執行權重分攤計算法 (運算見 oms_core.purchasing.allocate_landed_cost)，所有單號一次存檔 """
         try:
-            # 使用主程式的 dec_round 工具確保精度
-            t_ship = Decimal(str(self.var_total_ship.get()))
-            t_tax = Decimal(str(self.var_total_tax.get()))
-            
             with pd.ExcelFile(self.FILE_NAME) as xls:
                 df_track = pd.read_excel(xls, sheet_name=self.SHEET_TRACK)
                 df_hist = pd.read_excel(xls, sheet_name=self.SHEET_HIST)
                 df_prods = pd.read_excel(xls, sheet_name=self.SHEET_PROD)
 
-             # --- [核心修正：解決型別衝突] ---
-            # 強制將運費與稅金欄位轉為 float 型態，確保能存入小數點
-            target_cols = ['分攤運費', '海關稅金']
-            for df in [df_track, df_hist]:
-                for col in target_cols:
-                    if col in df.columns:
-                        # 先轉為 numeric (處理空值)，再強制轉為 float
-                        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float)
-
-            # 確保權重欄位存在
-            df_prods['單位權重'] = pd.to_numeric(df_prods.get('單位權重', 1.0), errors='coerce').fillna(1.0)
-            weight_map = df_prods.set_index('商品名稱')['單位權重'].to_dict()
-
-            # 篩選
-            df_track['tmp_id'] = df_track['進貨單號'].astype(str).str.replace("'", "").str.strip()
-            mask = df_track['tmp_id'] == self.target_pur_id
-            
-            if df_track[mask].empty:
-                messagebox.showerror("錯誤", "找不到該訂單項目，請重新整理列表")
+            try:
+                df_track, df_hist = allocate_landed_cost(df_track, df_hist, df_prods, self.target_pur_ids,
+                                                         self.var_total_ship.get(), self.var_total_tax.get())
+            except OrderNotFound as e:
+                messagebox.showerror("錯誤", str(e))
                 return
 
-            # 計算總重
-            total_weight = Decimal("0.0")
-            for _, row in df_track[mask].iterrows():
-                q = Decimal(str(row.get('數量', 1)))
-                w = Decimal(str(weight_map.get(str(row['商品名稱']).strip(), 1.0)))
-                total_weight += (q * w)
-
-            if total_weight <= 0: 
-                total_weight = Decimal("1.0")
-
-            # 分攤循環
-            for idx in df_track[mask].index:
-                p_name = str(df_track.at[idx, '商品名稱']).strip()
-                q = Decimal(str(df_track.at[idx, '數量']))
-                w = Decimal(str(weight_map.get(p_name, 1.0)))
-                
-                ratio = (q * w) / total_weight
-                # 呼叫主程式的高精度四捨五入
-                alloc_s = self.app.dec_round(t_ship * ratio)
-                alloc_t = self.app.dec_round(t_tax * ratio)
-
-                df_track.at[idx, '分攤運費'] = float(alloc_s)
-                df_track.at[idx, '海關稅金'] = float(alloc_t)
-                
-                # 同步歷史表
-                df_hist['tmp_id'] = df_hist['進貨單號'].astype(str).str.replace("'", "").str.strip()
-                h_mask = (df_hist['tmp_id'] == self.target_pur_id) & (df_hist['商品名稱'].astype(str).str.strip() == p_name)
-                if not df_hist[h_mask].empty:
-                    df_hist.loc[h_mask, '分攤運費'] = float(alloc_s)
-                    df_hist.loc[h_mask, '海關稅金'] = float(alloc_t)
-
-            # 存檔
-            df_track.drop(columns=['tmp_id'], inplace=True, errors='ignore')
-            df_hist.drop(columns=['tmp_id'], inplace=True, errors='ignore')
-            
             if self.app._universal_save({self.SHEET_TRACK: df_track, self.SHEET_HIST: df_hist}):
-                messagebox.showinfo("成功", "運費與稅金分攤完成！")
+                messagebox.showinfo("成功", f"運費與稅金分攤完成！({len(self.target_pur_ids)} 張進貨單)")
                 self.app.load_purchase_tracking()
                 self.destroy()
 
         except Exception as e:
-            messagebox.showerror("計算失敗", f"請檢查輸入數值是否正確: {e}")
\ No newline at end of file
+            messagebox.showerror("計算失敗", f"請檢查輸入數值是否正確: {e}")
@@ -0,0 +1,188 @@
+"""
+出貨單 HTML 模板引擎
+每種尺寸 (A4 / 10x15 標籤) 的版面只編譯一次：CSS、文件頭尾與頁面骨架
+在第一次使用時就把尺寸參數套好並快取，之後每筆訂單只填入自己的欄位。
+直接執行本檔可量測 1 / 100 / 1000 項商品的單張渲染成本：
+    python ShippingTemplate.py
+"""
+import time
+from datetime import datetime
+
+LAYOUTS = {
+    # size_choice: (每頁項數, 頁高, 頁寬, 列高, @page 尺寸, 頁邊距)
+    "A4": (12, "297mm", "210mm", "1.2cm", "A4", "15mm"),
+    "Label": (8, "150mm", "100mm", "1.0cm", "100mm 150mm", "8mm"),
+}
+FONT_PX = "10px"
+
+_ROW_TEMPLATE = """<tr style="height: {row_height};">
+                <td style="text-align:center;">{sku}</td>
+                <td style="padding-left: 8px;">{name}</td>
+                <td style="text-align:center;">{qty}</td>
+                <td style="text-align:right; padding-right: 8px;">${unit_price:,.0f}</td>
+            </tr>"""
+
+_SUMMARY_TEMPLATE = """<div class="summary-box">
+                <div class="sum-row">
+                    <div class="sum-item"><span class="label">物流運費 ({payer})</span><span class="val">{display_ship}</span></div>
+                    <div class="sum-item"><span class="label">{discount_tag}</span><span class="val">-${discount_amount:,.0f}</span></div>
+                </div>
+                <div class="sum-row" style="border-bottom:none; background:#eee !important;">
+                    <div class="sum-item"><span class="label">商品總額</span><span class="val">${product_total:,.0f}</span></div>
+                    <div class="sum-item" style="background:#ddd !important;">
+                        <span class="label">買家應付總額</span><span class="val" style="font-size: 14px;">${final_paid:,.0f}</span>
+                    </div>
+                </div>
+            </div>"""
+
+_PAGE_TEMPLATE = """
+        <div class="page">
+            <div class="header">
+                <!-- 顯示自定義店名 -->
+                <div style="font-size: 14px; font-weight: bold; text-align: center;">{shop_name}</div>
+                <h3 style="margin:2px 0; font-size: 11px; text-align: center; color: #555;">出貨明細 ({size_choice})</h3>
+                <div style="text-align:right; font-size: 9px;">頁次：{page_idx} / {total_pages}</div>
+            </div>
+
+            <table class="info">
+                <tr><td><b>買家：</b>{buyer}</td><td style="text-align:right;">{date}</td></tr>
+                <tr><td><b>物流：</b>{ship_method}</td><td style="text-align:right;">ID: {order_id}</td></tr>
+            </table>
+            <table class="item-table">
+                <thead><tr><th width="20%">商品編號</th><th width="50%">商品名稱</th><th width="10%">數量</th><th width="20%">單價</th></tr></thead>
+                <tbody>{table_rows}</tbody>
+            </table>
+            {summary_section}
+            <div class="page-footer">-- 感謝您的購買！請錄影拆封保障權益 --</div>
+        </div>"""
+
+_DOCUMENT_TEMPLATE = """<!DOCTYPE html><html>
+    <head><meta charset="UTF-8"><style>
+        * {{ box-sizing: border-box; -webkit-print-color-adjust: exact; }}
+        @page {{ size: {page_size}; margin: 0; }}
+        body {{ font-family: "微軟正黑體", sans-serif; margin: 0; padding: 0; background: #f0f0f0; font-size: {font_px}; }}
+        .page {{ width: {page_width}; height: {page_height}; padding: {padding}; 
+                background: white; margin: 10px auto; display: flex; flex-direction: column; 
+                page-break-after: always; overflow: hidden; }}
+        @media print {{ body {{ background: none; }} .page {{ margin: 0; border: none; }} }}
+        .header {{ border-bottom: 1.5px solid #000; padding-bottom: 3px; margin-bottom: 8px; }}
+        .info {{ width: 100%; margin-bottom: 8px; font-size: {font_px}; }}
+        .item-table {{ width: 100%; border-collapse: collapse; table-layout: fixed; }}
+        .item-table th, .item-table td {{ border: 1px solid #000; font-size: {font_px}; padding: 4px 2px; }}
+        .item-table th {{ background-color: #eee !important; }}
+        .summary-box {{ border: 1.5px solid #000; margin-top: 5px; }}
+        .sum-row {{ display: flex; border-bottom: 1px solid #000; }}
+        .sum-item {{ flex: 1; padding: 4px; border-right: 1px solid #000; }}
+        .sum-item:last-child {{ border-right: none; }}
+        .label {{ font-size: 9px; display: block; font-weight: bold; }}
+        .val {{ font-size: {font_px}; font-weight: bold; }}
+        .page-footer {{ margin-top: auto; text-align: center; font-size: 9px; padding-top: 5px; }}
+    </style></head>
+    <body onload="window.print()">{pages}</body></html>"""
+
+
+class CompiledLayout:
+    """ 已套用尺寸參數的版面 (CSS 與文件頭尾為靜態字串，可重複使用) """
+
+    def __init__(self, size_choice):
+        limit, page_height, page_width, row_height, page_size, padding = LAYOUTS[size_choice]
+        self.size_choice = size_choice
+        self.limit = limit
+        # 文件頭尾：CSS 只組一次，之後直接拼接頁面
+        marker = "\x00"
+        doc = _DOCUMENT_TEMPLATE.format(page_size=page_size, font_px=FONT_PX, page_width=page_width,
+                                        page_height=page_height, padding=padding, pages=marker)
+        self.head, self.tail = doc.split(marker)
+        # 固定欄位先代入，剩下的才是每筆訂單要填的欄位
+        self.row = _ROW_TEMPLATE.replace("{row_height}", row_height)
+        self.page = _PAGE_TEMPLATE.replace("{size_choice}", size_choice)
+
+    def render_pages(self, info, items, order_id=None):
+        """ 產生單一訂單的所有頁面 (回傳 HTML 片段清單，由呼叫端一次 join) """
+        shop_name = info.get('shop_name', '商家出貨單') # 取得店名
+        order_id = order_id or info.get('order_id') or datetime.now().strftime("%Y%m%d%H%M%S")
+
+        # 計算金額
+        product_total = sum(i['total_sales'] for i in items)
+        ship_fee = info.get('ship_fee', 0)
+        payer = info.get('payer', "買家付")
+        discount_amount = info.get('discount_amount', 0)
+        discount_tag = info.get('discount_tag', "折扣")
+
+        if payer == "買家付":
+            final_paid = product_total + ship_fee - discount_amount
+            display_ship = f"${ship_fee:,.0f}"
+        else:
+            final_paid = product_total - discount_amount
+            display_ship = "免運 (賣家付)"
+
+        limit = self.limit
+        chunks = [items[i:i + limit] for i in range(0, len(items), limit)] or [[]]
+        total_pages = len(chunks)
+        row_fmt = self.row.format
+
+        pages = []
+        for page_idx, chunk in enumerate(chunks, 1):
+            rows = []
+            for item in chunk:
+                sku = item.get('sku', '--')
+                if not sku or str(sku).strip() == "":
+                    sku = "--"
+                rows.append(row_fmt(sku=sku, name=item['name'], qty=item['qty'], unit_price=item['unit_price']))
+
+            summary_section = ""
+            if page_idx == total_pages:
+                summary_section = _SUMMARY_TEMPLATE.format(
+                    payer=payer, display_ship=display_ship, discount_tag=discount_tag,
+                    discount_amount=discount_amount, product_total=product_total, final_paid=final_paid)
+
+            pages.append(self.page.format(
+                shop_name=shop_name, page_idx=page_idx, total_pages=total_pages,
+                buyer=info['buyer'], date=info['date'], ship_method=info['ship_method'], order_id=order_id,
+                table_rows="".join(rows), summary_section=summary_section))
+        return pages
+
+    def render_document(self, pages):
+        return self.head + "".join(pages) + self.tail
+
+
+_compiled = {}
+
+
+def get_layout(size_choice):
+    """ 取得 (必要時編譯) 指定尺寸的版面 """
+    layout = _compiled.get(size_choice)
+    if layout is None:
+        layout = _compiled[size_choice] = CompiledLayout(size_choice)
+    return layout
+
+
+def render_note_pages(info, items, size_choice, order_id=None):
+    return get_layout(size_choice).render_pages(info, items, order_id)
+
+
+def render_document(pages, size_choice):
+    return get_layout(size_choice).render_document(pages)
+
+
+def benchmark(sizes=(1, 100, 1000), repeat=50):
+    """ 量測單張出貨單的渲染時間 (不含寫檔)，回傳 {(尺寸, 項數): 毫秒} """
+    info = {"shop_name": "測試商店", "buyer": "測試買家", "date": "2024-01-01",
+            "ship_method": "7-11", "ship_fee": 60, "payer": "買家付",
+            "discount_tag": "優惠折抵", "discount_amount": 10}
+    results = {}
+    for size_choice in LAYOUTS:
+        layout = get_layout(size_choice)
+        for n in sizes:
+            items = [{"sku": f"SKU{i}", "name": f"商品{i}", "qty": 1 + i % 3,
+                      "unit_price": 100.0 + i, "total_sales": (100.0 + i) * (1 + i % 3)} for i in range(n)]
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                layout.render_document(layout.render_pages(info, items, "BENCH"))
+            results[(size_choice, n)] = (time.perf_counter() - t0) / repeat * 1000
+    return results
+
+
+if __name__ == "__main__":
+    for (size_choice, n), ms in benchmark().items():
+        print(f"{size_choice:<6} {n:>5} 項: {ms:8.3f} ms / 張")
@@ -0,0 +1,204 @@
+"""
+本機快照庫 (內容定址、去重複)
+取代只有一份的 sales_data.xlsx.bak：
+1. 每次存檔都記錄一個快照；快照只是一份清單 (分頁 -> 區塊雜湊)。
+2. 分頁依固定列數切成區塊，以 sha256 命名並 zlib 壓縮後存放，
+   內容相同的區塊只存一次：沒變動的分頁 (以及只在尾端新增資料的分頁前段) 不佔空間。
+3. 保留策略：最近 N 次存檔全部保留，之後最近 N 小時每小時一份、最近 N 天每天一份、最近 N 個月每月一份，
+   清理後再回收沒有任何快照引用的區塊。
+4. 可以把任一分頁還原到任一時間點。
+"""
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+
+import pandas as pd
+
+from BackupPackage import table_from_bytes, table_hash, table_to_bytes
+
+SNAPSHOT_CHUNK_ROWS = 2000     # 每個區塊的列數 (新增資料多半在尾端，前段區塊可重複使用)
+KEEP_RECENT = 50               # 最近 50 次存檔全部保留
+KEEP_HOURLY = 48               # 最近 48 小時：每小時保留最後一份
+KEEP_DAILY = 90                # 最近 90 天：每天保留最後一份
+KEEP_MONTHLY = 24              # 最近 24 個月：每月保留最後一份
+ID_FORMAT = "%Y%m%d-%H%M%S-%f"
+PRUNE_INTERVAL = 3600          # 存檔時最多每小時清理一次
+
+
+class SnapshotStore:
+    """
+    目錄結構：
+        objects/ab/abcdef...   zlib 壓縮後的區塊 (檔名為未壓縮內容的 sha256)
+        snaps/<快照ID>.json     快照清單
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.obj_dir = os.path.join(root, "objects")
+        self.snap_dir = os.path.join(root, "snaps")
+        self._last_prune = 0.0
+
+    # --- 區塊 ---
+    def _obj_path(self, digest):
+        return os.path.join(self.obj_dir, digest[:2], digest)
+
+    def _put(self, data):
+        """ 存入一個區塊，回傳 (雜湊, 新寫入的位元組數) """
+        digest = table_hash(data)
+        path = self._obj_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = zlib.compress(data, 6)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(packed)
+        os.replace(tmp, path)
+        return digest, len(packed)
+
+    def _get(self, digest):
+        with open(self._obj_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if table_hash(data) != digest:
+            raise ValueError(f"快照區塊已損毀：{digest[:12]}")
+        return data
+
+    def _put_table(self, df):
+        chunks, written = [], 0
+        for start in range(0, max(len(df), 1), SNAPSHOT_CHUNK_ROWS):
+            digest, n = self._put(table_to_bytes(df.iloc[start:start + SNAPSHOT_CHUNK_ROWS]))
+            chunks.append(digest)
+            written += n
+        return {"rows": len(df), "chunks": chunks}, written
+
+    # --- 快照清單 ---
+    def list_snapshots(self):
+        """ 新到舊回傳快照 ID """
+        if not os.path.isdir(self.snap_dir):
+            return []
+        return sorted((fn[:-5] for fn in os.listdir(self.snap_dir) if fn.endswith(".json")), reverse=True)
+
+    def load_manifest(self, snap_id):
+        with open(os.path.join(self.snap_dir, snap_id + ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def latest(self):
+        """ 回傳 (快照ID, 清單)；沒有快照時回傳 (None, None) """
+        for snap_id in self.list_snapshots():
+            try:
+                return snap_id, self.load_manifest(snap_id)
+            except (OSError, ValueError) as e:
+                print(f"system: skipped unreadable snapshot {snap_id}: {e}")
+        return None, None
+
+    @staticmethod
+    def file_stamp(path):
+        """ 用來判斷活頁簿是否在快照之外被改動 (例如從雲端還原) """
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def snapshot(self, frames, sheet_order, changed=None, workbook_path=None, prev_stamp=None):
+        """
+        記錄一個快照。
+        frames:     {分頁: DataFrame}，至少包含 changed 中的分頁
+        changed:    本次有變動的分頁；None 表示全部重新記錄
+        prev_stamp: 存檔前活頁簿的 file_stamp，與上一個快照不符時改為全部重新記錄
+        回傳 (快照ID, 新寫入位元組數)
+        """
+        _, prev = self.latest()
+        if prev is None or changed is None or prev.get("file_stamp") != prev_stamp:
+            changed = list(frames)
+
+        tables, written = {}, 0
+        for sn in sheet_order:
+            if sn in changed and sn in frames:
+                tables[sn], n = self._put_table(frames[sn])
+                written += n
+            elif prev and sn in prev["tables"]:
+                tables[sn] = prev["tables"][sn]   # 未變動：直接沿用上一個快照的區塊
+
+        now = datetime.now()
+        snap_id = now.strftime(ID_FORMAT)
+        manifest = {
+            "created": now.isoformat(timespec="seconds"),
+            "sheet_order": [sn for sn in sheet_order if sn in tables],
+            "changed": [sn for sn in sheet_order if sn in changed],
+            "tables": tables,
+            "file_stamp": self.file_stamp(workbook_path) if workbook_path and os.path.exists(workbook_path) else None,
+        }
+        os.makedirs(self.snap_dir, exist_ok=True)
+        path = os.path.join(self.snap_dir, snap_id + ".json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        return snap_id, written
+
+    # --- 還原 ---
+    def load_table(self, snap_id, sheet_name):
+        """ 取回某個快照中的單一分頁 """
+        info = self.load_manifest(snap_id)["tables"].get(sheet_name)
+        if info is None:
+            raise KeyError(f"快照 {snap_id} 沒有分頁：{sheet_name}")
+        parts = [table_from_bytes(self._get(d)) for d in info["chunks"]]
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+    def load_all(self, snap_id):
+        """ 回傳 (分頁順序, {分頁: DataFrame}) """
+        manifest = self.load_manifest(snap_id)
+        return manifest["sheet_order"], {sn: self.load_table(snap_id, sn) for sn in manifest["sheet_order"]}
+
+    # --- 保留策略 ---
+    def prune(self, now=None):
+        """ 依 每小時 / 每天 / 每月 保留規則刪除快照並回收區塊，回傳 (刪除快照數, 釋放位元組數) """
+        now = now or datetime.now()
+        snaps = self.list_snapshots()          # 新到舊
+        keep = set(snaps[:KEEP_RECENT])
+        buckets = (("%Y%m%d%H", KEEP_HOURLY, 3600), ("%Y%m%d", KEEP_DAILY, 86400), ("%Y%m", KEEP_MONTHLY, 31 * 86400))
+        for fmt, count, span in buckets:
+            seen = set()
+            for snap_id in snaps:
+                t = datetime.strptime(snap_id, ID_FORMAT)
+                if (now - t).total_seconds() > count * span:
+                    break
+                bucket = t.strftime(fmt)
+                if bucket not in seen:         # 每個時段保留最新的一份
+                    seen.add(bucket)
+                    keep.add(snap_id)
+
+        removed = [s for s in snaps if s not in keep]
+        for snap_id in removed:
+            os.remove(os.path.join(self.snap_dir, snap_id + ".json"))
+        freed = self.collect_garbage() if removed else 0
+        return len(removed), freed
+
+    def maybe_prune(self):
+        """ 存檔後呼叫；距離上次清理超過 PRUNE_INTERVAL 才真正執行 """
+        if time.time() - self._last_prune < PRUNE_INTERVAL:
+            return 0, 0
+        self._last_prune = time.time()
+        return self.prune()
+
+    def collect_garbage(self):
+        """ 刪除沒有任何快照引用的區塊 """
+        live = set()
+        for snap_id in self.list_snapshots():
+            for info in self.load_manifest(snap_id)["tables"].values():
+                live.update(info["chunks"])
+        freed = 0
+        if not os.path.isdir(self.obj_dir):
+            return 0
+        for sub in os.scandir(self.obj_dir):
+            for entry in os.scandir(sub.path):
+                if entry.name not in live:
+                    freed += entry.stat().st_size
+                    os.remove(entry.path)
+        return freed
+
+    def disk_usage(self):
+        total = 0
+        for base in (self.obj_dir, self.snap_dir):
+            for dirpath, _, files in os.walk(base):
+                total += sum(os.path.getsize(os.path.join(dirpath, fn)) for fn in files)
+        return total
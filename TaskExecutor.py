@@ -0,0 +1,194 @@
+"""
+全域背景工作執行器
+1. I/O 工作 (讀寫 Excel、雲端) 交給執行緒池；重度 pandas 運算交給行程池 (不受 GIL 限制)。
+2. 工作完成後不直接碰 Tk：結果放進佇列，由 UI 執行緒上唯一的 root.after 幫浦統一回呼。
+3. 每個工作回傳 TaskFuture，可查詢狀態、取消 (尚未開始的直接取消；執行中的結果會被丟棄)。
+4. stats() 提供佇列深度、執行中數量與各工作的等待 / 執行時間，便於觀察卡頓來源。
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+IO_WORKERS = 4
+CPU_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+PUMP_INTERVAL_MS = 50          # UI 幫浦檢查間隔
+SLOW_TASK = 1.0                # 執行超過此秒數就記錄
+
+
+class TaskFuture(Generic[T]):
+    """ 背景工作的結果；on_done / on_error 一律在 UI 執行緒呼叫 """
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._future = None
+        self._cancelled = False
+
+    def cancel(self) -> bool:
+        """ 取消工作；已在執行的工作無法中斷，但完成後不會回呼 """
+        self._cancelled = True
+        return self._future.cancel() if self._future is not None else True
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def done(self) -> bool:
+        return self._future is not None and self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> T:
+        """ 阻塞等待結果 (只在背景執行緒使用，UI 執行緒請用 on_done) """
+        return self._future.result(timeout)
+
+    @property
+    def wait_time(self) -> float:
+        return (self.started or self.submitted) - self.submitted
+
+    @property
+    def run_time(self) -> float:
+        return (self.finished or time.perf_counter()) - (self.started or self.submitted)
+
+
+class TaskExecutor:
+    def __init__(self, root=None, io_workers=IO_WORKERS, cpu_workers=CPU_WORKERS):
+        """ root: Tk 根視窗；沒有 root 時 (例如命令列工具) 回呼直接在工作執行緒執行 """
+        self.root = root
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="oms-io")
+        self._cpu = None
+        self._cpu_workers = cpu_workers
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._stats = {}      # 工作名稱 -> [次數, 總等待, 總執行, 最長執行]
+        if root is not None:
+            root.after(PUMP_INTERVAL_MS, self._pump)
+
+    # --- 提交 ---
+    def submit(self, fn: Callable[..., T], *args, name: str = None, on_done: Callable[[T], None] = None,
+               on_error: Callable[[Exception], None] = None, **kwargs) -> TaskFuture[T]:
+        """ 在執行緒池執行 fn(*args, **kwargs) (I/O 類工作) """
+        task = TaskFuture(name or getattr(fn, "__name__", "task"), "io")
+        with self._lock:
+            self._pending += 1
+        task._future = self._io.submit(self._run, task, fn, args, kwargs)
+        task._future.add_done_callback(lambda f: self._deliver(task, f, on_done, on_error))
+        return task
+
+    def submit_cpu(self, fn: Callable[..., T], *args, name: str = None, on_done: Callable[[T], None] = None,
+                   on_error: Callable[[Exception], None] = None) -> TaskFuture[T]:
+        """ 在執行緒池中把 fn 交給行程池執行；fn 與參數必須可 pickle (模組層級函式) """
+        task = self.submit(self.run_cpu, fn, *args, name=name or getattr(fn, "__name__", "task"),
+                           on_done=on_done, on_error=on_error)
+        task.kind = "cpu"
+        return task
+
+    def post(self, fn: Callable[[], None]):
+        """ 從任何執行緒把 fn 排到 UI 執行緒執行 (例如進度更新) """
+        if self.root is None:
+            fn()
+        else:
+            self._results.put((None, lambda _: fn(), None))
+
+    def run_cpu(self, fn: Callable[..., T], *args) -> T:
+        """ 在背景執行緒中同步呼叫：交給行程池並等待結果；行程池無法使用時改在本執行緒執行 """
+        try:
+            return self._cpu_pool().submit(fn, *args).result()
+        except (BrokenProcessPool, OSError, NotImplementedError) as e:
+            print(f"system: process pool unavailable, running {getattr(fn, '__name__', 'task')} in thread: {e}")
+            with self._lock:
+                self._cpu = None
+            return fn(*args)
+
+    def _cpu_pool(self):
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = ProcessPoolExecutor(max_workers=self._cpu_workers)
+            return self._cpu
+
+    # --- 執行與回傳 ---
+    def _run(self, task, fn, args, kwargs):
+        task.started = time.perf_counter()
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            task.finished = time.perf_counter()
+            with self._lock:
+                self._running -= 1
+                s = self._stats.setdefault(task.name, [0, 0.0, 0.0, 0.0])
+                s[0] += 1
+                s[1] += task.wait_time
+                s[2] += task.run_time
+                s[3] = max(s[3], task.run_time)
+            if task.run_time >= SLOW_TASK:
+                print(f"system: task {task.name} took {task.run_time * 1000:.0f} ms "
+                      f"(queued {task.wait_time * 1000:.0f} ms)")
+
+    def _deliver(self, task, future, on_done, on_error):
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1     # 尚未開始就被取消
+            return
+        if task.cancelled():
+            return
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            callback, value = on_error, e
+            if on_error is None:
+                print(f"system: task {task.name} failed: {e}")
+        else:
+            callback, value = on_done, result
+        if callback is None:
+            return
+        if self.root is None:
+            callback(value)
+        else:
+            self._results.put((task, callback, value))
+
+    def _pump(self):
+        """ UI 執行緒：統一執行所有已完成工作的回呼 """
+        try:
+            while True:
+                try:
+                    task, callback, value = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if task is not None and task.cancelled():
+                    continue
+                try:
+                    callback(value)
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    print(f"system: callback for {task.name if task else 'post'} failed: {e}")
+        finally:
+            self.root.after(PUMP_INTERVAL_MS, self._pump)
+
+    # --- 觀察 ---
+    def stats(self):
+        """ 回傳佇列深度、執行中數量與各工作的平均等待 / 執行時間 (ms) """
+        with self._lock:
+            tasks = {name: {"count": c, "avg_wait_ms": round(w / c * 1000, 1),
+                            "avg_run_ms": round(r / c * 1000, 1), "max_run_ms": round(m * 1000, 1)}
+                     for name, (c, w, r, m) in self._stats.items()}
+            return {"queued": self._pending, "running": self._running,
+                    "undelivered": self._results.qsize(), "tasks": tasks}
+
+    def shutdown(self):
+        self._io.shutdown(wait=False, cancel_futures=True)
+        if self._cpu is not None:
+            self._cpu.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,201 @@
+"""
+主鍵式增量合併引擎 (商品 / 廠商匯入共用)
+取代 concat + drop_duplicates：
+1. 依主鍵比對 (可多個候補主鍵，例如 商品編號 → 商品名稱)。
+2. 每個欄位可設定合併策略，避免匯入覆蓋『目前庫存』這類即時欄位。
+3. 只改動新增與真正有變動的列，其餘列的順序與內容完全不動。
+4. 可先試算 (dry-run) 產生差異摘要，確認後再寫入。
+"""
+import pandas as pd
+
+# 合併策略
+OVERWRITE = "overwrite"   # 以匯入值覆蓋
+KEEP = "keep"             # 保留現有值 (現有值為空時才採用匯入值)
+ADD = "add"               # 數值累加 (例如庫存)
+TOUCH = "touch"           # 時間戳記：只有該列其他欄位有變動時才更新
+
+POLICY_LABELS = {KEEP: "保留現有", ADD: "累加", OVERWRITE: "覆蓋"}
+
+# 商品：庫存與進貨時間屬於即時欄位，預設不被匯入覆蓋
+PRODUCT_POLICIES = {
+    "目前庫存": KEEP,
+    "最後進貨時間": KEEP,
+    "初始上架時間": KEEP,
+    "最後更新時間": TOUCH,
+}
+
+# 廠商：KPI 欄位由系統計算，預設保留
+VENDOR_POLICIES = {
+    "平均前置天數": KEEP,
+    "總到貨率": KEEP,
+    "總合格率": KEEP,
+    "綜合評等分數": KEEP,
+    "星等": KEEP,
+    "最後更新": TOUCH,
+}
+
+MAX_SAMPLE_CHANGES = 15   # 摘要中列出的變更範例數
+
+
+def _clean_key(series):
+    """ 主鍵正規化：去空白、去 Excel 文字保護單引號與 .0 """
+    s = series.fillna("").astype(str).str.strip()
+    s = s.str.replace(r"^'|\.0$", "", regex=True)
+    return s.where(~s.str.lower().isin(["nan", "none", "nat"]), "")
+
+
+def _norm(values):
+    """ 比較用的正規化：數字一律轉 float 字串，空值視為空字串 """
+    s = pd.Series(values, dtype=object).reset_index(drop=True)
+    num = pd.to_numeric(s, errors="coerce")
+    text = s.where(s.notna(), "").astype(str).str.strip()
+    text = text.where(~text.str.lower().isin(["nan", "none", "nat"]), "")
+    return text.where(num.isna(), num.astype(float).astype(str))
+
+
+def _is_blank(values):
+    return _norm(values) == ""
+
+
+def _match(df_old, df_new, keys):
+    """ 依候補主鍵順序比對，回傳 Series(新資料 index -> 舊資料 index 或 NaN) """
+    matched = pd.Series(pd.NA, index=df_new.index, dtype="object")
+    for key in keys:
+        if key not in df_old.columns or key not in df_new.columns:
+            continue
+        old_key = _clean_key(df_old[key])
+        lookup = pd.Series(df_old.index, index=old_key)
+        lookup = lookup[lookup.index != ""]
+        lookup = lookup[~lookup.index.duplicated(keep="first")]
+
+        new_key = _clean_key(df_new[key])
+        todo = matched.isna() & (new_key != "")
+        matched[todo] = new_key[todo].map(lookup)
+    return matched
+
+
+def _identity(df_new, keys):
+    """ 新資料的去重識別字串 (第一個非空主鍵) """
+    ident = pd.Series("", index=df_new.index)
+    for key in reversed(keys):
+        if key in df_new.columns:
+            k = _clean_key(df_new[key])
+            ident = (key + ":" + k).where(k != "", ident)
+    return ident
+
+
+def _assign(df, rows, col, values):
+    """ 寫入指定列；型別不相容時先把欄位轉成 object """
+    try:
+        df.loc[rows, col] = values
+    except (TypeError, ValueError):
+        df[col] = df[col].astype(object)
+        df.loc[rows, col] = values
+
+
+def upsert(df_old, df_new, keys, policies=None, dry_run=False):
+    """
+    以主鍵將 df_new 合併進 df_old。
+    keys:     候補主鍵清單，例如 ["商品編號", "商品名稱"]
+    policies: {欄位: 策略}，未指定的欄位預設 OVERWRITE
+    回傳 (合併後 DataFrame 或 None(dry_run), 摘要 dict)
+    """
+    policies = policies or {}
+    df_new = df_new.copy()
+
+    # 1. 匯入檔內部重複：以最後一筆為準 (與舊版 keep='last' 相同)
+    ident = _identity(df_new, keys)
+    df_new = df_new[(ident != "") & ~ident.duplicated(keep="last")]
+
+    matched = _match(df_old, df_new, keys)
+    is_update = matched.notna()
+    upd_new = df_new[is_update]
+    upd_old_idx = pd.Index(matched[is_update].tolist())
+    inserts = df_new[~is_update]
+
+    # 2. 逐欄計算更新候選值 (向量化)
+    result = None if dry_run else df_old.copy()
+    changed_rows = pd.Series(False, index=range(len(upd_new)))
+    col_changes = {}
+    touch_cols = []
+    for col in df_new.columns:
+        policy = policies.get(col, OVERWRITE)
+        if policy == TOUCH:
+            touch_cols.append(col)
+            continue
+        new_vals = upd_new[col].reset_index(drop=True)
+        if col in df_old.columns and len(upd_old_idx):
+            old_vals = df_old.loc[upd_old_idx, col].reset_index(drop=True)
+        else:
+            old_vals = pd.Series(pd.NA, index=new_vals.index, dtype=object)
+
+        if policy == KEEP:
+            cand = old_vals.where(~_is_blank(old_vals), new_vals)
+        elif policy == ADD:
+            cand = (pd.to_numeric(old_vals, errors="coerce").fillna(0)
+                    + pd.to_numeric(new_vals, errors="coerce").fillna(0))
+        else:
+            cand = new_vals
+
+        if col in keys:
+            # 主鍵欄位以正規化後的值比較 (例如 'A001 與 A001 視為相同)
+            diff = (_clean_key(old_vals) != _clean_key(cand)).reset_index(drop=True)
+        else:
+            diff = _norm(old_vals) != _norm(cand)
+        if diff.any():
+            col_changes[col] = (old_vals[diff], cand[diff])
+            changed_rows |= diff
+            if result is not None:
+                _assign(result, upd_old_idx[diff.to_numpy()], col, cand[diff].tolist())
+
+    # 3. 時間戳記只蓋在真正有變動的列
+    if result is not None and changed_rows.any():
+        rows = upd_old_idx[changed_rows.to_numpy()]
+        for col in touch_cols:
+            _assign(result, rows, col, upd_new[col].reset_index(drop=True)[changed_rows].tolist())
+
+    # 4. 新增列接在最後，不重新排序既有資料
+    if result is not None and not inserts.empty:
+        result = pd.concat([result, inserts], ignore_index=False)
+        result.reset_index(drop=True, inplace=True)
+
+    # 5. 差異摘要
+    labels = ident[upd_new.index].str.split(":", n=1).str[-1].reset_index(drop=True)
+    samples = []
+    for col, (olds, news) in col_changes.items():
+        for i in olds.index:
+            if len(samples) >= MAX_SAMPLE_CHANGES:
+                break
+            samples.append((labels[i], col, olds[i], news[i]))
+
+    summary = {
+        "inserted": len(inserts),
+        "updated": int(changed_rows.sum()),
+        "unchanged": int(len(upd_new) - changed_rows.sum()),
+        "cell_changes": sum(len(o) for o, _ in col_changes.values()),
+        "columns": {col: len(o) for col, (o, _) in col_changes.items()},
+        "samples": samples,
+    }
+    return result, summary
+
+
+def format_summary(summary, policies=None):
+    """ 將摘要轉為提示視窗用文字 """
+    lines = [
+        f"新增：{summary['inserted']} 筆",
+        f"更新：{summary['updated']} 筆 (共 {summary['cell_changes']} 個欄位值)",
+        f"無變動：{summary['unchanged']} 筆",
+    ]
+    if summary["columns"]:
+        lines.append("")
+        lines.append("變動欄位：" + "、".join(f"{c}({n})" for c, n in summary["columns"].items()))
+    kept = [c for c, p in (policies or {}).items() if p in (KEEP, ADD)]
+    if kept:
+        lines.append("合併策略：" + "、".join(f"{c}={POLICY_LABELS[policies[c]]}" for c in kept))
+    if summary["samples"]:
+        lines.append("")
+        lines.append("變更範例：")
+        for label, col, old, new in summary["samples"]:
+            old_s = "" if pd.isna(old) else old
+            lines.append(f"  {label}｜{col}: {old_s} → {new}")
+    return "\n".join(lines)
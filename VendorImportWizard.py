@@ -5,6 +5,10 @@ from datetime import datetime
 import sys
 import os
 
+from ImportStream import FILE_TYPES, PREVIEW_ROWS, read_preview, estimate_rows, stream_import
+from oms_core.schema import VENDOR_REQUIRED_FIELDS, vendor_field_spec
+from UpsertEngine import KEEP, TOUCH, VENDOR_POLICIES
+
 try:
     from tksheet import Sheet
 except ImportError:
@@ -18,12 +22,16 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 class VendorImportWizard(tk.Toplevel):
-    def __init__(self, parent, save_callback):
+    def __init__(self, parent, save_callback, executor):
         super().__init__(parent)
         self.title("廠商資料批次匯入精靈 (Excel版)")
         self.geometry("1200x850")
         self.save_callback = save_callback 
-        self.import_raw_df = pd.DataFrame()
+        self.executor = executor       # 全域 TaskExecutor：背景分批讀取與進度回報
+        self.import_path = None
+        self.preview_df = pd.DataFrame()
+        self.merge_policies = {}
+        self._cancelled = False
 
         try:
             self.iconbitmap(resource_path("main.ico"))
@@ -31,7 +39,7 @@ class VendorImportWizard(tk.Toplevel):
             pass
         
         # 廠商匯入必填欄位
-        self.REQUIRED_FIELDS = ["廠商名稱"]
+        self.REQUIRED_FIELDS = list(VENDOR_REQUIRED_FIELDS)
         
         self.grab_set()
         self.setup_ui()
@@ -93,20 +101,30 @@ class VendorImportWizard(tk.Toplevel):
 
         footer = ttk.Frame(self, padding=20)
         footer.pack(fill="x")
-        ttk.Button(footer, text="✅ 執行廠商資料匯入", command=self.execute_import, width=35).pack(side="right")
-        ttk.Button(footer, text="❌ 取消", command=self.destroy).pack(side="right", padx=10)
+        self.btn_import = ttk.Button(footer, text="✅ 執行廠商資料匯入", command=self.execute_import, width=35)
+        self.btn_import.pack(side="right")
+        ttk.Button(footer, text="❌ 取消", command=self.cancel).pack(side="right", padx=10)
+
+        self.progress = ttk.Progressbar(footer, mode="determinate", length=300)
+        self.progress.pack(side="left")
+        self.lbl_progress = ttk.Label(footer, text="", foreground="gray")
+        self.lbl_progress.pack(side="left", padx=10)
+
+    def cancel(self):
+        self._cancelled = True
+        self.destroy()
 
     def load_file(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel 檔案", "*.xlsx *.xls")])
+        path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not path: 
             return
         try:
-            self.lbl_path.config(text=f"已載入: {os.path.basename(path)}", foreground="green")
-            self.import_raw_df = pd.read_excel(path).fillna("")
-            headers = self.import_raw_df.columns.tolist()
+            headers, self.preview_df = read_preview(path)
+            self.import_path = path
+            self.lbl_path.config(text=f"已載入: {os.path.basename(path)} (預覽前 {PREVIEW_ROWS} 列)", foreground="green")
             
             if Sheet and isinstance(self.sheet, Sheet):
-                self.sheet.set_sheet_data(self.import_raw_df.values.tolist())
+                self.sheet.set_sheet_data(self.preview_df.values.tolist())
                 self.sheet.headers(headers)
 
             options = ["(不匯入 / 留空)"] + [f"列 {i}: {h}" for i, h in enumerate(headers)]
@@ -137,7 +155,7 @@ class VendorImportWizard(tk.Toplevel):
             messagebox.showerror("錯誤", f"無法讀取檔案: {e}")
 
     def execute_import(self):
-        if self.import_raw_df.empty:
+        if not self.import_path or self.preview_df.empty:
             return
         mapping = {}
         for label, var in self.vars.items():
@@ -149,52 +167,52 @@ class VendorImportWizard(tk.Toplevel):
             messagebox.showerror("錯誤", "您必須對應「廠商名稱」欄位！")
             return
 
-        new_list = []
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+        # 建立廠商格式：(型別, 預設值)
+        field_spec = vendor_field_spec(now_str)
+        # 未匹配的欄位保留既有廠商的現有值 (避免預設值蓋掉聯絡資料與 KPI)
+        self.merge_policies = {f: KEEP for f in field_spec
+                               if f not in mapping and VENDOR_POLICIES.get(f) != TOUCH}
+
+        total = estimate_rows(self.import_path)
+        self.progress.config(mode="determinate" if total else "indeterminate", maximum=total or 100, value=0)
+        if not total:
+            self.progress.start(10)
+        self.btn_import.config(state="disabled")
+        self._cancelled = False
+
+        post = self.executor.post
+        self.executor.submit(
+            stream_import, self.import_path, mapping, field_spec, "廠商名稱", name="import",
+            progress=lambda done, valid: post(lambda: self._on_progress(done, valid, total)),
+            cancelled=lambda: self._cancelled,
+            on_done=self._on_import_ready, on_error=self._on_import_failed)
+
+    def _on_progress(self, done, valid, total):
+        if self._cancelled:
+            return
+        if total:
+            self.progress.config(value=min(done, total))
+        self.lbl_progress.config(text=f"已讀取 {done} 列 / 有效 {valid} 筆")
+
+    def _on_import_failed(self, err):
+        if self._cancelled:
+            return
+        self.progress.stop()
+        self.btn_import.config(state="normal")
+        messagebox.showerror("錯誤", f"無法讀取檔案: {err}")
+
+    def _on_import_ready(self, df_new):
+        if self._cancelled or df_new is None:
+            return
+        self.progress.stop()
+        self.btn_import.config(state="normal")
 
-        for _, row in self.import_raw_df.iterrows():
-            try:
-                v_name = str(row.iloc[mapping["廠商名稱"]]).strip()
-                if not v_name or v_name.lower() == "nan":
-                    continue
-
-                def get_val(key, default=""):
-                    if key in mapping:
-                        v = row.iloc[mapping[key]]
-                        return str(v).strip() if str(v).strip() != "" else default
-                    return default
-
-                def get_num(key, default=0):
-                    if key in mapping:
-                        val = pd.to_numeric(row.iloc[mapping[key]], errors='coerce')
-                        return val if pd.notna(val) else default
-                    return default
-
-                # 建立廠商格式
-                item = {
-                    "廠商名稱": v_name,
-                    "通路": get_val("通路", ""),
-                    "統編": get_val("統編", ""),
-                    "聯絡人": get_val("聯絡人", ""),
-                    "電話": get_val("電話", ""),
-                    "地址": get_val("地址", ""),
-                    "備註": get_val("備註", ""),
-                    "平均前置天數": get_num("平均前置天數", 0),
-                    "總到貨率": get_val("總到貨率", "0%"),
-                    "總合格率": get_val("總合格率", "0%"),
-                    "綜合評等分數": get_num("綜合評等分數", 0),
-                    "星等": get_num("星等", 5),
-                    "最後更新": now_str
-                }
-                new_list.append(item)
-            except Exception:
-                continue
-
-        if not new_list:
+        if df_new.empty:
             messagebox.showwarning("警告", "無有效資料可匯入")
             return
 
-        if messagebox.askyesno("匯入確認", f"準備匯入 {len(new_list)} 筆廠商資料。是否繼續？"):
-            if self.save_callback(new_list):
-                messagebox.showinfo("成功", "廠商資料庫已更新")
-                self.destroy()
\ No newline at end of file
+        # 主程式會先顯示差異摘要再確認寫入
+        if self.save_callback(df_new, self.merge_policies):
+            messagebox.showinfo("成功", "廠商資料庫已更新")
+            self.destroy()
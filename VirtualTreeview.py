@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+
+class VirtualTreeview:
+    """
+    虛擬分頁列表 (Virtual Treeview)
+    資料完整保存在 DataFrame，Treeview 內只放『可視範圍 + 預取緩衝』的列。
+    篩選與排序都在資料層 (pandas) 執行，捲動時才換頁填入，
+    幾十萬筆歷史紀錄也不會拖慢畫面。
+    """
+
+    def __init__(self, tree, scrollbar, formatter, col_map=None, filter_func=None,
+                 window=100, prefetch=200):
+        """
+        tree:        既有的 ttk.Treeview
+        scrollbar:   垂直捲軸 (改由本類別接管)
+        formatter:   formatter(block_df, prev_row) -> [(text, values, tags), ...]
+        col_map:     Treeview 欄位名稱 -> DataFrame 欄位名稱 (排序用)
+        filter_func: filter_func(df) -> 布林遮罩；回傳 None 代表不篩選
+        """
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.formatter = formatter
+        self.col_map = col_map or {}
+        self.filter_func = filter_func
+        self.window = window
+        self.prefetch = prefetch
+
+        self.df = pd.DataFrame()
+        self.order = np.arange(0)      # 篩選 + 排序後的 iloc 位置
+        self.block_start = 0
+        self.block_end = 0
+        self.sort_col = None
+        self.sort_reverse = False
+        self._last_selected = ()
+        self.data_version = 0          # 每次 set_data 遞增，供背景載入判斷結果是否過期
+
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.scrollbar.configure(command=self._on_scrollbar)
+
+    # ---------------- 資料層 ----------------
+    def set_data(self, df):
+        """ 載入完整資料 (保留原始 index 作為 Excel 列號)，並套用目前的篩選與排序 """
+        self.df = df
+        self.data_version += 1
+        self.refilter()
+
+    def refilter(self):
+        """ 重新套用篩選條件 (不重新讀檔) """
+        pos = np.arange(len(self.df))
+        if self.filter_func is not None and not self.df.empty:
+            mask = self.filter_func(self.df)
+            if mask is not None:
+                pos = pos[np.asarray(mask, dtype=bool)]
+        self.order = pos
+        if self.sort_col is not None:
+            self._apply_sort()
+        self._fill(0, keep_selection=False)
+
+    def sort_by(self, tree_col, reverse):
+        """ 在完整資料集上排序 (不經過 Tk)，排序後回到第一列 """
+        self.sort_col = self.col_map.get(tree_col, tree_col)
+        self.sort_reverse = reverse
+        self._apply_sort()
+        self._fill(0, keep_selection=False)
+
+    def _apply_sort(self):
+        if self.sort_col not in self.df.columns or len(self.order) == 0:
+            return
+        raw = self.df[self.sort_col].iloc[self.order]
+        text = raw.fillna("").astype(str).str.strip()
+        # 與 sort_tree_column 相同規則：去除 $ , % 後能全部轉數字就用數值排序
+        num = pd.to_numeric(text.str.replace(r'[$,%]', '', regex=True), errors='coerce')
+        key = num if num.notna().sum() == text.ne("").sum() else text
+        ranked = key.reset_index(drop=True).sort_values(
+            ascending=not self.sort_reverse, kind='mergesort', na_position='last')
+        self.order = self.order[ranked.index.to_numpy()]
+
+    def __len__(self):
+        return len(self.order)
+
+    # ---------------- 顯示層 ----------------
+    def _fill(self, top, keep_selection=True):
+        """ 以全域第 top 列為可視起點，重新填入一個區塊 """
+        total = len(self.order)
+        top = max(0, min(top, max(total - 1, 0)))
+        start = max(0, top - self.prefetch)
+        end = min(total, top + self.window + self.prefetch)
+
+        selected_pos = self.selected_positions() if keep_selection else []
+        if not keep_selection:
+            self._last_selected = ()
+        self.tree.delete(*self.tree.get_children())
+        self.block_start, self.block_end = start, end
+
+        if end > start:
+            block = self.df.iloc[self.order[start:end]]
+            prev_row = self.df.iloc[self.order[start - 1]] if start > 0 else None
+            for offset, (text, values, tags) in enumerate(self.formatter(block, prev_row)):
+                self.tree.insert("", "end", iid=str(start + offset), text=text, values=values, tags=tags)
+
+        # 還原仍在區塊內的選取 (選取事件由 bind_select 過濾，不會重複觸發)
+        keep = [str(p) for p in selected_pos if start <= p < end]
+        if keep:
+            self.tree.selection_set(keep)
+
+        block_len = max(end - start, 1)
+        self.tree.yview_moveto((top - start) / block_len)
+        self._update_scrollbar()
+
+    def _local_view(self):
+        first, last = self.tree.yview()
+        block_len = self.block_end - self.block_start
+        return int(round(first * block_len)), int(round(last * block_len))
+
+    def _update_scrollbar(self):
+        total = len(self.order)
+        if total == 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        local_first, local_last = self._local_view()
+        self.scrollbar.set((self.block_start + local_first) / total,
+                           (self.block_start + local_last) / total)
+
+    def _on_tree_scroll(self, first, last):
+        """ Treeview 自己捲動 (滾輪/方向鍵) 時回報；接近區塊邊緣就換頁 """
+        block_len = self.block_end - self.block_start
+        if block_len <= 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        local_first = int(round(float(first) * block_len))
+        local_last = int(round(float(last) * block_len))
+        margin = self.prefetch // 2
+        near_top = self.block_start > 0 and local_first < margin
+        near_bottom = self.block_end < len(self.order) and local_last > block_len - margin
+        if near_top or near_bottom:
+            self._fill(self.block_start + local_first)
+        else:
+            total = len(self.order)
+            self.scrollbar.set((self.block_start + local_first) / total,
+                               (self.block_start + local_last) / total)
+
+    def _on_scrollbar(self, *args):
+        """ 捲軸拖曳：直接換算成全域列號 """
+        if args and args[0] == "moveto":
+            top = int(float(args[1]) * len(self.order))
+            if self.block_start <= top and top + self.window <= self.block_end:
+                self.tree.yview_moveto((top - self.block_start) / max(self.block_end - self.block_start, 1))
+            else:
+                self._fill(top)
+        else:
+            self.tree.yview(*args)
+
+    # ---------------- 選取 ----------------
+    def selected_positions(self):
+        """ 目前選取列在排序後清單中的位置 """
+        return [int(i) for i in self.tree.selection() if str(i).isdigit()]
+
+    def bind_select(self, callback):
+        """ 綁定選取事件，略過換頁還原選取時產生的重複事件 """
+        def _handler(event=None):
+            current = tuple(self.selected_positions())
+            if current == self._last_selected:
+                return
+            self._last_selected = current
+            if current:
+                callback(event)
+        self.tree.bind("<<TreeviewSelect>>", _handler)
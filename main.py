@@ -1,27 +1,52 @@
 #shopee-oms 6.4 完整版
 
+import time
+_MODULE_T0 = time.perf_counter()  # 啟動分析用：程式開始載入的時間點
+
 import json
 import sys
 import tkinter as tk
-from tkinter import ttk, messagebox, font
-import pandas as pd
+from tkinter import ttk, messagebox, font, filedialog
 from datetime import datetime, timedelta  # 引入 timedelta 來處理時區加減
 import os
 import re
 import pickle
 import threading 
+import shutil
+import tempfile
 import hashlib
 from decimal import Decimal, ROUND_HALF_UP
 import platform
 import uuid
 
 
-from LogisticsWizard import LogisticsWizard
-from ImportWizard import ImportWizard
-from ShippingWizard import show_shipping_dialog
-from ShippingDistributor import ShippingDistributor
-from OrderRecallHandler import RecallManager
-from ProcurementManager import ProcurementManager
+from ShippingWizard import show_shipping_dialog, show_batch_shipping_dialog
+from BackupScheduler import AutoBackupScheduler
+from RWLock import ReadWriteLock
+from TaskExecutor import TaskExecutor
+from OrderServer import OmsClient
+from BackupTargets import (BackupTarget, LocalFolderTarget, load_backup_config, save_backup_config,
+                           MIN_KEEP, MAX_KEEP)
+
+# --- 延遲載入的重量級模組 ---
+# pandas 與依賴 pandas 的功能模組不在啟動時匯入，讓登入視窗先出現；
+# 由 load_core_modules() 於登入期間在背景預載，進入主程式前完成綁定。
+pd = None
+LogisticsWizard = None
+ImportWizard = None
+ShippingDistributor = None
+RecallManager = None
+ProcurementManager = None
+VirtualTreeview = None
+
+# 啟動分析紀錄 (--profile-startup)：[(階段名稱, 秒數)]
+STARTUP_PROFILE = []
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+# 區網伺服器模式：--server http://主機:8765 (或環境變數 OMS_SERVER) 時，核心操作交給 OrderServer
+OMS_SERVER = (sys.argv[sys.argv.index("--server") + 1] if "--server" in sys.argv[:-1]
+              else os.environ.get("OMS_SERVER", "").strip() or None)
+_LOGIN_T0 = _MODULE_T0  # 登入視窗出現的時間點 (於 __main__ 更新)
+_core_modules_lock = threading.Lock()
 
 
 # 1. 匯入敏感資料
@@ -82,39 +107,130 @@ def get_rescue_password():
     
     return hashlib.sha256(raw_string.encode()).hexdigest()[:10].upper()
 
-# --- Google Drive 相關套件 ---
-try:
-    from googleapiclient.discovery import build
-    from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from google.auth.transport.requests import Request
-    GOOGLE_LIB_INSTALLED = True
-except ImportError:
-    GOOGLE_LIB_INSTALLED = False
+def _timed_import(label, loader):
+    """ 執行匯入並紀錄耗時 (供 --profile-startup 報告使用) """
+    t0 = time.perf_counter()
+    result = loader()
+    STARTUP_PROFILE.append((f"import {label}", time.perf_counter() - t0))
+    return result
+
+
+def load_core_modules():
+    """
+    載入 pandas 與各功能模組並綁定為全域名稱。
+    可重複呼叫；登入視窗顯示期間由背景執行緒預載，主程式建立前再呼叫一次確保完成。
+    """
+    global pd, LogisticsWizard, ImportWizard, ShippingDistributor
+    global RecallManager, ProcurementManager, VirtualTreeview
+    with _core_modules_lock:
+        if pd is not None:
+            return
+        import importlib
+        pandas_mod = _timed_import("pandas", lambda: importlib.import_module("pandas"))
+        LogisticsWizard = _timed_import("LogisticsWizard", lambda: importlib.import_module("LogisticsWizard")).LogisticsWizard
+        ImportWizard = _timed_import("ImportWizard", lambda: importlib.import_module("ImportWizard")).ImportWizard
+        ShippingDistributor = _timed_import("ShippingDistributor", lambda: importlib.import_module("ShippingDistributor")).ShippingDistributor
+        RecallManager = _timed_import("OrderRecallHandler", lambda: importlib.import_module("OrderRecallHandler")).RecallManager
+        ProcurementManager = _timed_import("ProcurementManager", lambda: importlib.import_module("ProcurementManager")).ProcurementManager
+        VirtualTreeview = _timed_import("VirtualTreeview", lambda: importlib.import_module("VirtualTreeview")).VirtualTreeview
+        # pd 最後才綁定，作為「全部載入完成」的旗標
+        pd = pandas_mod
+
+
+# --- Google Drive 相關套件 (只在使用雲端備份時才載入) ---
+GOOGLE_LIB_INSTALLED = None  # None = 尚未嘗試載入
+build = MediaFileUpload = MediaIoBaseDownload = InstalledAppFlow = Request = None
+
+
+def load_google_libs():
+    """ 第一次使用雲端備份時才匯入 Google API 套件，回傳是否可用 """
+    global GOOGLE_LIB_INSTALLED, build, MediaFileUpload, MediaIoBaseDownload, InstalledAppFlow, Request
+    if GOOGLE_LIB_INSTALLED is not None:
+        return GOOGLE_LIB_INSTALLED
+    t0 = time.perf_counter()
+    try:
+        from googleapiclient.discovery import build
+        from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        GOOGLE_LIB_INSTALLED = True
+    except ImportError:
+        GOOGLE_LIB_INSTALLED = False
+    STARTUP_PROFILE.append(("import google api (lazy)", time.perf_counter() - t0))
+    return GOOGLE_LIB_INSTALLED
 
 
 # 設定 Excel 檔案名稱
 FILE_NAME = resource_path('sales_data.xlsx')
 CREDENTIALS_FILE = resource_path('credentials.json')  
 TOKEN_FILE =  resource_path('token.json')             
+BACKUP_STATE_FILE = resource_path('backup_state.json')  # 增量備份的基準紀錄
+BACKUP_CONFIG_FILE = resource_path('backup_config.json')  # 備份目的地與保留份數
+DRIVE_CACHE_FILE = resource_path('drive_cache.json')      # 雲端備份資料夾 ID 與備份清單快取
+SNAPSHOT_DIR = resource_path('snapshots')                  # 本機快照庫 (每次存檔自動記錄)
+CARRIER_CONFIG = resource_path('carriers.json')            # 物流商查詢設定 (CarrierTracker)
+TRACKING_CACHE_FILE = resource_path('tracking_cache.json')  # 物流查詢結果快取 (ETag / 最後查詢時間)
 SCOPES = ['https://www.googleapis.com/auth/drive.file'] 
 
  
-SHEET_PURCHASES = '進貨紀錄'
-SHEET_PUR_TRACKING = '進貨追蹤'
-SHEET_VENDORS = '進貨廠商管理'
-SHEET_SALES = '銷售紀錄'      # 歷史已完成訂單
-SHEET_TRACKING = '訂單追蹤'   # 未完成/出貨中 (緩衝區)
-SHEET_RETURNS = '退貨紀錄'    # 退貨區
-SHEET_AFTER_SALES = '售後明細'  # 新增售後子帳分頁名稱
-SHEET_PRODUCTS = '商品資料'
-SHEET_FEES = '手續費設定'       # 原本的 '系統設定' 內容搬到這
-SHEET_SYS_SETTINGS = '系統設定'  # 專門存店名、版本、權限等
+# 分頁名稱與 oms_core / 命令列工具共用同一份定義 (oms_core.schema 不依賴 pandas，不影響延遲載入)
+# SHEET_SALES 歷史已完成訂單、SHEET_TRACKING 未完成/出貨中 (緩衝區)、SHEET_FEES 手續費設定、SHEET_SYS_SETTINGS 店名/版本/權限
+from oms_core.schema import (SHEET_AFTER_SALES, SHEET_FEES, SHEET_PRODUCTS, SHEET_PUR_TRACKING, SHEET_PURCHASES,
+                             SHEET_RETURNS, SHEET_SALES, SHEET_SYS_SETTINGS, SHEET_TRACKING, SHEET_VENDORS)
+
+
+# --- 最新版本的欄位結構 (check_excel_file 依此自動校準) ---
+REQUIRED_STRUCTURE = {
+    SHEET_SALES: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
+                  "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
+                  "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
+    
+    SHEET_TRACKING: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
+                     "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
+                     "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
+
+    SHEET_PURCHASES: ["進貨單號", "採購日期", "入庫日期", "供應商", "物流狀態", 
+                      "商品名稱", "數量", "原始預計數量", "瑕疵數量", "進貨單價", 
+                      "進貨總額", "進項稅額", "分攤運費", "海關稅金", "賣家交付日期", "備註"],
+
+    SHEET_AFTER_SALES: ["訂單編號", "商品名稱", "發生日期", "處理類型", "支出金額", "詳細說明"],
+
+
+    SHEET_PUR_TRACKING: ["進貨單號", "採購日期", "入庫日期", "供應商", "物流狀態", 
+                         "商品名稱", "數量", "原始預計數量", "瑕疵數量", "進貨單價", 
+                         "進貨總額", "進項稅額", "分攤運費", "海關稅金", "賣家交付日期", "備註"],
+
+    SHEET_VENDORS: ["廠商名稱", "通路", "統編", "聯絡人", "電話", "地址", "備註", 
+                    "平均前置天數", "總到貨率", "總合格率", "綜合評等分數", "星等", "最後更新"],
+
+    SHEET_PRODUCTS: ["商品編號", "分類Tag", "商品名稱", "預設成本", "預設售價", "目前庫存", 
+                     "最後更新時間", "初始上架時間", "最後進貨時間", "安全庫存", 
+                     "商品連結", "商品備註", "單位權重"],
+
+    SHEET_RETURNS: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
+                    "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
+                    "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
+
+    SHEET_FEES: ["設定名稱", "費率百分比", "固定金額"],
+
+    SHEET_SYS_SETTINGS: ["設定名稱", "參數值"] # 改成 Key-Value 格式
+}
+
+# 結構版本：由欄位定義自動產生指紋，欄位有任何增減就會改變，觸發重新校準
+SCHEMA_VERSION = hashlib.sha256(
+    json.dumps(REQUIRED_STRUCTURE, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:12]
 
 
 
 # 設定雲端硬碟上的備份資料夾名稱
 BACKUP_FOLDER_NAME = "蝦皮進銷存系統_備份"
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024   # 可續傳上傳的分段大小 (須為 256KB 的倍數)
+DRIVE_BATCH_LIMIT = 100               # Drive 批次請求單次上限
+DRIVE_PAGE_SIZE = 1000                # 列出備份時每頁筆數 (Drive 上限)
+DRIVE_FILE_FIELDS = "id, name, createdTime, size, appProperties"
+# 還原前檢查：備份至少要有這些分頁與欄位才會置換正式檔
+# (只檢查核心欄位；舊版備份缺少的新欄位會在下次啟動時由結構校準補齊)
+RESTORE_SCHEMA = {SHEET_PRODUCTS: ["商品名稱", "目前庫存"]}
 
 TAIWAN_CITIES = [
     "基隆市", "臺北市", "新北市", "桃園市", "新竹市", "新竹縣", "苗栗縣",
@@ -138,7 +254,7 @@ SHIPPING_METHODS = [
 ]
 
 def thread_safe_file(func):
-    """ 裝飾器：自動為檔案操作加上互斥鎖 (支援跨類別) """
+    """ 裝飾器：自動為檔案操作加上互斥鎖 (支援跨類別)；寫入 / 讀改寫的操作使用 """
     def wrapper(self, *args, **kwargs):
         # 檢查該類別是否有 file_lock 屬性
         if hasattr(self, 'file_lock') and self.file_lock is not None:
@@ -150,21 +266,90 @@ def thread_safe_file(func):
     return wrapper
 
 
+def thread_safe_read(func):
+    """ 裝飾器：只讀取檔案的操作使用共享讀取鎖，多個讀取可同時進行，只有存檔時才需要等待 """
+    def wrapper(self, *args, **kwargs):
+        lock = getattr(self, 'file_lock', None)
+        if lock is None or not hasattr(lock, 'read'):
+            return thread_safe_file(func)(self, *args, **kwargs)
+        with lock.read():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def requires_tab(tab_attr):
+    """ 裝飾器：分頁尚未建立時略過刷新 (分頁第一次開啟時會自行載入資料) """
+    def decorator(func):
+        def wrapper(self, *args, **kwargs):
+            if not self.is_tab_built(tab_attr):
+                return None
+            return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+
+def _is_not_found(e):
+    """Google API 例外是否為 404 (檔案 / 資料夾不存在)"""
+    return getattr(getattr(e, 'resp', None), 'status', None) == 404
+
+
+class GoogleDriveSync(BackupTarget):
+    """處理 Google Drive 認證、資料夾管理、上傳與下載邏輯 (BackupTarget 實作)"""
+    label = "Google Drive"
 
-class GoogleDriveSync:
-    """處理 Google Drive 認證、資料夾管理、上傳與下載邏輯"""
     def __init__(self):
         self.creds = None
         self.service = None
         self.is_authenticated = False
         self.folder_id = None 
         self.file_lock = None 
+        # 資料夾 ID 與備份清單快取：登入不必再搜尋資料夾，備份分頁也能立即顯示
+        self._cache_lock = threading.Lock()
+        self._cache = self._load_cache()
+
+    # --- 本機快取 ---
+    def _load_cache(self):
+        try:
+            with open(DRIVE_CACHE_FILE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache.setdefault("folder_id", None)
+        cache.setdefault("backups", [])
+        return cache
+
+    def _save_cache(self):
+        try:
+            with open(DRIVE_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"system: failed to save drive cache: {e}")
+
+    def _update_cache(self, folder_id=None, backups=None, added=None, removed=None):
+        with self._cache_lock:
+            if folder_id is not None and folder_id != self._cache["folder_id"]:
+                self._cache = {"folder_id": folder_id, "backups": []}
+            if backups is not None:
+                self._cache["backups"] = backups
+            if added:
+                self._cache["backups"].insert(0, added)
+            if removed:
+                self._cache["backups"] = [b for b in self._cache["backups"] if b["id"] not in removed]
+            self._save_cache()
+
+    def cached_backups(self):
+        """上次列出的備份清單 (不連網)"""
+        with self._cache_lock:
+            if self._cache["folder_id"] and self._cache["folder_id"] == self.folder_id:
+                return list(self._cache["backups"])
+        return None
         
 
 
     def authenticate(self):
         """執行 OAuth 登入流程"""
-        if not GOOGLE_LIB_INSTALLED:
+        if not load_google_libs():
             return False, "未安裝 Google 套件，請執行: pip install google-api-python-client google-auth-oauthlib"
         
         if not os.path.exists(CREDENTIALS_FILE):
@@ -188,7 +373,10 @@ class GoogleDriveSync:
             self.service = build('drive', 'v3', credentials=self.creds)
             self.is_authenticated = True
             
-            self.folder_id = self.get_or_create_folder()
+            # 快取的資料夾仍存在且不在垃圾桶才沿用，否則重新搜尋 / 建立
+            cached = self._cache["folder_id"]
+            self.folder_id = cached if cached and self._folder_usable(cached) else self.get_or_create_folder()
+            self._update_cache(folder_id=self.folder_id)
             
             return True, "登入成功！"
         except Exception as e:
@@ -215,81 +403,114 @@ class GoogleDriveSync:
             print(f"system: failed to create folder: {e}")
             return None
 
-    
-    @thread_safe_file
-    def upload_file(self, filepath):
-        """上傳檔案到指定資料夾，並維持最多 20 筆備份"""
-        if not self.is_authenticated: 
-            return False, "尚未登入 Google 帳號"
-        if not self.folder_id: 
-            self.folder_id = self.get_or_create_folder()
-
+    def _folder_usable(self, folder_id):
+        """確認快取的資料夾 ID 仍有效；已丟進垃圾桶或找不到 (404) 回傳 False"""
         try:
-            # 1. 執行上傳
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
-            file_name = f"[系統備份] {os.path.basename(filepath).replace('.xlsx', '')}_{timestamp}.xlsx"
-            
-            file_metadata = {'name': file_name, 'parents': [self.folder_id]}
-            media = MediaFileUpload(filepath, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            self.service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-
-            # 2. 檢查檔案數量並自動清理舊檔 (自動替換邏輯)
-            # list_backups 預設是照時間降冪排序 (最新的在 index 0)
-            items = self.list_backups()
-            
-            if len(items) > 20:
-                # 取得第 20 筆之後的所有檔案 (即最舊的檔案們)
-                files_to_delete = items[20:] 
-                for old_file in files_to_delete:
-                    file_id = old_file.get('id')
-                    try:
-                        self.service.files().delete(fileId=file_id).execute()
-                        print(f"system: cleaned up old backup: {old_file.get('name')}")
-                    except Exception as delete_error:
-                        print(f"system: failed to delete old file: {delete_error}")
+            meta = self.service.files().get(fileId=folder_id, fields='trashed').execute()
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            print(f"system: cached backup folder {folder_id} not found")
+            return False
+        if meta.get('trashed'):
+            print(f"system: cached backup folder {folder_id} is in trash")
+            return False
+        return True
 
-            return True, f"系統備份成功\n 雲端檔案: {file_name}\n(系統已自動管理備份數量(最多保留20筆))"
+    @property
+    def key(self):
+        return f"gdrive:{self.folder_id}"
+
+    def is_ready(self):
+        return self.is_authenticated
+
+    def upload(self, local_path, name, properties=None):
+        """可續傳分段上傳，回傳雲端檔案 ID；資料夾已被刪除 (404) 時重新搜尋 / 建立後再傳一次"""
+        try:
+            return self._upload(local_path, name, properties)
         except Exception as e:
-            return False, f"system: failed to upload file: {str(e)}"
+            if not _is_not_found(e):
+                raise
+            self.folder_id = self.get_or_create_folder()
+            self._update_cache(folder_id=self.folder_id)
+            return self._upload(local_path, name, properties)
+
+    def _upload(self, local_path, name, properties):
+        file_metadata = {'name': name, 'parents': [self.folder_id], 'appProperties': properties or {}}
+        media = MediaFileUpload(local_path, mimetype='application/zip',
+                                chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        request = self.service.files().create(body=file_metadata, media_body=media, fields=DRIVE_FILE_FIELDS)
+        response = None
+        while response is None:
+            # 每段失敗會自動重試，網路中斷不必整份重傳
+            status, response = request.next_chunk(num_retries=3)
+            if status:
+                print(f"system: uploading {name} {int(status.progress() * 100)}%")
+        self._update_cache(added=response)
+        return response.get('id')
+
+    def download(self, file_id, dest_path):
+        """分段下載到指定檔案 (不整份放在記憶體)"""
+        request = self.service.files().get_media(fileId=file_id)
+        with open(dest_path, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=UPLOAD_CHUNK_SIZE)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk(num_retries=3)
 
+    def delete_many(self, file_ids):
+        """以批次請求刪除多個檔案 (每批最多 DRIVE_BATCH_LIMIT 筆)"""
+        def _on_deleted(request_id, response, exception):
+            if exception is not None:
+                print(f"system: failed to delete old file {request_id}: {exception}")
+
+        for start in range(0, len(file_ids), DRIVE_BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=_on_deleted)
+            for file_id in file_ids[start:start + DRIVE_BATCH_LIMIT]:
+                batch.add(self.service.files().delete(fileId=file_id), request_id=file_id)
+            batch.execute()
+        if file_ids:
+            self._update_cache(removed=set(file_ids))
+            print(f"system: cleaned up {len(file_ids)} old backups")
 
 
     def list_backups(self):
-        """列出備份資料夾內的檔案"""
+        """分頁列出備份資料夾內的所有檔案 (含增量備份屬性)，並更新快取；失敗時丟出例外"""
         if not self.is_authenticated: 
             return []
-        if not self.folder_id: 
+        # 資料夾可能在登入後才被丟進垃圾桶 (此時列出不會 404)，每次重新列出前先確認
+        if not self.folder_id or not self._folder_usable(self.folder_id):
             self.folder_id = self.get_or_create_folder()
-        
-        try:
-            query = f"'{self.folder_id}' in parents and trashed = false"
-            results = self.service.files().list(q=query, pageSize=20, fields="nextPageToken, files(id, name, createdTime)", orderBy="createdTime desc").execute()
-            items = results.get('files', [])
-            return items
-        except Exception as e:
-            print(f"List error: {e}")
-            return []
 
-
-    def download_file(self, file_id, save_path):
-        """下載並覆蓋檔案"""
-        if not self.is_authenticated: 
-            return False, "尚未登入"
-        
         try:
-            request = self.service.files().get_media(fileId=file_id)
-            import io
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            
-            with open(save_path, 'wb') as f:
-                f.write(fh.getbuffer())
-            return True, "還原成功！請重新啟動程式以載入新資料。"
+            items = self._list_folder()
         except Exception as e:
-            return False, f"下載失敗: {str(e)}"
+            # 快取的資料夾已被刪除 (或換了帳號)：重新搜尋 / 建立後再試一次
+            if not _is_not_found(e):
+                raise
+            self.folder_id = self.get_or_create_folder()
+            items = self._list_folder()
+        self._update_cache(folder_id=self.folder_id, backups=items)
+        return items
+
+    def _list_folder(self):
+        query = f"'{self.folder_id}' in parents and trashed = false"
+        items, page_token = [], None
+        while True:
+            results = self.service.files().list(
+                q=query, pageSize=DRIVE_PAGE_SIZE, orderBy="createdTime desc", pageToken=page_token,
+                fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})").execute()
+            items.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return items
+
+    def get_metadata(self, file_id):
+        """備份上傳後屬性不會再變，優先使用快取"""
+        for item in self.cached_backups() or []:
+            if item["id"] == file_id:
+                return item
+        return self.service.files().get(fileId=file_id, fields=DRIVE_FILE_FIELDS).execute()
 
 
 class LoginWindow:
@@ -442,11 +663,19 @@ class SalesApp:
 
 
 
-        self.root.title("蝦皮/網拍進銷存系統 (正式版)")
+        self.root.title("蝦皮/網拍進銷存系統 (正式版)" + (f" - 伺服器 {OMS_SERVER}" if OMS_SERVER else ""))
         self.root.geometry("1280x900") 
         self.var_shop_name = tk.StringVar(value="商店名稱") # 預設名稱
         self.var_sales_edit_search = tk.StringVar()
-        self.file_lock = threading.RLock() # 建立一個全域執行緒鎖 互斥鎖 (Lock)：防止多個線程同時動同一個檔案。
+        # 全域讀寫鎖：讀取可同時進行，存檔 (寫入) 才獨佔；`with self.file_lock:` 仍為獨佔鎖
+        self.file_lock = ReadWriteLock("file")
+        # 全域背景工作執行器：I/O 用執行緒池、重度運算用行程池，結果由單一 root.after 幫浦送回 UI
+        self.executor = TaskExecutor(self.root)
+        self._analysis_version = 0
+        # 伺服器用戶端 (None = 單機模式，直接讀寫本機活頁簿)
+        self.oms_client = OmsClient(OMS_SERVER) if OMS_SERVER else None
+        if self.oms_client is not None:
+            print(f"system: running as client of order server {self.oms_client.base_url}")
 
         try:
             self.root.iconbitmap(resource_path("main.ico"))
@@ -472,6 +701,16 @@ class SalesApp:
         self.setup_fonts(self.default_font_size)
 
         self.drive_manager = GoogleDriveSync()
+        self.backup_config = load_backup_config(BACKUP_CONFIG_FILE)
+        self.snapshot_store = None   # 本機快照庫 (第一次存檔時才載入)
+        # 自動備份：存檔 N 次或閒置 M 分鐘後，從活頁簿複本在背景上傳
+        self.auto_backup = AutoBackupScheduler(self._run_backup_job, self.executor, self.root.after,
+                                               on_status=self._on_backup_status,
+                                               is_ready=lambda: self.is_vip and self.get_backup_target().is_ready())
+        self.auto_backup.last_success = self.backup_config["last_success"]
+        self.auto_backup.configure(self.backup_config["auto_enabled"], self.backup_config["auto_writes"],
+                                   self.backup_config["auto_idle_minutes"])
+        self.auto_backup.start()
 
         # --- 變數初始化 ---
         self.var_add_weight = tk.DoubleVar(value=1.0) # 新增商品權重用
@@ -581,15 +820,22 @@ class SalesApp:
         self.var_add_price = tk.DoubleVar(value=0.0)
         self.var_upd_price = tk.DoubleVar(value=0.0)
 
+        # 虛擬列表登記表 (Treeview 路徑 -> VirtualTreeview)，供 sort_tree_column 判斷
+        self.virtual_tables = {}
 
 
-        self.check_excel_file()
-        self.products_df = self.load_products()
+        # --- 啟動耗時紀錄 (分頁改為首次點選才建立，歷史資料於背景載入) ---
+        self.startup_timings = []
+        self.built_tabs = set()
+
+        self._timed_phase("check_excel_file", self.check_excel_file)
+        self.products_df = self._timed_phase("load_products", self.load_products)
         self.is_vip = False # 預設不是 VIP
-        self.load_system_settings()
-        self.create_tabs()
+        self._timed_phase("load_system_settings", self.load_system_settings)
+        self._timed_phase("create_tabs", self.create_tabs)
          # 啟動時自動檢查授權
-        self.check_license_on_startup()
+        self._timed_phase("check_license", self.check_license_on_startup)
+        self.log_startup_timings()
 
 
         self.var_sel_sku = tk.StringVar() # 用於暫存銷售頁面選中商品的編號
@@ -660,7 +906,7 @@ class SalesApp:
             print(f"system: failed to update font size: {e}")
 
 
-    @thread_safe_file
+    @thread_safe_read
     def load_system_settings(self):
         """ 強化版：載入店名與所有評估參數 (全面防禦 NaN 錯誤) """
         try:
@@ -744,90 +990,67 @@ class SalesApp:
 
     @thread_safe_file
     def check_excel_file(self):
-        """ 強化版：自動校準 Excel 結構，防止誤刪與誤覆蓋 """
-        # --- 1. 定義最新版本的欄位結構 ---
-        REQUIRED_STRUCTURE = {
-            SHEET_SALES: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
-                          "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
-                          "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
-            
-            SHEET_TRACKING: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
-                             "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
-                             "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
-
-            SHEET_PURCHASES: ["進貨單號", "採購日期", "入庫日期", "供應商", "物流狀態", 
-                              "商品名稱", "數量", "原始預計數量", "瑕疵數量", "進貨單價", 
-                              "進貨總額", "進項稅額", "分攤運費", "海關稅金", "賣家交付日期", "備註"],
-
-            SHEET_AFTER_SALES: ["訂單編號", "商品名稱", "發生日期", "處理類型", "支出金額", "詳細說明"],
-
-
-            SHEET_PUR_TRACKING: ["進貨單號", "採購日期", "入庫日期", "供應商", "物流狀態", 
-                                 "商品名稱", "數量", "原始預計數量", "瑕疵數量", "進貨單價", 
-                                 "進貨總額", "進項稅額", "分攤運費", "海關稅金", "賣家交付日期", "備註"],
-
-            SHEET_VENDORS: ["廠商名稱", "通路", "統編", "聯絡人", "電話", "地址", "備註", 
-                            "平均前置天數", "總到貨率", "總合格率", "綜合評等分數", "星等", "最後更新"],
-
-            SHEET_PRODUCTS: ["商品編號", "分類Tag", "商品名稱", "預設成本", "預設售價", "目前庫存", 
-                             "最後更新時間", "初始上架時間", "最後進貨時間", "安全庫存", 
-                             "商品連結", "商品備註", "單位權重"],
-
-            SHEET_RETURNS: ["訂單編號", "日期", "買家名稱", "交易平台", "寄送方式", "取貨地點", 
-                            "商品名稱", "數量", "單價(售)", "單價(進)", "總銷售額", "總成本", 
-                            "分攤手續費", "扣費項目", "總淨利", "毛利率", "稅額"],
-
-            SHEET_FEES: ["設定名稱", "費率百分比", "固定金額"],
-
-            SHEET_SYS_SETTINGS: ["設定名稱", "參數值"] # 改成 Key-Value 格式
-        }
-
+        """
+        強化版：自動校準 Excel 結構，防止誤刪與誤覆蓋
+        1. 結構版本 (SCHEMA_VERSION) 相符時直接略過檢查。
+        2. 只讀取各分頁的標題列 (openpyxl 唯讀模式)，不載入資料列。
+        3. 只有真的缺欄位的分頁才整頁讀入並補欄位 (逐表遷移)。
+        """
         updates_needed = {} # 記錄需要更新或建立的分頁
 
-        # --- 2. 檢查檔案是否存在，並執行補位邏輯 ---
+        # --- 1. 檢查檔案是否存在，並執行補位邏輯 ---
         if not os.path.exists(FILE_NAME):
             # 檔案不存在：建立全新結構
             for sheet, cols in REQUIRED_STRUCTURE.items():
                 updates_needed[sheet] = pd.DataFrame(columns=cols)
+            updates_needed[SHEET_SYS_SETTINGS] = pd.DataFrame(
+                [["SCHEMA_VERSION", SCHEMA_VERSION]], columns=REQUIRED_STRUCTURE[SHEET_SYS_SETTINGS])
             print("system detected new environment: creating fresh database...")
         else:
-            # 檔案已存在：掃描每一頁，檢查是否缺漏
             try:
-                with pd.ExcelFile(FILE_NAME) as xls:
-                    existing_sheets = xls.sheet_names
-                    
-                    for sheet, req_cols in REQUIRED_STRUCTURE.items():
-                        if sheet in existing_sheets:
-                            # 分頁存在：檢查是否缺欄位
-                            df_current = pd.read_excel(xls, sheet_name=sheet)
-                            missing_cols = [c for c in req_cols if c not in df_current.columns]
-                            
-                            if missing_cols:
-                                for c in missing_cols:
-                                    # 根據欄位名稱賦予適當預設值
-                                    if c == "單位權重":
-                                        df_current[c] = 1.0
-                                    elif "數量" in c or "率" in c or "分數" in c:
-                                        df_current[c] = 0
-                                    elif "金額" in c or "單價" in c or "成本" in c:
-                                        df_current[c] = 0.0
-                                    else:
-                                        df_current[c] = ""
-                                
-                                # 為了防止誤刪除，我們要確保欄位順序對齊最新定義
-                                df_current = df_current[req_cols]
-                                updates_needed[sheet] = df_current
-                                print(f"system: sheet [{sheet}] automatically filled missing columns: {missing_cols}")
-                        else:
-                            # 分頁不存在：建立該分頁
-                            updates_needed[sheet] = pd.DataFrame(columns=req_cols)
-                            print(f"file update: automatically created missing sheet [{sheet}]")
-                            
+                headers, stored_version = self._read_workbook_headers()
+            except Exception as e:
+                messagebox.showerror("掃描失敗", f"讀取 Excel 時出錯: {e}")
+                return
+
+            if stored_version == SCHEMA_VERSION and all(sn in headers for sn in REQUIRED_STRUCTURE):
+                return
+
+            # 版本不符：逐頁比對標題列
+            try:
+                for sheet, req_cols in REQUIRED_STRUCTURE.items():
+                    if sheet not in headers:
+                        # 分頁不存在：建立該分頁
+                        updates_needed[sheet] = pd.DataFrame(columns=req_cols)
+                        print(f"file update: automatically created missing sheet [{sheet}]")
+                        continue
+
+                    missing_cols = [c for c in req_cols if c not in headers[sheet]]
+                    if missing_cols:
+                        # 只有缺欄位的分頁才整頁讀入
+                        df_current = pd.read_excel(FILE_NAME, sheet_name=sheet)
+                        updates_needed[sheet] = self._fill_missing_columns(df_current, req_cols)
+                        print(f"system: sheet [{sheet}] automatically filled missing columns: {missing_cols}")
             except Exception as e:
                 messagebox.showerror("掃描失敗", f"讀取 Excel 時出錯: {e}")
                 return
 
-        # --- 3. 執行「安全存檔」：利用萬用引擎保護所有既有資料 ---
+            # 記錄結構版本，下次啟動即可略過檢查
+            if SHEET_SYS_SETTINGS in updates_needed and not updates_needed[SHEET_SYS_SETTINGS].empty:
+                df_sys = updates_needed[SHEET_SYS_SETTINGS]
+            elif SHEET_SYS_SETTINGS in headers:
+                df_sys = pd.read_excel(FILE_NAME, sheet_name=SHEET_SYS_SETTINGS)
+            else:
+                df_sys = pd.DataFrame(columns=REQUIRED_STRUCTURE[SHEET_SYS_SETTINGS])
+            mask = df_sys['設定名稱'].astype(str) == "SCHEMA_VERSION"
+            if mask.any():
+                df_sys.loc[mask, '參數值'] = SCHEMA_VERSION
+            else:
+                df_sys = pd.concat([df_sys, pd.DataFrame([["SCHEMA_VERSION", SCHEMA_VERSION]],
+                                                         columns=["設定名稱", "參數值"])], ignore_index=True)
+            updates_needed[SHEET_SYS_SETTINGS] = df_sys
+
+        # --- 2. 執行「安全存檔」：利用萬用引擎保護所有既有資料 ---
         if updates_needed:
             # 呼叫妳寫好的 _universal_save，它會讀取所有頁面，覆蓋有變動的頁面，最後寫回
             # 這樣可以 100% 確保沒被改動的頁面（例如妳沒去動的銷售紀錄）不會消失
@@ -835,15 +1058,62 @@ class SalesApp:
             if save_success:
                 print("Excel data structure calibrated successfully.")
 
+    def _read_workbook_headers(self):
+        """
+        以 openpyxl 唯讀模式讀取：各分頁標題列 + 系統設定中的 SCHEMA_VERSION。
+        回傳 ({分頁: [欄位...]}, 版本字串或 None)
+        """
+        from openpyxl import load_workbook
+
+        wb = load_workbook(FILE_NAME, read_only=True)
+        try:
+            headers = {}
+            positions = {}      # 分頁 -> {欄位: 實際欄位位置}；空白標題不可讓後面的欄位位置前移
+            for ws in wb.worksheets:
+                first_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+                cells = [(i, str(c)) for i, c in enumerate(first_row) if c is not None]
+                headers[ws.title] = [c for _, c in cells]
+                positions[ws.title] = {c: i for i, c in reversed(cells)}
+
+            stored_version = None
+            cfg_pos = positions.get(SHEET_SYS_SETTINGS, {})
+            if "設定名稱" in cfg_pos and "參數值" in cfg_pos:
+                k_idx, v_idx = cfg_pos["設定名稱"], cfg_pos["參數值"]
+                for row in wb[SHEET_SYS_SETTINGS].iter_rows(min_row=2, values_only=True):
+                    if len(row) > max(k_idx, v_idx) and str(row[k_idx]) == "SCHEMA_VERSION":
+                        stored_version = str(row[v_idx])
+                        break
+            return headers, stored_version
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _fill_missing_columns(df_current, req_cols):
+        """ 依欄位名稱補上預設值，並將欄位順序對齊最新定義 """
+        for c in req_cols:
+            if c in df_current.columns:
+                continue
+            # 根據欄位名稱賦予適當預設值
+            if c == "單位權重":
+                df_current[c] = 1.0
+            elif "數量" in c or "率" in c or "分數" in c:
+                df_current[c] = 0
+            elif "金額" in c or "單價" in c or "成本" in c:
+                df_current[c] = 0.0
+            else:
+                df_current[c] = ""
+        # 為了防止誤刪除，我們要確保欄位順序對齊最新定義
+        return df_current[req_cols]
+
 
                 
-    @thread_safe_file
+    @thread_safe_read
     def load_products(self):
         try:
-            if not os.path.exists(FILE_NAME):
+            if self.oms_client is None and not os.path.exists(FILE_NAME):
                 return pd.DataFrame(columns=["商品編號", "分類Tag", "商品名稱", "預設成本", "目前庫存", "最後更新時間"])
             
-            df = pd.read_excel(FILE_NAME, sheet_name=SHEET_PRODUCTS)
+            df = self._read_sheet(SHEET_PRODUCTS)
 
             # 確保售價欄位存在並清理
             if "預設售價" in df.columns:
@@ -923,20 +1193,82 @@ class SalesApp:
 
         
         tab_control.pack(expand=1, fill="both")
-        
-        self.setup_purchase_tab()
-        self.setup_pur_tracking_tab()
-        self.setup_vendor_tab()
-        self.setup_sales_tab()
-        self.setup_tracking_tab()
-        self.setup_returns_tab()
-        self.setup_sales_edit_tab()
-        self.setup_product_tab()
-        self.setup_analysis_tab()
-        self.setup_procurement_tab() 
-        self.setup_backup_tab() 
-        self.setup_about_tab()  
-        self.setup_about_us_tab()
+        self.tab_control = tab_control
+
+        # 分頁延遲建立：只登記建構函式，第一次被選取時才真正繪製
+        self.tab_builders = {
+            'tab_purchase': self.setup_purchase_tab,
+            'tab_pur_tracking': self.setup_pur_tracking_tab,
+            'tab_vendors': self.setup_vendor_tab,
+            'tab_sales': self.setup_sales_tab,
+            'tab_tracking': self.setup_tracking_tab,
+            'tab_returns': self.setup_returns_tab,
+            'tab_sales_edit': self.setup_sales_edit_tab,
+            'tab_products': self.setup_product_tab,
+            'tab_analysis': self.setup_analysis_tab,
+            'tab_procurement': self.setup_procurement_tab,
+            'tab_backup': self.setup_backup_tab,
+            'tab_about': self.setup_about_tab,
+            'tab_about_us': self.setup_about_us_tab,
+        }
+        tab_control.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+        # 只建立目前顯示的分頁
+        self.on_tab_changed()
+
+    def on_tab_changed(self, event=None):
+        """ 分頁切換：第一次進入時才建立該分頁 """
+        current = self.tab_control.nametowidget(self.tab_control.select())
+        for tab_attr in self.tab_builders:
+            if getattr(self, tab_attr) is current:
+                self.ensure_tab_built(tab_attr)
+                break
+
+    def ensure_tab_built(self, tab_attr):
+        """ 確保分頁已建立 (供跨分頁操作在填資料前呼叫) """
+        if tab_attr in self.built_tabs:
+            return
+        # 先標記，避免建構過程中的刷新呼叫被 requires_tab 擋下
+        self.built_tabs.add(tab_attr)
+        t0 = time.perf_counter()
+        self.tab_builders[tab_attr]()
+        print(f"system: tab {tab_attr} built in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    def is_tab_built(self, tab_attr):
+        return tab_attr in getattr(self, 'built_tabs', ())
+
+    def _timed_phase(self, name, func, *args):
+        """ 執行啟動階段並紀錄耗時 """
+        t0 = time.perf_counter()
+        result = func(*args)
+        self.startup_timings.append((name, time.perf_counter() - t0))
+        return result
+
+    def log_startup_timings(self):
+        """ 輸出啟動耗時明細 """
+        total = sum(cost for _, cost in self.startup_timings)
+        print(f"system: startup finished in {total * 1000:.1f} ms")
+        for name, cost in self.startup_timings:
+            print(f"system:   {name:<22}{cost * 1000:>9.1f} ms")
+
+    def load_in_background(self, name, reader, apply, version=None):
+        """
+        背景執行緒讀檔，完成後回到主執行緒更新介面 (避免大型歷史分頁卡住畫面)。
+        version: 回傳資料版本的函式；若讀檔期間前景已重新載入，就丟棄這份較舊的結果。
+        """
+        start_version = version() if version else None
+        task = self.executor.submit(
+            reader, name=name,
+            on_done=lambda result: self._apply_background_load(name, apply, result, task.run_time, version, start_version),
+            on_error=lambda e: print(f"system: background load failed ({name}): {e}"))
+        return task
+
+    def _apply_background_load(self, name, apply, result, cost, version, start_version):
+        if version and version() != start_version:
+            print(f"system: {name} background result discarded (newer data already loaded)")
+            return
+        apply(result)
+        print(f"system: {name} loaded in background ({cost * 1000:.1f} ms)")
 
 
     
@@ -1190,6 +1522,7 @@ class SalesApp:
                     self.pur_cart_data[idx+1], self.pur_cart_data[idx]
 
 
+    @requires_tab('tab_purchase')
     def update_pur_prod_list(self):
         """ 初始化/重新載入進貨商品清單 (加入防禦性檢查) """
         # --- 核心修正：檢查元件是否已建立 ---
@@ -1211,7 +1544,8 @@ class SalesApp:
                 # 插入顯示格式：[編號] 商品名稱
                 self.list_pur_prod.insert(tk.END, f"{sku_display}{p_name}")
 
-    @thread_safe_file
+    @requires_tab('tab_purchase')
+    @thread_safe_read
     def update_pur_supplier_list(self, event=None):
         """ 進貨管理分頁：搜尋廠商清單 (加入防禦檢查) """
         # --- 核心修正：檢查 list_pur_v 是否已經建立 ---
@@ -1382,7 +1716,8 @@ class SalesApp:
             
         print("system: removed item from temporary list")
 
-    @thread_safe_file
+    @requires_tab('tab_pur_tracking')
+    @thread_safe_read
     def load_purchase_tracking(self):
         """ 
         載入追蹤清單：
@@ -1394,9 +1729,9 @@ class SalesApp:
             self.tree_pur_track.delete(i)
             
         try:
-            if not os.path.exists(FILE_NAME):
+            if self.oms_client is None and not os.path.exists(FILE_NAME):
                 return
-            df = pd.read_excel(FILE_NAME, sheet_name=SHEET_PUR_TRACKING)
+            df = self._read_sheet(SHEET_PUR_TRACKING)
             
             if df.empty: 
                 return
@@ -1486,6 +1821,7 @@ class SalesApp:
         ttk.Button(btn_ctrl, text="↩️ 撤銷/還原上一步",command=self.action_perform_undo).pack(side="left", padx=5)
         ttk.Button(btn_ctrl, text="🔖 標記遺失/取消進貨", command=self.action_cancel_purchase).pack(side="left", padx=5)
         ttk.Button(btn_ctrl, text="📦 確認收貨入庫", command=self.action_confirm_inbound).pack(side="left", padx=5)
+        ttk.Button(btn_ctrl, text="📡 自動更新物流", command=self.action_poll_carriers).pack(side="left", padx=5)
 
 
 
@@ -1505,6 +1841,44 @@ class SalesApp:
         """ 將在途貨物抓回採購單頁面 """
         RecallManager.recall_purchase_order(self)
 
+    def action_poll_carriers(self):
+        """ 在途物流單號於背景一次併發查詢各物流商，完成後批次寫回階段與時間欄位 """
+        if self.oms_client is not None:
+            messagebox.showwarning("伺服器模式", "此功能需在伺服器主機上以單機模式操作。")
+            return
+        import CarrierTracker
+        adapters = CarrierTracker.load_adapters(CARRIER_CONFIG)
+        if not adapters:
+            messagebox.showinfo("提示", f"尚未設定物流商查詢介面。\n請建立 {os.path.basename(CARRIER_CONFIG)} 後再試。")
+            return
+        self.executor.submit(self._run_poll_carriers, adapters, name="carrier_poll",
+                             on_done=lambda res: self._apply_carrier_results(*res),
+                             on_error=lambda e: messagebox.showerror("錯誤", f"物流查詢失敗: {e}"))
+
+    def _run_poll_carriers(self, adapters):
+        """ 背景執行緒：讀取在途單號並查詢 (不持有檔案鎖，HTTP 於 CarrierPoller 的執行緒池進行) """
+        import CarrierTracker
+        numbers = CarrierTracker.in_transit_numbers(self._read_sheet(SHEET_PUR_TRACKING))
+        cache = CarrierTracker.TrackingCache(TRACKING_CACHE_FILE)
+        cache.prune(numbers)
+        poller = CarrierTracker.CarrierPoller(adapters, cache)
+        return poller.poll_sync(numbers), poller.stats
+
+    @thread_safe_file
+    def _apply_carrier_results(self, results, stats):
+        """ 主執行緒：查詢結果只讓階段前進、只補空白時間欄位，兩個分頁一次存檔 """
+        import oms_core
+        print(f"system: carrier poll {stats}")
+        with pd.ExcelFile(FILE_NAME) as xls:
+            df_track = pd.read_excel(xls, sheet_name=SHEET_PUR_TRACKING)
+            df_hist = pd.read_excel(xls, sheet_name=SHEET_PURCHASES)
+        df_track, df_hist, n = oms_core.advance_logistics(df_track, df_hist, results,
+                                                          datetime.now().strftime("%Y-%m-%d"))
+        if n and self._universal_save({SHEET_PUR_TRACKING: df_track, SHEET_PURCHASES: df_hist}):
+            self.load_purchase_tracking()
+        messagebox.showinfo("物流更新", f"查詢 {len(results)} 筆物流單號，更新 {n} 項進貨商品。"
+                                     + (f"\n查詢失敗 {stats['errors']} 筆。" if stats.get('errors') else ""))
+
 
 
 
@@ -1629,6 +2003,7 @@ class SalesApp:
         self.update_vendor_list()
 
 
+    @requires_tab('tab_vendors')
     def refresh_vendor_management_ui(self):
         """ 根據開關，動態隱藏或顯示廠商管理的績效區塊 """
         if not hasattr(self, 'perf_frame'):
@@ -1642,7 +2017,8 @@ class SalesApp:
             self.perf_frame.grid_remove()
 
 
-    @thread_safe_file
+    @requires_tab('tab_vendors')
+    @thread_safe_read
     def update_vendor_list(self):
         """ 刷新廠商清單 """
         self.list_vendors.delete(0, tk.END)
@@ -1657,7 +2033,7 @@ class SalesApp:
         except Exception:
             pass
 
-    @thread_safe_file
+    @thread_safe_read
     def on_vendor_select(self, event):
         """ 當點選廠商清單時，將詳情填入左側，並即時運算績效評分 """
         sel = self.list_vendors.curselection()
@@ -1704,7 +2080,7 @@ class SalesApp:
             print(f"system: failed to load vendor details: {e}")
 
 
-    @thread_safe_file
+    @thread_safe_read
     def refresh_vendor_live_score(self, vendor_name):
         """ 
         V5.2 修正版：對接新版物流節點欄位 (解決 0d 問題)
@@ -1948,25 +2324,20 @@ class SalesApp:
     def open_vendor_import_wizard(self):
         """ 開啟廠商匯入精靈 """
         from VendorImportWizard import VendorImportWizard # 假設檔案名
-        VendorImportWizard(self.root, self.callback_vendor_import)
+        VendorImportWizard(self.root, self.callback_vendor_import, self.executor)
 
 
-    @thread_safe_file
-    def callback_vendor_import(self, new_data_list):
-        """ 處理匯入後的廠商資料合併 """
+    def callback_vendor_import(self, new_data_list, policies=None):
+        """ 處理匯入後的廠商資料合併 (以「廠商名稱」為主鍵增量更新) """
+        from UpsertEngine import VENDOR_POLICIES
         try:
             df_new = pd.DataFrame(new_data_list)
-            
-            # 讀取現有廠商
-            with pd.ExcelFile(FILE_NAME) as xls:
-                df_old = pd.read_excel(xls, sheet_name=SHEET_VENDORS)
+            if df_new.empty:
+                return False
 
-            # 合併，以「廠商名稱」為準去重
-            df_combined = pd.concat([df_old, df_new], ignore_index=True)
-            df_combined.drop_duplicates(subset=['廠商名稱'], keep='last', inplace=True)
-            
-            # 存檔
-            if self._universal_save({SHEET_VENDORS: df_combined}):
+            # 先試算差異，確認後才寫入
+            policies = {**VENDOR_POLICIES, **(policies or {})}
+            if self._upsert_sheet(SHEET_VENDORS, df_new, ["廠商名稱"], policies, "廠商"):
                 self.update_vendor_list()
                 return True
             return False
@@ -1974,6 +2345,40 @@ class SalesApp:
             messagebox.showerror("匯入失敗", f"錯誤: {e}")
             return False
 
+    def _upsert_sheet(self, sheet, df_new, keys, policies, label):
+        """
+        試算 → 確認 → 寫入；確認視窗開著時不持有檔案鎖 (避免背景存檔與備份卡住)。
+        取得寫入鎖後重新讀取並合併，若差異與使用者確認的不同 (期間有其他寫入) 則放棄，回傳是否已存檔
+        """
+        from UpsertEngine import upsert
+        with self.file_lock.read():
+            with pd.ExcelFile(FILE_NAME) as xls:
+                df_old = pd.read_excel(xls, sheet_name=sheet)
+        _, preview = upsert(df_old, df_new, keys, policies, dry_run=True)
+        if not self._confirm_upsert(preview, policies, label):
+            return False
+
+        counts = ("inserted", "updated", "unchanged", "cell_changes", "columns")
+        with self.file_lock:
+            with pd.ExcelFile(FILE_NAME) as xls:
+                df_old = pd.read_excel(xls, sheet_name=sheet)
+            df_merged, summary = upsert(df_old, df_new, keys, policies)
+            changed = any(summary[k] != preview[k] for k in counts)
+            if not changed:
+                return self._universal_save({sheet: df_merged})
+        print(f"system: {label} import aborted, data changed while confirming")
+        messagebox.showwarning("資料已變更", f"確認期間{label}資料已被其他操作修改，差異與預覽不同。\n請重新執行匯入。")
+        return False
+
+    def _confirm_upsert(self, summary, policies, label):
+        """ 顯示匯入差異摘要 (dry-run)，回傳使用者是否確認寫入 """
+        from UpsertEngine import format_summary
+        if summary["inserted"] == 0 and summary["updated"] == 0:
+            messagebox.showinfo("匯入預覽", f"匯入的{label}資料與現有內容相同，無需寫入。")
+            return False
+        print(f"system: {label}匯入試算 新增 {summary['inserted']} / 更新 {summary['updated']} / 無變動 {summary['unchanged']}")
+        return messagebox.askyesno("匯入預覽 (尚未寫入)", format_summary(summary, policies) + "\n\n確定寫入嗎？")
+
 
 
 
@@ -2053,164 +2458,78 @@ class SalesApp:
         self.calculate_analysis_data()
 
 
-    @thread_safe_file
+    @requires_tab('tab_analysis')
     def calculate_analysis_data(self):
-        """ 營收分析 V6.0:實作主子表分離運算 (原始帳目保護 + 售後支出對沖) """
+        """ 營收分析 V6.0:實作主子表分離運算 (原始帳目保護 + 售後支出對沖)；運算於背景行程執行 """
         if not hasattr(self, 'tree_time_stats') or not hasattr(self, 'tree_prod_stats'):
             return
-        
+        if not os.path.exists(FILE_NAME): 
+            return
+
+        # 連續觸發時只採用最後一次的結果
+        self._analysis_version += 1
+        version = self._analysis_version
+        self.executor.submit(self._run_analysis, self.var_prod_sort_by.get(), name="analysis",
+                             on_done=lambda result: self._apply_analysis(result, version),
+                             on_error=lambda e: print(f"system: analysis failed: {e}"))
+
+    def _run_analysis(self, sort_mode):
+        """ 背景執行緒：只在複製活頁簿時持有讀取鎖，行程池運算期間不擋住寫入 """
+        from oms_core.analysis import compute_analysis
+        work = tempfile.mkdtemp(prefix="oms_analysis_")
+        try:
+            copy_path = os.path.join(work, os.path.basename(FILE_NAME))
+            with self.file_lock.read():
+                shutil.copy2(FILE_NAME, copy_path)
+            return self.executor.run_cpu(compute_analysis, copy_path, SHEET_SALES, SHEET_PRODUCTS,
+                                         self.SHEET_AFTER_SALES, sort_mode)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def _apply_analysis(self, result, version):
+        if version != self._analysis_version:
+            return
         for i in self.tree_time_stats.get_children(): 
             self.tree_time_stats.delete(i)
         for i in self.tree_prod_stats.get_children(): 
             self.tree_prod_stats.delete(i)
-        
-        if not os.path.exists(FILE_NAME): 
+        if result is None:
             return
 
-        try:
-            # --- [第一階段：處理售後子表數據] ---
-            as_month_map = {} # 月份 -> 總支出
-            as_date_map = {}  # 日期 -> 總支出
-            as_prod_map = {}  # 商品名 -> 總支出
-
-            with pd.ExcelFile(FILE_NAME) as xls:
-                if self.SHEET_AFTER_SALES in xls.sheet_names:
-                    df_as = pd.read_excel(xls, sheet_name=self.SHEET_AFTER_SALES)
-                    if not df_as.empty:
-                        df_as['發生日期'] = pd.to_datetime(df_as['發生日期'], errors='coerce')
-                        df_as = df_as.dropna(subset=['發生日期'])
-                        df_as['月份'] = df_as['發生日期'].dt.strftime('%Y-%m')
-                        df_as['日期字串'] = df_as['發生日期'].dt.strftime('%Y-%m-%d')
-                        
-                        # 建立快速查找表
-                        as_month_map = df_as.groupby('月份')['支出金額'].sum().to_dict()
-                        as_date_map = df_as.groupby('日期字串')['支出金額'].sum().to_dict()
-                        as_prod_map = df_as.groupby('商品名稱')['支出金額'].sum().to_dict()
-
-            # --- [第二階段：處理原始銷售數據] ---
-            with pd.ExcelFile(FILE_NAME) as xls:
-                df_sales = pd.read_excel(xls, sheet_name=SHEET_SALES)
-                df_prods = pd.read_excel(xls, sheet_name=SHEET_PRODUCTS)
-
-            if df_sales.empty: 
-                return
-
-            df_sales = df_sales.replace(r'^\s*$', pd.NA, regex=True)
-            fill_cols = ['訂單編號', '日期', '買家名稱', '交易平台']
-            for col in fill_cols:
-                if col in df_sales.columns: 
-                    df_sales[col] = df_sales[col].ffill()
-
-            df_sales = df_sales.dropna(subset=['商品名稱'])
-            df_sales['日期'] = pd.to_datetime(df_sales['日期'], errors='coerce')
-            
-            # --- [第三階段：計算左側時間維度統計] ---
-            df_time = df_sales.dropna(subset=['日期']).copy()
-            if not df_time.empty:
-                df_time['月份'] = df_time['日期'].dt.strftime('%Y-%m')
-                
-                # A. 月份統計
-                monthly_list = []
-                for month, group in df_time.groupby('月份', sort=False):
-                    m_sales = Decimal("0.00")
-                    m_raw_profit = Decimal("0.00")
-                    for _, r in group.iterrows():
-                        m_sales += Decimal(str(r.get('總銷售額', 0)))
-                        m_raw_profit += Decimal(str(r.get('總淨利', 0)))
-                    
-                    # 【核心修正】：實質淨利 = 原始淨利 - 該月售後支出
-                    m_after_loss = Decimal(str(as_month_map.get(month, 0)))
-                    m_final_profit = m_raw_profit - m_after_loss
-                    
-                    monthly_list.append({
-                        'month': month, 'sales': m_sales, 'profit': m_final_profit,
-                        'count': group['訂單編號'].nunique()
-                    })
-                
-                monthly_list.sort(key=lambda x: x['month'], reverse=True)
-
-                if monthly_list:
-                    curr = monthly_list[0]
-                    self.lbl_month_sales.config(text=f"本月({curr['month']}) 營收: ${float(curr['sales']):,.2f}")
-                    self.lbl_month_profit.config(text=f"本月({curr['month']}) 實質淨利: ${float(curr['profit']):,.2f}")
-
-                for m in monthly_list:
-                    self.tree_time_stats.insert("", "end", values=(
-                        f"{m['month']} (月)", f"${float(m['sales']):,.2f}", 
-                        f"${float(m['profit']):,.2f}", f"{int(m['count'])} 單"
-                    ))
-
-                self.tree_time_stats.insert("", "end", values=("--- 近10日明細 ---", "", "", ""))
-
-                # B. 每日明細
-                df_time['日期字串'] = df_time['日期'].dt.strftime('%Y-%m-%d')
-                daily_list = []
-                for d_str, group in df_time.groupby('日期字串', sort=False):
-                    d_sales = Decimal("0.00")
-                    d_raw_profit = Decimal("0.00")
-                    for _, r in group.iterrows():
-                        d_sales += Decimal(str(r.get('總銷售額', 0)))
-                        d_raw_profit += Decimal(str(r.get('總淨利', 0)))
-                    
-                    # 扣除該日售後支出
-                    d_after_loss = Decimal(str(as_date_map.get(d_str, 0)))
-                    d_final_profit = d_raw_profit - d_after_loss
-                    daily_list.append((d_str, d_sales, d_final_profit, group['訂單編號'].nunique()))
-
-                daily_list.sort(key=lambda x: x[0], reverse=True)
-                for d in daily_list[:10]:
-                    self.tree_time_stats.insert("", "end", values=(
-                        d[0], f"${float(d[1]):,.2f}", f"${float(d[2]):,.2f}", f"{int(d[3])} 單"
-                    ))
-
-            # --- [第四階段：計算右側商品排行榜] ---
-            # 排行榜需要算出每個商品的平均毛利，同樣要扣除售後支出
-            df_sales['銷額_D'] = df_sales['總銷售額'].apply(lambda x: Decimal(str(x)))
-            df_sales['淨利_D'] = df_sales['總淨利'].apply(lambda x: Decimal(str(x)))
-            
-            prod_summary = []
-            for p_name, group in df_sales.groupby('商品名稱'):
-                total_p_qty = group['數量'].sum()
-                total_p_sales = group['銷額_D'].sum()
-                total_p_raw_profit = group['淨利_D'].sum()
-                
-                # 【核心修正】：扣除該商品的累積售後支出
-                p_after_loss = Decimal(str(as_prod_map.get(p_name, 0)))
-                total_p_final_profit = total_p_raw_profit - p_after_loss
-                
-                avg_margin = (total_p_final_profit / total_p_sales * 100) if total_p_sales > 0 else Decimal("0")
-                
-                # 計算速度 (Velocity)
-                st_date = pd.to_datetime(df_prods.set_index('商品名稱').at[p_name, '初始上架時間'] if p_name in df_prods['商品名稱'].values else None, errors='coerce')
-                if pd.isna(st_date): 
-                    st_date = group['日期'].min()
-                days = max(((pd.Timestamp.now() - st_date).days), 1)
-                velocity = float(total_p_qty) / days
-                
-                prod_summary.append({
-                    'name': p_name, 'margin': avg_margin, 'profit': total_p_final_profit,
-                    'qty': total_p_qty, 'velocity': velocity
-                })
+        if result["monthly"]:
+            month, sales, profit, _ = result["monthly"][0]
+            self.lbl_month_sales.config(text=f"本月({month}) 營收: ${float(sales):,.2f}")
+            self.lbl_month_profit.config(text=f"本月({month}) 實質淨利: ${float(profit):,.2f}")
 
-            # 排序邏輯
-            sort_mode = self.var_prod_sort_by.get()
-            s_map = {"平均毛利率": 'margin', "總銷量排行": 'qty', "總獲利排行": 'profit', "銷售速度排行": 'velocity'}
-            prod_summary.sort(key=lambda x: x[s_map.get(sort_mode, 'profit')], reverse=True)
+            for month, sales, profit, count in result["monthly"]:
+                self.tree_time_stats.insert("", "end", values=(
+                    f"{month} (月)", f"${float(sales):,.2f}", 
+                    f"${float(profit):,.2f}", f"{int(count)} 單"
+                ))
 
-            for item in prod_summary:
-                self.tree_prod_stats.insert("", "end", values=(
-                    item['name'], f"{float(item['margin']):.1f}%", 
-                    f"${float(item['profit']):,.2f}", int(item['qty']), 
-                    f"{round(item['velocity'], 2)} 件/日"
+            self.tree_time_stats.insert("", "end", values=("--- 近10日明細 ---", "", "", ""))
+            for d_str, sales, profit, count in result["daily"]:
+                self.tree_time_stats.insert("", "end", values=(
+                    d_str, f"${float(sales):,.2f}", f"${float(profit):,.2f}", f"{int(count)} 單"
                 ))
 
-        except Exception :
-            import traceback
-            traceback.print_exc()
+        for item in result["products"]:
+            self.tree_prod_stats.insert("", "end", values=(
+                item['name'], f"{float(item['margin']):.1f}%", 
+                f"${float(item['profit']):,.2f}", int(item['qty']), 
+                f"{round(item['velocity'], 2)} 件/日"
+            ))
 
             
     def sort_tree_column(self, tree, col, reverse):
         """(進階功能) 點擊標題可以排序"""
+        # 虛擬列表：直接在資料層排序完整資料集，不把所有列搬進 Tk
+        vt = self.virtual_tables.get(str(tree))
+        if vt is not None:
+            vt.sort_by(col, reverse)
+            tree.heading(col, command=lambda: self.sort_tree_column(tree, col, not reverse))
+            return
+
         title = [(tree.set(k, col), k) for k in tree.get_children('')]
         
         # 嘗試將字串轉數字進行排序 (去除 $ 和 % 符號)
@@ -2335,7 +2654,7 @@ class SalesApp:
         self.update_calc_prod_list()
 
 
-    @thread_safe_file
+    @thread_safe_read
     def generate_procurement_report(self):
         ProcurementManager.generate_report(self)
 
@@ -2446,13 +2765,47 @@ class SalesApp:
         self.btn_login = ttk.Button(auth_frame, text="登入 Google 帳號", command=self.start_login_thread, state="disabled")
         self.btn_login.pack(side="right")
 
+        # 備份目的地與保留份數 (存在本機 backup_config.json)
+        target_frame = ttk.LabelFrame(frame, text="備份目的地與保留設定", padding=15)
+        target_frame.pack(fill="x", pady=10)
+
+        self.var_backup_target = tk.StringVar(value=self.backup_config["target"])
+        self.var_backup_folder = tk.StringVar(value=self.backup_config["local_folder"])
+        self.var_backup_keep = tk.IntVar(value=self.backup_config["keep"])
+
+        ttk.Radiobutton(target_frame, text="Google Drive", variable=self.var_backup_target, value="gdrive",
+                        command=self.save_backup_settings).pack(side="left")
+        ttk.Radiobutton(target_frame, text="本機 / NAS 資料夾:", variable=self.var_backup_target, value="local",
+                        command=self.save_backup_settings).pack(side="left", padx=(15, 5))
+        ttk.Entry(target_frame, textvariable=self.var_backup_folder, width=30).pack(side="left")
+        ttk.Button(target_frame, text="📁", width=3, command=self.choose_backup_folder).pack(side="left", padx=5)
+
+        ttk.Button(target_frame, text="套用", command=self.save_backup_settings).pack(side="right")
+        ttk.Spinbox(target_frame, from_=MIN_KEEP, to=MAX_KEEP, textvariable=self.var_backup_keep, width=5).pack(side="right", padx=5)
+        ttk.Label(target_frame, text="保留份數:").pack(side="right")
+
+        # 自動備份 (存檔 N 次或閒置 M 分鐘後，於背景從活頁簿複本上傳)
+        auto_frame = ttk.Frame(frame)
+        auto_frame.pack(fill="x")
+        self.var_auto_backup = tk.BooleanVar(value=self.backup_config["auto_enabled"])
+        self.var_auto_writes = tk.IntVar(value=self.backup_config["auto_writes"])
+        self.var_auto_idle = tk.IntVar(value=self.backup_config["auto_idle_minutes"])
+        ttk.Checkbutton(auto_frame, text="自動備份：每存檔", variable=self.var_auto_backup,
+                        command=self.save_backup_settings).pack(side="left")
+        ttk.Spinbox(auto_frame, from_=1, to=999, textvariable=self.var_auto_writes, width=4).pack(side="left", padx=3)
+        ttk.Label(auto_frame, text="次，或閒置").pack(side="left")
+        ttk.Spinbox(auto_frame, from_=1, to=1440, textvariable=self.var_auto_idle, width=4).pack(side="left", padx=3)
+        ttk.Label(auto_frame, text="分鐘").pack(side="left")
+        self.lbl_auto_backup = ttk.Label(auto_frame, text=self.auto_backup.status_text(), foreground="gray")
+        self.lbl_auto_backup.pack(side="right")
+
         # 2. 備份操作區塊
-        op_frame = ttk.LabelFrame(frame, text="2. 檔案備份與還原 (自動存入「蝦皮進銷存系統_備份」)", padding=15)
+        op_frame = ttk.LabelFrame(frame, text="2. 檔案備份與還原 (完整 / 差異壓縮備份)", padding=15)
         op_frame.pack(fill="both", expand=True, pady=10)
 
         up_frame = ttk.Frame(op_frame)
         up_frame.pack(fill="x", pady=5)
-        ttk.Label(up_frame, text="將目前的 Excel 檔案備份到雲端 (建議每日執行):").pack(side="left")
+        ttk.Label(up_frame, text="將目前的 Excel 檔案備份到目的地 (建議每日執行):").pack(side="left")
         
         # 【修正點 2】這裡加上 state="disabled"
         self.btn_upload = ttk.Button(up_frame, text="⬆️ 上傳備份", command=self.start_upload_thread, state="disabled")
@@ -2472,6 +2825,31 @@ class SalesApp:
         self.btn_refresh = ttk.Button(op_frame, text="🔄 重新整理列表", command=self.start_list_thread, state="disabled")
         self.btn_refresh.pack(fill="x", pady=5)
 
+        # 本機快照 (不需 VIP：每次存檔自動記錄，可單獨還原任一分頁)
+        snap_frame = ttk.LabelFrame(frame, text="本機快照 (每次存檔自動記錄，可還原任一時間點的分頁)", padding=15)
+        snap_frame.pack(fill="both", expand=True, pady=10)
+
+        self.tree_snapshot = ttk.Treeview(snap_frame, columns=("時間", "變動分頁"), show='headings', height=6)
+        self.tree_snapshot.heading("時間", text="時間")
+        self.tree_snapshot.heading("變動分頁", text="變動分頁")
+        self.tree_snapshot.column("時間", width=160, anchor="center")
+        self.tree_snapshot.column("變動分頁", width=420)
+        self.tree_snapshot.pack(fill="both", expand=True, pady=5)
+
+        snap_btns = ttk.Frame(snap_frame)
+        snap_btns.pack(fill="x")
+        ttk.Label(snap_btns, text="分頁:").pack(side="left")
+        self.var_snapshot_sheet = tk.StringVar()
+        ttk.Combobox(snap_btns, textvariable=self.var_snapshot_sheet, state="readonly", width=14,
+                     values=[SHEET_PRODUCTS, SHEET_SALES, SHEET_TRACKING, SHEET_PURCHASES, SHEET_PUR_TRACKING,
+                             SHEET_RETURNS, SHEET_FEES, SHEET_VENDORS, SHEET_AFTER_SALES]).pack(side="left", padx=5)
+        ttk.Button(snap_btns, text="還原此分頁", command=lambda: self.action_restore_snapshot(whole=False)).pack(side="left", padx=5)
+        ttk.Button(snap_btns, text="還原整份", command=lambda: self.action_restore_snapshot(whole=True)).pack(side="left")
+        ttk.Button(snap_btns, text="🔄", width=3, command=self.refresh_snapshot_list).pack(side="right")
+        self.lbl_snapshot_usage = ttk.Label(snap_btns, text="", foreground="gray")
+        self.lbl_snapshot_usage.pack(side="right", padx=10)
+        self.refresh_snapshot_list()
+
         # ... (VIP 輸入框建立程式碼略) ...
 
 
@@ -2495,6 +2873,9 @@ class SalesApp:
         btn_unlock = ttk.Button(vip_frame, text="解鎖", command=self.unlock_vip_features)
         btn_unlock.pack(side="left", padx=10)
 
+        # 啟動時已驗證的授權 (分頁延遲建立，所以在這裡補套用)
+        self.apply_license_ui()
+
         # ... (後面的按鈕預設 disabled 邏輯同上)
 
     def unlock_vip_features(self):
@@ -2582,86 +2963,189 @@ class SalesApp:
                     self.is_vip = False
                     return
 
-            # 3. 如果通過驗證，更新 UI
+            # 3. 如果通過驗證，更新 UI (備份分頁尚未建立時，等分頁建立後再套用)
             if self.is_vip:
-                self.var_vip_user.set(saved_user)
-                self.var_vip_code.set(saved_key)
-                self.btn_login.config(state="normal")
-                self.lbl_auth_status.config(text="狀態: 🔒 VIP 授權有效 (自動登入)", foreground="green")
-                # 如果 Google 已登入則解鎖備份按鈕
-                if self.drive_manager.is_authenticated:
-                    self.btn_upload.config(state="normal")
-                    self.btn_refresh.config(state="normal")
+                self.license_info = (saved_user, saved_key)
+                self.apply_license_ui()
 
         except Exception as e:
             print(f"system: failed to read license: {e}")
 
+    @requires_tab('tab_backup')
+    def apply_license_ui(self):
+        """ 將啟動時驗證通過的授權狀態套用到備份分頁 """
+        if not self.is_vip or not getattr(self, 'license_info', None):
+            return
+        saved_user, saved_key = self.license_info
+        self.var_vip_user.set(saved_user)
+        self.var_vip_code.set(saved_key)
+        self.btn_login.config(state="normal")
+        self.lbl_auth_status.config(text="狀態: 🔒 VIP 授權有效 (自動登入)", foreground="green")
+        # 目的地可用 (Google 已登入或本機資料夾可寫入) 則解鎖備份按鈕
+        self.refresh_backup_buttons()
+
     def refresh_backup_ui_status(self):
         """ 解鎖成功後，立即啟用相關按鈕 """
         self.btn_login.config(state="normal")
         self.lbl_auth_status.config(text="狀態: ✅ VIP 已解鎖 (尚未連結 Google)", foreground="blue")
+        self.refresh_backup_buttons()
+
+    # --- 備份目的地 ---
+    def get_backup_target(self):
+        """ 依設定回傳目前的備份目的地 (BackupTarget) """
+        if self.backup_config["target"] == "local" and self.backup_config["local_folder"]:
+            return LocalFolderTarget(self.backup_config["local_folder"])
+        return self.drive_manager
+
+    def _backup_engine(self, target=None):
+        from BackupPackage import IncrementalBackup
+        target = target or self.get_backup_target()
+        return IncrementalBackup(target, BACKUP_STATE_FILE, target_key=target.key, keep=self.backup_config["keep"])
+
+    def refresh_backup_buttons(self, refresh=True):
+        """ VIP 已解鎖且目的地可用時，才開放上傳與列表 (refresh=False 時列表只顯示快取) """
+        if not self.is_tab_built('tab_backup'):
+            return
+        ready = self.is_vip and self.get_backup_target().is_ready()
+        self.btn_upload.config(state="normal" if ready and not self.auto_backup.running else "disabled")
+        self.btn_refresh.config(state="normal" if ready else "disabled")
+        if ready:
+            self.start_list_thread(refresh=refresh)
+        else:
+            for item in self.tree_backup.get_children():
+                self.tree_backup.delete(item)
+
+    def choose_backup_folder(self):
+        folder = filedialog.askdirectory(title="選擇備份資料夾 (本機 / NAS)")
+        if folder:
+            self.var_backup_folder.set(folder)
+            self.var_backup_target.set("local")
+            self.save_backup_settings()
+
+    def save_backup_settings(self):
+        """ 儲存目的地與保留份數，並以新目的地重新整理列表 """
+        target = self.var_backup_target.get()
+        folder = self.var_backup_folder.get().strip()
+        if target == "local" and not folder:
+            messagebox.showwarning("提示", "請先選擇本機 / NAS 備份資料夾")
+            return
+        try:
+            keep = int(self.var_backup_keep.get())
+        except (tk.TclError, ValueError):
+            keep = self.backup_config["keep"]
+        keep = min(MAX_KEEP, max(MIN_KEEP, keep))
+        self.var_backup_keep.set(keep)
+        auto = {}
+        for key, var in (("auto_writes", self.var_auto_writes), ("auto_idle_minutes", self.var_auto_idle)):
+            try:
+                auto[key] = max(1, int(var.get()))
+            except (tk.TclError, ValueError):
+                auto[key] = self.backup_config[key]
+            var.set(auto[key])
+
+        self.backup_config.update({"target": target, "local_folder": folder, "keep": keep,
+                                   "auto_enabled": bool(self.var_auto_backup.get()), **auto})
+        self.auto_backup.configure(self.backup_config["auto_enabled"], auto["auto_writes"], auto["auto_idle_minutes"])
+        try:
+            save_backup_config(BACKUP_CONFIG_FILE, self.backup_config)
+        except Exception as e:
+            print(f"system: failed to save backup settings: {e}")
+        self._on_backup_status(self.auto_backup)
 
     # --- 執行緒相關函數 ---
     def start_login_thread(self):
         self.btn_login.config(state="disabled")
         self.lbl_auth_status.config(text="狀態: 正在開啟瀏覽器...請稍候", foreground="orange")
-        threading.Thread(target=self._run_login, daemon=True).start()
-
-    def _run_login(self):
-        success, msg = self.drive_manager.authenticate()
-        self.root.after(0, lambda: self._login_callback(success, msg))
+        self.executor.submit(self.drive_manager.authenticate, name="drive_login",
+                             on_done=lambda r: self._login_callback(*r))
 
     def _login_callback(self, success, msg):
         self.btn_login.config(state="normal")
         if success:
             self.lbl_auth_status.config(text="狀態: 登入成功", foreground="green")
             
-            # 【修正點 5】登入成功後，解鎖功能按鈕
-            self.btn_upload.config(state="normal")
-            self.btn_refresh.config(state="normal")
-            
-            self.start_list_thread() 
+            # 【修正點 5】登入成功後，解鎖功能按鈕 (目前目的地為 Drive 時會同時載入列表)
+            self.refresh_backup_buttons()
         else:
             self.lbl_auth_status.config(text=f"狀態: {msg}", foreground="red")
             messagebox.showerror("登入錯誤", msg)
 
 
-    @thread_safe_file
     def start_upload_thread(self):
-        if not self.drive_manager.is_authenticated:
-            messagebox.showwarning("警告", "請先登入 Google 帳號！")
+        target = self.get_backup_target()
+        if not target.is_ready():
+            messagebox.showwarning("警告", "請先登入 Google 帳號！" if target is self.drive_manager else "備份資料夾無法寫入！")
             return
         if not os.path.exists(FILE_NAME):
             messagebox.showerror("錯誤", "找不到 Excel 檔案！")
             return
-            
-        self.btn_upload.config(state="disabled", text="上傳中...")
-        threading.Thread(target=self._run_upload, daemon=True).start()
 
-    def _run_upload(self):
-        success, msg = self.drive_manager.upload_file(FILE_NAME)
-        self.root.after(0, lambda: self._upload_callback(success, msg))
+        # 手動與自動備份共用同一個排程器，同時只會有一個備份在跑
+        if not self.auto_backup.trigger("手動", done=self._upload_callback):
+            messagebox.showinfo("提示", "自動備份正在進行中，請稍候再試。")
+
+    def _run_backup_job(self):
+        """ 背景執行緒：只在複製活頁簿時持有檔案鎖，上傳期間不鎖住正式檔 """
+        if not os.path.exists(FILE_NAME):
+            return False, "找不到 Excel 檔案！"
+        target = self.get_backup_target()
+        work = tempfile.mkdtemp(prefix="oms_backup_")
+        try:
+            copy_path = os.path.join(work, os.path.basename(FILE_NAME))
+            with self.file_lock.read():
+                shutil.copy2(FILE_NAME, copy_path)
+            return self._backup_engine(target).backup(copy_path)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def _on_backup_status(self, scheduler):
+        """ 排程器狀態改變 (UI 執行緒)：保存上次成功時間並更新備份分頁 """
+        if scheduler.last_success and scheduler.last_success != self.backup_config.get("last_success"):
+            self.backup_config["last_success"] = scheduler.last_success
+            try:
+                save_backup_config(BACKUP_CONFIG_FILE, self.backup_config)
+            except Exception as e:
+                print(f"system: failed to save backup settings: {e}")
+        if not self.is_tab_built('tab_backup'):
+            return
+        self.lbl_auto_backup.config(text=scheduler.status_text(),
+                                    foreground="red" if scheduler.last_error else "gray")
+        if scheduler.running:
+            self.btn_upload.config(state="disabled", text="上傳中...")
+        else:
+            self.btn_upload.config(text="⬆️ 上傳備份")
+            self.refresh_backup_buttons(refresh=False)   # 上傳 / 清理已同步更新快取，不必重新列出
 
     def _upload_callback(self, success, msg):
-        self.btn_upload.config(state="normal", text="⬆️ 上傳備份")
         if success:
             messagebox.showinfo("成功", msg)
-            self.start_list_thread()
         else:
             messagebox.showerror("失敗", msg)
 
-    def start_list_thread(self):
-        if not self.drive_manager.is_authenticated:
+    def start_list_thread(self, refresh=True):
+        """ 先立即顯示快取清單，再於背景向目的地重新讀取 (refresh=False 時只顯示快取) """
+        target = self.get_backup_target()
+        if not target.is_ready():
             return
+        cached = target.cached_backups()
+        if cached is not None:
+            self._list_callback(cached)
+            if not refresh:
+                return
         self.btn_refresh.config(state="disabled", text="讀取中...")
-        threading.Thread(target=self._run_list, daemon=True).start()
+        self.executor.submit(self._run_list, target, name="backup_list", on_done=self._list_callback)
 
-    def _run_list(self):
-        files = self.drive_manager.list_backups()
-        self.root.after(0, lambda: self._list_callback(files))
+    def _run_list(self, target):
+        try:
+            return target.list_backups()
+        except Exception as e:
+            print(f"List error: {e}")
+            return None   # 讀取失敗：保留目前顯示的快取清單
 
     def _list_callback(self, files):
         self.btn_refresh.config(state="normal", text="🔄 重新整理列表")
+        if files is None:
+            return
         for item in self.tree_backup.get_children():
             self.tree_backup.delete(item)
             
@@ -2691,16 +3175,50 @@ class SalesApp:
         file_id = self.tree_backup.item(item_id, "tags")[0]
 
         confirm = messagebox.askyesno("⚠️ 危險操作：確認還原？", 
-                                      f"您確定要將資料還原成：\n{file_name}\n\n注意：這將會「覆蓋」目前電腦上所有的銷售與庫存紀錄！")
+                                      f"您確定要將資料還原成：\n{file_name}\n\n注意：這將會「覆蓋」目前電腦上所有的銷售與庫存紀錄！\n(目前的檔案會保留為 .bak)")
         if confirm:
-            success, msg = self.drive_manager.download_file(file_id, FILE_NAME)
-            if success:
-                messagebox.showinfo("還原完成", msg)
-                self.products_df = self.load_products()
-                self.update_sales_prod_list()
-                self.update_mgmt_prod_list()
-            else:
-                messagebox.showerror("還原失敗", msg)
+            self.btn_refresh.config(state="disabled", text="還原中...")
+            self.executor.submit(self._run_restore, self.get_backup_target(), file_id, name="backup_restore",
+                                 on_done=lambda r: self._restore_callback(*r))
+
+    def _run_restore(self, target, file_id):
+        """ 背景執行緒：下載到暫存檔並驗證 (不持有檔案鎖)，通過後才在寫入鎖內置換正式檔 """
+        try:
+            meta = target.get_metadata(file_id)
+            self._backup_engine(target).restore(meta, FILE_NAME, schema=RESTORE_SCHEMA, lock=self.file_lock)
+            success, msg = True, "還原成功！資料已重新載入。"
+        except Exception as e:
+            success, msg = False, f"還原失敗，目前資料未被更動。\n原因: {str(e)}"
+        return success, msg
+
+    def _restore_callback(self, success, msg):
+        self.btn_refresh.config(text="🔄 重新整理列表")
+        self.refresh_backup_buttons(refresh=False)
+        if success:
+            self.undo_buffer = None   # 還原前的復原紀錄已不適用
+            self.undo_pages = []
+            self.reload_all_data()
+            messagebox.showinfo("還原完成", msg)
+        else:
+            messagebox.showerror("還原失敗", msg)
+
+    def reload_all_data(self):
+        """ 活頁簿被整份置換後 (還原備份 / 快照)，重新載入記憶體資料與所有已建立的分頁，不需重啟 """
+        self.products_df = self.load_products()
+        self.load_system_settings()
+        self.refresh_fee_tree()
+        self.update_sales_prod_list()
+        self.update_mgmt_prod_list()
+        self.load_existing_tags()
+        self.load_tracking_data()
+        self.load_purchase_tracking()
+        if hasattr(self, 'tree_purchase'):
+            self.load_purchase_data()
+        self.load_sales_records_for_edit()
+        self.load_returns_data()
+        self.refresh_vendor_management_ui()
+        self.calculate_analysis_data()
+        self.refresh_snapshot_list()
 
     # ================= 銷售輸入頁面 (不變) =================
     def setup_sales_tab(self):
@@ -3142,31 +3660,22 @@ class SalesApp:
     def open_import_wizard(self):
         """ 開啟外部匯入精靈視窗 """
         # 這裡的 ImportWizard 是我們剛剛更新過支援「商品編號」的版本
-        ImportWizard(self.root, self.callback_from_wizard)
+        ImportWizard(self.root, self.callback_from_wizard, self.executor)
 
 
 
-    @thread_safe_file
-    def callback_from_wizard(self, new_data_list):
-        """ 當精靈完成匹配並按下確認時，接收資料並存入 Excel """
-        if not new_data_list: 
-            return False
-        
+    def callback_from_wizard(self, new_data_list, policies=None):
+        """ 當精靈完成匹配並按下確認時，接收資料 (DataFrame 或 dict 清單) 並增量寫入 Excel """
+        from UpsertEngine import PRODUCT_POLICIES
         try:
             df_new = pd.DataFrame(new_data_list)
-            
-            # 1. 讀取目前現有的商品資料
-            with pd.ExcelFile(FILE_NAME) as xls:
-                df_old = pd.read_excel(xls, sheet_name=SHEET_PRODUCTS)
+            if df_new.empty: 
+                return False
 
-            # 2. 合併資料
-            # 將新舊資料合併，並根據「商品名稱」去重
-            # keep='last' 代表如果名稱重複，以新匯入的資料為準
-            df_combined = pd.concat([df_old, df_new], ignore_index=True)
-            df_combined.drop_duplicates(subset=['商品名稱'], keep='last', inplace=True)
-            
-            # 3. 呼叫萬用引擎存檔 (確保分頁不消失)
-            save_success = self._universal_save({SHEET_PRODUCTS: df_combined})
+            # 1~3. 主鍵合併：先比對「商品編號」，沒有編號才用「商品名稱」；試算確認後以萬用引擎存檔
+            # 庫存、進貨時間等即時欄位依策略保留，不會被匯入檔靜默覆蓋
+            policies = {**PRODUCT_POLICIES, **(policies or {})}
+            save_success = self._upsert_sheet(SHEET_PRODUCTS, df_new, ["商品編號", "商品名稱"], policies, "商品")
             
             if save_success:
                 # 4. 成功後刷新介面資料
@@ -3199,9 +3708,10 @@ class SalesApp:
         # 綁定 KeyRelease 事件，達成「邊打字邊過濾」的效果
         ent_search = ttk.Entry(search_box, textvariable=self.var_track_search, width=30)
         ent_search.pack(side="left", padx=5)
-        ent_search.bind("<KeyRelease>", lambda e: self.load_tracking_data())
+        ent_search.bind("<KeyRelease>", lambda e: self.vt_track.refilter())
 
         ttk.Button(top_frame, text=" 🔄 重新整理", command=self.load_tracking_data).pack(side="right", pady=10)
+        ttk.Button(top_frame, text="📥 匯入平台訂單", command=self.open_order_ingest).pack(side="right", padx=5, pady=10)
 
 
         # 2. 中間：列表
@@ -3210,14 +3720,20 @@ class SalesApp:
         cols = ("訂單編號", "日期", "平台", "買家", "商品名稱", "數量", "售價")
         self.tree_track = ttk.Treeview(tree_frame, columns=cols, show='headings', height=15)
         for c in cols:
-            self.tree_track.heading(c, text=c)
+            self.tree_track.heading(c, text=c, command=lambda c=c: self.sort_tree_column(self.tree_track, c, False))
             self.tree_track.column(c, width=100 if "商品" not in c else 200)
         
-        sb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree_track.yview)
-        self.tree_track.configure(yscrollcommand=sb.set)
+        sb = ttk.Scrollbar(tree_frame, orient="vertical")
         self.tree_track.pack(side="left", fill="both", expand=True)
         sb.pack(side="right", fill="y")
 
+        # 虛擬列表：只把可視範圍的列放進 Treeview
+        self.vt_track = VirtualTreeview(
+            self.tree_track, sb, self._format_tracking_rows,
+            col_map={"平台": "交易平台", "買家": "買家名稱", "售價": "單價(售)"},
+            filter_func=self._filter_tracking_rows)
+        self.virtual_tables[str(self.tree_track)] = self.vt_track
+
         # 3. 下方：兩行按鈕區
         btn_main_frame = ttk.LabelFrame(frame, text="訂單操作面板", padding=10)
         btn_main_frame.pack(fill="x", padx=10, pady=10)
@@ -3232,12 +3748,14 @@ class SalesApp:
         ttk.Button(row1, text="📇 刪除單一商品 (補位)", command=self.action_track_delete_item).pack(side="left",padx=5)
         ttk.Button(row1, text="🗑️ 刪除整筆訂單", command=self.action_track_delete_order).pack(side="left", padx=5)
         ttk.Button(row1, text="✅ 完成訂單 (整筆結案)", command=self.action_track_complete_order).pack(side="left", padx=5)
+        ttk.Button(row1, text="🖨️ 批次出貨單", command=self.action_track_batch_shipping_notes).pack(side="left", padx=5)
 
         # 第二行：結案與退貨
         row2 = ttk.Frame(btn_main_frame)
         row2.pack(fill="x", pady=4)
 
-        self.load_tracking_data()
+        self.load_in_background("訂單追蹤", self._read_tracking_frame, self.vt_track.set_data,
+                                version=lambda: self.vt_track.data_version)
 
     @thread_safe_file
     def action_recall_sales_order(self):
@@ -3247,20 +3765,199 @@ class SalesApp:
 
 
 
+    def action_track_batch_shipping_notes(self):
+        """ 將選取的追蹤訂單 (未選取則為目前篩選結果) 合併成一份出貨單文件 """
+        df = self.vt_track.df
+        if df.empty:
+            messagebox.showwarning("提示", "目前沒有追蹤中的訂單")
+            return
+
+        sel = self.tree_track.selection()
+        if sel:
+            order_ids = list(dict.fromkeys(str(self.tree_track.item(i)['values'][0]).replace("'", "").strip() for i in sel))
+        else:
+            order_ids = df.iloc[self.vt_track.order]['訂單編號'].drop_duplicates().tolist()
+            if not order_ids or not messagebox.askyesno("批次出貨單", f"未選取訂單，要列印目前篩選結果的 {len(order_ids)} 筆訂單嗎？"):
+                return
+
+        # 依訂單分組，組成 ShippingWizard 需要的 (order_info, items) 清單
+        shop_name = self.var_shop_name.get()
+        lines = df[df['訂單編號'].isin(order_ids)]
+        groups = dict(tuple(lines.groupby('訂單編號', sort=False)))
+        orders = []
+        for oid in order_ids:
+            grp = groups.get(oid)
+            if grp is None:
+                continue
+            head = grp.iloc[0]
+            qty = pd.to_numeric(grp['數量'], errors='coerce').fillna(0).astype(int)
+            price = pd.to_numeric(grp['單價(售)'], errors='coerce').fillna(0.0)
+            sales = pd.to_numeric(grp['總銷售額'], errors='coerce').fillna(0.0)
+            skus = grp['商品編號'].fillna("").astype(str).str.lstrip("'") if '商品編號' in grp.columns else pd.Series("", index=grp.index)
+            info = {
+                "order_id": oid,
+                "shop_name": shop_name,
+                "buyer": head['買家名稱'],
+                "date": head['日期'],
+                "platform": head['交易平台'],
+                "ship_method": head['寄送方式'],
+                "ship_fee": 0,
+                "payer": "買家付",
+                "discount_tag": "優惠折抵",
+                "discount_amount": 0,
+            }
+            items = [{"sku": k, "name": n, "qty": q, "unit_price": p, "total_sales": t}
+                     for k, n, q, p, t in zip(skus, grp['商品名稱'], qty, price, sales)]
+            orders.append((info, items))
+
+        show_batch_shipping_dialog(self.root, orders)
+
+
+    # ================= 平台訂單匯出檔批次匯入 =================
+    def open_order_ingest(self):
+        """ 選擇平台訂單匯出檔與手續費規則，批次匯入『訂單追蹤』 """
+        from ImportStream import FILE_TYPES
+        path = filedialog.askopenfilename(title="選擇平台訂單匯出檔", filetypes=FILE_TYPES)
+        if not path:
+            return
+        if not self.fee_lookup:
+            self.refresh_fee_tree()
+
+        win = tk.Toplevel(self.root)
+        win.title("平台訂單批次匯入")
+        win.transient(self.root)
+        win.grab_set()
+        frm = ttk.Frame(win, padding=15)
+        frm.pack(fill="both", expand=True)
+
+        ttk.Label(frm, text=f"檔案：{os.path.basename(path)}").grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        ttk.Label(frm, text="交易平台:").grid(row=1, column=0, sticky="w")
+        var_platform = tk.StringVar(value="蝦皮購物")
+        ttk.Combobox(frm, textvariable=var_platform, values=PLATFORM_OPTIONS, state="readonly", width=30).grid(row=1, column=1, pady=3)
+
+        no_fee = "不扣手續費 (0%)"
+        ttk.Label(frm, text="手續費規則:").grid(row=2, column=0, sticky="w")
+        var_fee = tk.StringVar(value=next(iter(self.fee_lookup), no_fee))
+        ttk.Combobox(frm, textvariable=var_fee, values=list(self.fee_lookup) + [no_fee], state="readonly", width=30).grid(row=2, column=1, pady=3)
+
+        lbl_status = ttk.Label(frm, text="", foreground="gray")
+        lbl_status.grid(row=4, column=0, columnspan=2, sticky="w", pady=(10, 0))
+
+        def _start():
+            rate, fixed = self.fee_lookup.get(var_fee.get(), (0.0, 0.0))
+            btn_start.config(state="disabled")
+            self._run_order_ingest(path, var_platform.get(), rate, fixed, win, lbl_status)
+
+        btn_start = ttk.Button(frm, text="✅ 開始匯入", command=_start)
+        btn_start.grid(row=3, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+
+    def _run_order_ingest(self, path, platform, rate, fixed, win, lbl_status):
+        """ 背景讀檔與轉換，完成後回到主執行緒確認並寫入 """
+        import OrderIngest
+
+        def _progress(done):
+            self.executor.post(lambda: lbl_status.winfo_exists() and lbl_status.config(text=f"已讀取 {done} 列..."))
+
+        def _run():
+            lines, _ = OrderIngest.read_export(path, progress=_progress)
+            df_prods, existing_ids = self._read_ingest_context()
+            return OrderIngest.build_tracking_rows(
+                lines, df_prods, existing_ids, fee_rate=rate, fee_fixed=fixed, platform=platform)
+
+        def _failed(e):
+            win.destroy()
+            messagebox.showerror("匯入失敗", f"無法解析匯出檔: {e}")
+
+        task = self.executor.submit(
+            _run, name="order_ingest", on_error=_failed,
+            on_done=lambda r: self._finish_order_ingest(path, *r, task.run_time, win))
+
+    @thread_safe_read
+    def _read_ingest_context(self):
+        """ 讀取商品主檔與已存在的訂單編號 (追蹤中 + 已完成) """
+        import oms_core
+        ids = set()
+        with pd.ExcelFile(FILE_NAME) as xls:
+            df_prods = pd.read_excel(xls, sheet_name=SHEET_PRODUCTS)
+            for sheet in (SHEET_TRACKING, SHEET_SALES):
+                if sheet in xls.sheet_names:
+                    ids.update(oms_core.clean_ids(pd.read_excel(xls, sheet_name=sheet, usecols=["訂單編號"])["訂單編號"]))
+        ids.discard("")
+        return df_prods, ids
+
+    def _finish_order_ingest(self, path, df_rows, stock_out, errors, cost, win):
+        import OrderIngest
+        if win.winfo_exists():
+            win.destroy()
+        n_orders = df_rows['訂單編號'].nunique() if not df_rows.empty else 0
+        print(f"system: order export parsed in {cost:.2f}s ({n_orders} orders, {len(df_rows)} lines, {len(errors)} errors)")
+
+        # 1. 錯誤報告存在匯出檔旁邊
+        report_msg = ""
+        if errors:
+            report_path = os.path.splitext(path)[0] + "_匯入錯誤報告.csv"
+            try:
+                OrderIngest.write_error_report(errors, report_path)
+                report_msg = f"\n錯誤報告：{report_path}"
+            except Exception as e:
+                report_msg = f"\n(錯誤報告寫入失敗: {e})"
+
+        if df_rows.empty:
+            messagebox.showwarning("平台訂單匯入", f"沒有可匯入的訂單。\n略過/錯誤：{len(errors)} 列{report_msg}")
+            return
+
+        # 2. 確認後一次寫入 (商品庫存 + 訂單追蹤 同一次存檔)
+        msg = (f"可匯入：{n_orders} 筆訂單 / {len(df_rows)} 筆明細\n"
+               f"扣除庫存：{int(stock_out.sum())} 件 ({len(stock_out)} 項商品)\n"
+               f"略過/錯誤：{len(errors)} 列{report_msg}\n\n確定寫入訂單追蹤嗎？")
+        if not messagebox.askyesno("平台訂單匯入", msg):
+            return
+        if self._commit_order_ingest(df_rows, stock_out):
+            messagebox.showinfo("成功", f"已匯入 {n_orders} 筆訂單。")
+
     @thread_safe_file
+    def _commit_order_ingest(self, df_rows, stock_out):
+        """ 單一交易寫入：重新讀取最新資料、再次去重 (追蹤中 + 已完成) 後一次存檔 """
+        import OrderIngest
+        try:
+            with pd.ExcelFile(FILE_NAME) as xls:
+                df_prods = pd.read_excel(xls, sheet_name=SHEET_PRODUCTS)
+                df_track = pd.read_excel(xls, sheet_name=SHEET_TRACKING)
+                df_sales = (pd.read_excel(xls, sheet_name=SHEET_SALES, usecols=["訂單編號"])
+                            if SHEET_SALES in xls.sheet_names else None)
+
+            df_prods, df_track, df_rows = OrderIngest.merge_into_tracking(
+                df_prods, df_track, df_rows, stock_out, datetime.now().strftime("%Y-%m-%d %H:%M"), df_sales)
+            if df_rows.empty:
+                return False
+
+            if self._universal_save({SHEET_PRODUCTS: df_prods, SHEET_TRACKING: df_track}):
+                self.products_df = df_prods
+                self.update_sales_prod_list()
+                self.load_tracking_data()
+                return True
+            return False
+        except Exception as e:
+            messagebox.showerror("匯入失敗", f"寫入訂單追蹤失敗: {e}")
+            return False
+
+
+    @requires_tab('tab_tracking')
     def load_tracking_data(self):
         """ 讀取『訂單追蹤』分頁：使用分組填充，防止買家名稱錯誤繼承 """
-        for i in self.tree_track.get_children():
-            self.tree_track.delete(i)
-            
+        self.vt_track.set_data(self._read_tracking_frame())
+
+    @thread_safe_read
+    def _read_tracking_frame(self):
+        """ 讀取並整理訂單追蹤資料 (不操作 Tk，可在背景執行緒呼叫) """
         try:
-            if not os.path.exists(FILE_NAME): 
-                return
+            if self.oms_client is None and not os.path.exists(FILE_NAME): 
+                return pd.DataFrame()
             
             # 1. 讀取 Excel 原始資料
-            df = pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING)
+            df = self._read_sheet(SHEET_TRACKING)
             if df.empty: 
-                return
+                return df
 
             # 2. 統一格式化訂單編號 (這是我們的分組依據)
             df['訂單編號'] = df['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True).str.strip()
@@ -3279,35 +3976,38 @@ class SalesApp:
             # 如果分組填充完後還是 NaN (代表該訂單編號的第一行本來就沒寫買家)，則填入預設值
             df_display[fill_cols] = df_display[fill_cols].fillna("資訊缺失")
 
-            # 4. 取得搜尋關鍵字
-            query = self.var_track_search.get().strip().lower()
-
-            # 5. 執行過濾 (在補齊資料後的副本上搜尋)
-            if query:
-                mask = (
-                    df_display['買家名稱'].astype(str).str.lower().str.contains(query) |
-                    df_display['商品名稱'].astype(str).str.lower().str.contains(query) |
-                    df_display['訂單編號'].astype(str).str.lower().str.contains(query)
-                )
-                df_filtered = df_display[mask]
-            else:
-                df_filtered = df_display
-
-            # 6. 填入 Treeview
-            for idx, row in df_filtered.iterrows():
-                # 使用 text=str(idx) 確保我們修改時能對應回 Excel 的原始列號
-                self.tree_track.insert("", "end", text=str(idx), values=(
-                    row.get('訂單編號', ''),
-                    row.get('日期', ''),
-                    row.get('交易平台', ''),
-                    row.get('買家名稱', ''),
-                    row.get('商品名稱', ''),
-                    int(row.get('數量', 0)),
-                    float(row.get('單價(售)', 0))
-                ))
+            # 4. 交給虛擬列表 (搜尋過濾與排序都在資料層完成)
+            return df_display
                 
         except Exception as e:
             print(f"system: failed to load tracking list: {e}")
+            return pd.DataFrame()
+
+    def _filter_tracking_rows(self, df):
+        """ 訂單追蹤搜尋條件 (買家/商品/編號) """
+        query = self.var_track_search.get().strip().lower()
+        if not query:
+            return None
+        return (
+            df['買家名稱'].astype(str).str.lower().str.contains(query, regex=False) |
+            df['商品名稱'].astype(str).str.lower().str.contains(query, regex=False) |
+            df['訂單編號'].astype(str).str.lower().str.contains(query, regex=False)
+        )
+
+    def _format_tracking_rows(self, block, prev_row):
+        """ 將一個區塊的資料轉為 Treeview 列；text 保留 Excel 原始列號 """
+        rows = []
+        for idx, row in zip(block.index, block.to_dict('records')):
+            rows.append((str(idx), (
+                row.get('訂單編號', ''),
+                row.get('日期', ''),
+                row.get('交易平台', ''),
+                row.get('買家名稱', ''),
+                row.get('商品名稱', ''),
+                int(row.get('數量', 0)),
+                float(row.get('單價(售)', 0))
+            ), ()))
+        return rows
 
 
 
@@ -3404,22 +4104,19 @@ class SalesApp:
         if reason is None: 
             return
         
+        if self.oms_client is not None:
+            self._remote_order_action(self.oms_client.return_order, (order_id, reason),
+                                      f"訂單 {order_id} 整筆已移至退貨。", returns=True)
+            return
+
         try:
-            df_track = pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING)
-            df_track['訂單編號'] = df_track['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True)
-            mask = df_track['訂單編號'] == order_id
-            rows_to_return = df_track[mask].copy()
-            info = self._get_full_order_info(df_track, order_id)
-            for col, val in info.items(): 
-                rows_to_return[col] = val
-            rows_to_return['備註'] = reason
-            
+            import oms_core
+            df_track = oms_core.normalize_order_ids(pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING))
             try: 
                 df_returns = pd.read_excel(FILE_NAME, sheet_name=SHEET_RETURNS)
             except Exception:
                 df_returns = pd.DataFrame()
-            df_returns = pd.concat([df_returns, rows_to_return], ignore_index=True)
-            df_track_new = df_track[~mask]
+            df_track_new, df_returns = oms_core.return_order(df_track, df_returns, order_id, reason)
             
             # ---【關鍵修正：使用大括號字典傳參】---
             success = self._universal_save({
@@ -3456,46 +4153,55 @@ class SalesApp:
         # 設定標題與寬度
         widths = {"訂單編號": 120, "日期": 90, "買家": 100, "商品名稱": 180, "數量": 50, "售價": 60, "退貨原因": 250}
         for c in cols:
-            self.tree_returns.heading(c, text=c)
+            self.tree_returns.heading(c, text=c, command=lambda c=c: self.sort_tree_column(self.tree_returns, c, False))
             self.tree_returns.column(c, width=widths[c], anchor="w" if c != "數量" else "center")
         
-        sb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree_returns.yview)
-        self.tree_returns.configure(yscrollcommand=sb.set)
+        sb = ttk.Scrollbar(tree_frame, orient="vertical")
         self.tree_returns.pack(side="left", fill="both", expand=True)
         sb.pack(side="right", fill="y")
 
-        self.load_returns_data()
+        self.vt_returns = VirtualTreeview(
+            self.tree_returns, sb, self._format_returns_rows,
+            col_map={"買家": "買家名稱", "售價": "單價(售)", "退貨原因": "備註"})
+        self.virtual_tables[str(self.tree_returns)] = self.vt_returns
 
-    @thread_safe_file
+        self.load_in_background("退貨紀錄", self._read_returns_frame, self.vt_returns.set_data,
+                                version=lambda: self.vt_returns.data_version)
+
+    @requires_tab('tab_returns')
     def load_returns_data(self):
         """ 讀取『退貨紀錄』分頁的資料 """
-        for i in self.tree_returns.get_children():
-            self.tree_returns.delete(i)
-            
+        self.vt_returns.set_data(self._read_returns_frame())
+
+    @thread_safe_read
+    def _read_returns_frame(self):
         try:
-            if not os.path.exists(FILE_NAME): 
-                return
-            df = pd.read_excel(FILE_NAME, sheet_name=SHEET_RETURNS)
+            if self.oms_client is None and not os.path.exists(FILE_NAME): 
+                return pd.DataFrame()
+            df = self._read_sheet(SHEET_RETURNS)
             
             # 格式化編號
             if '訂單編號' in df.columns:
                 df['訂單編號'] = df['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True)
             
-            df = df.fillna("")
-            
-            # 填入 Treeview
-            for _, row in df.iterrows():
-                self.tree_returns.insert("", "end", values=(
-                    row.get('訂單編號', ''),
-                    row.get('日期', ''),
-                    row.get('買家名稱', ''),
-                    row.get('商品名稱', ''),
-                    row.get('數量', 0),
-                    row.get('單價(售)', 0),
-                    row.get('備註', '') # 對應 Excel Q 列的內容
-                ))
+            return df.fillna("")
         except Exception as e:
             print(f"system: failed to load returns data: {e}")
+            return pd.DataFrame()
+
+    def _format_returns_rows(self, block, prev_row):
+        rows = []
+        for idx, row in zip(block.index, block.to_dict('records')):
+            rows.append((str(idx), (
+                row.get('訂單編號', ''),
+                row.get('日期', ''),
+                row.get('買家名稱', ''),
+                row.get('商品名稱', ''),
+                row.get('數量', 0),
+                row.get('單價(售)', 0),
+                row.get('備註', '') # 對應 Excel Q 列的內容
+            ), ()))
+        return rows
 
     #================= 銷售紀錄 =================
     def setup_sales_edit_tab(self):
@@ -3516,7 +4222,7 @@ class SalesApp:
         self.ent_sales_search.pack(side="left", padx=5)
         
         # 綁定即時搜尋事件
-        self.ent_sales_search.bind("<KeyRelease>", lambda e: self.load_sales_records_for_edit())
+        self.ent_sales_search.bind("<KeyRelease>", lambda e: self.vt_sales_edit.refilter())
         
         ttk.Button(search_bar, text="🔄 重新讀取", command=self.load_sales_records_for_edit).pack(side="right")
         # ----------------------------
@@ -3545,13 +4251,22 @@ class SalesApp:
         self.tree_sales_edit.heading("毛利", text="毛利%")
         self.tree_sales_edit.column("毛利", width=60, anchor="e")
 
-        scrolly = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree_sales_edit.yview)
-        self.tree_sales_edit.configure(yscrollcommand=scrolly.set)
+        for c in cols:
+            self.tree_sales_edit.heading(c, command=lambda c=c: self.sort_tree_column(self.tree_sales_edit, c, False))
+
+        scrolly = ttk.Scrollbar(list_frame, orient="vertical")
         self.tree_sales_edit.pack(side="left", fill="both", expand=True)
         scrolly.pack(side="right", fill="y")
+
+        self.vt_sales_edit = VirtualTreeview(
+            self.tree_sales_edit, scrolly, self._format_sales_edit_rows,
+            col_map={"日期": "tmp_dt", "商品": "商品名稱", "售價": "單價(售)",
+                     "手續費": "分攤手續費", "淨利": "總淨利", "毛利": "毛利率"},
+            filter_func=self._filter_sales_edit_rows)
+        self.virtual_tables[str(self.tree_sales_edit)] = self.vt_sales_edit
         
-        # 綁定選擇事件
-        self.tree_sales_edit.bind("<<TreeviewSelect>>", self.on_sales_edit_select)
+        # 綁定選擇事件 (換頁還原選取不會重複觸發)
+        self.vt_sales_edit.bind_select(self.on_sales_edit_select)
 
 
 
@@ -3633,7 +4348,8 @@ class SalesApp:
         # 增加還原按鈕
         ttk.Button(btn_action_f, text="↩️ 還原上一步", command=self.action_perform_undo).pack(side="left", padx=5)
 
-        self.load_sales_records_for_edit()
+        self.load_in_background("銷售紀錄", self._read_sales_edit_frame, self._apply_sales_edit_frame,
+                                version=lambda: self.vt_sales_edit.data_version)
 
         
     
@@ -3755,7 +4471,7 @@ class SalesApp:
             print(f"system: sub-ledger query failed: {e}")
 
 
-    @thread_safe_file
+    @requires_tab('tab_sales_edit')
     def load_sales_records_for_edit(self):
         """ 
         V5.4 售後追蹤強化版：
@@ -3763,16 +4479,22 @@ class SalesApp:
         2. 強化排序，確保最新日期在最前。
         3. 視覺化標記售後項目。
         """
-        for i in self.tree_sales_edit.get_children():
-            self.tree_sales_edit.delete(i)
-        
+        self._apply_sales_edit_frame(self._read_sales_edit_frame())
+
+    def _apply_sales_edit_frame(self, df):
+        # 完整資料集留在記憶體，過濾 (含「售後」關鍵字) 交給虛擬列表的資料層
+        self.sales_edit_df = df
+        self.vt_sales_edit.set_data(df)
+
+    @thread_safe_read
+    def _read_sales_edit_frame(self):
         try:
             if not os.path.exists(self.FILE_NAME): 
-                return
+                return pd.DataFrame()
             df = pd.read_excel(self.FILE_NAME, sheet_name=self.SHEET_SALES)
             df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
             if df.empty: 
-                return
+                return df
 
             # --- [數據預處理] ---
             df['訂單編號'] = df['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True).str.strip()
@@ -3781,65 +4503,58 @@ class SalesApp:
             df[fill_cols] = df[fill_cols].replace(r'^\s*$', pd.NA, regex=True)
             df[fill_cols] = df.groupby('訂單編號', group_keys=False)[fill_cols].ffill().bfill()
 
-            # --- [核心過濾邏輯：售後關鍵字攔截] ---
-            query = self.var_sales_edit_search.get().lower().strip()
-            
-            if query:
-                if query == "售後":
-                    # 特殊搜尋：抓取『扣費項目』中有括號標記的列 (這是我們售後功能存檔的格式)
-                    # 格式範例: [補寄商品:-$50.0]
-                    mask = df['扣費項目'].astype(str).str.contains(r'\[.*:-\$')
-                else:
-                    # 一般搜尋：買家、商品、編號、或特定的售後類型（如：補寄）
-                    mask = (
-                        df['買家名稱'].astype(str).str.lower().str.contains(query) |
-                        df['商品名稱'].astype(str).str.lower().str.contains(query) |
-                        df['訂單編號'].astype(str).str.lower().str.contains(query) |
-                        df['扣費項目'].astype(str).str.lower().str.contains(query)
-                    )
-                df = df[mask]
-
             # --- [排序：日期最新在前] ---
             df['tmp_dt'] = pd.to_datetime(df['日期'], errors='coerce')
-            df = df.sort_values(by=['tmp_dt', '訂單編號'], ascending=[False, False])
-            
-            self.sales_edit_df = df.copy() 
-
-            # --- [視覺填充與顯示] ---
-            prev_id = None
-            for idx, row in df.iterrows():
-                curr_id = str(row['訂單編號'])
-                disp_date = "" if curr_id == prev_id else str(row.get('日期', ''))
-                disp_buyer = "" if curr_id == prev_id else str(row.get('買家名稱', ''))
-                prev_id = curr_id
-
-                # 判斷這行是否為售後項目 (用於套用顏色)
-                is_after_sales = False
-                remark_val = str(row.get('扣費項目', ''))
-                if '[' in remark_val and ':-$' in remark_val:
-                    is_after_sales = True
-
-                # 寫入 Treeview
-                item_id = self.tree_sales_edit.insert("", "end", text=str(idx), values=(
-                    disp_date,
-                    disp_buyer,
-                    row.get('商品名稱', ''),
-                    row.get('數量', 0),
-                    row.get('單價(售)', 0),
-                    row.get('分攤手續費', 0),
-                    row.get('總淨利', 0),
-                    f"{row.get('毛利率', 0)}%"
-                ))
-                
-                # 如果是售後件，套用紅字標籤
-                if is_after_sales:
-                    self.tree_sales_edit.item(item_id, tags=('after_sales',))
+            return df.sort_values(by=['tmp_dt', '訂單編號'], ascending=[False, False])
 
         except Exception as e:
             print(f"System Error (load_sales_edit): {e}")
+            return pd.DataFrame()
 
+    def _filter_sales_edit_rows(self, df):
+        """ 銷售紀錄搜尋條件：支援「售後」關鍵字攔截 """
+        query = self.var_sales_edit_search.get().lower().strip()
+        if not query:
+            return None
+        if query == "售後":
+            # 特殊搜尋：抓取『扣費項目』中有括號標記的列 (這是我們售後功能存檔的格式)
+            # 格式範例: [補寄商品:-$50.0]
+            return df['扣費項目'].astype(str).str.contains(r'\[.*:-\$')
+        # 一般搜尋：買家、商品、編號、或特定的售後類型（如：補寄）
+        return (
+            df['買家名稱'].astype(str).str.lower().str.contains(query, regex=False) |
+            df['商品名稱'].astype(str).str.lower().str.contains(query, regex=False) |
+            df['訂單編號'].astype(str).str.lower().str.contains(query, regex=False) |
+            df['扣費項目'].astype(str).str.lower().str.contains(query, regex=False)
+        )
 
-    @thread_safe_file
+    def _format_sales_edit_rows(self, block, prev_row):
+        """ 同一訂單的後續列不重複顯示日期與買家；售後項目套用紅字標籤 """
+        rows = []
+        prev_id = None if prev_row is None else str(prev_row['訂單編號'])
+        for idx, row in zip(block.index, block.to_dict('records')):
+            curr_id = str(row['訂單編號'])
+            disp_date = "" if curr_id == prev_id else str(row.get('日期', ''))
+            disp_buyer = "" if curr_id == prev_id else str(row.get('買家名稱', ''))
+            prev_id = curr_id
+
+            remark_val = str(row.get('扣費項目', ''))
+            tags = ('after_sales',) if '[' in remark_val and ':-$' in remark_val else ()
+
+            rows.append((str(idx), (
+                disp_date,
+                disp_buyer,
+                row.get('商品名稱', ''),
+                row.get('數量', 0),
+                row.get('單價(售)', 0),
+                row.get('分攤手續費', 0),
+                row.get('總淨利', 0),
+                f"{row.get('毛利率', 0)}%"
+            ), tags))
+        return rows
+
+
+    @thread_safe_read
     def on_sales_edit_select(self, event=None):
         """ 修正版：從暫存讀取詳情，並同步觸發『售後歷史子表』刷新 """
         sel = self.tree_sales_edit.selection()
@@ -4286,7 +5001,7 @@ class SalesApp:
 
 
 
-    @thread_safe_file
+    @thread_safe_read
     def refresh_fee_tree(self):
         """ 從『手續費設定』分頁載入，不再受系統參數干擾 """
         if hasattr(self, 'fee_tree'):
@@ -4601,7 +5316,13 @@ class SalesApp:
         if not messagebox.askyesno("整筆入庫確認", f"確認將進貨單號：[{target_pur_id}] \n內的所有商品全部執行「入庫」嗎？"):
             return
 
+        if self.oms_client is not None:
+            self._remote_order_action(self.oms_client.confirm_inbound, (target_pur_id,),
+                                      f"單號 {target_pur_id} 已全部入庫。", purchases=True)
+            return
+
         try:
+            import oms_core
             today_str = datetime.now().strftime("%Y-%m-%d")
             now_full = datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -4610,79 +5331,15 @@ class SalesApp:
                 df_tracking = pd.read_excel(xls, sheet_name=SHEET_PUR_TRACKING)
                 df_history = pd.read_excel(xls, sheet_name=SHEET_PURCHASES)
 
-            # --- [核心暴力修正：立即切斷 float64 的聯繫] ---
-            # 針對可能出錯的文字欄位，讀取後「立刻」強行轉換為純字串，並把 nan 字串清空
-            for col in ['入庫日期', '備註', '物流追蹤', '進貨單號']:
-                if col in df_history.columns:
-                    # 先轉成字串，再把 'nan' 取代掉，這能徹底解決 float64 問題
-                    df_history[col] = df_history[col].astype(str).replace('nan', '')
-                else:
-                    # 萬一欄位不見了，補回空字串列
-                    df_history[col] = ""
-
-            # 對於數值欄位，確保它們是數字型態，防止出現奇怪的字串
-            for col in ['分攤運費', '海關稅金', '數量', '進貨單價']:
-                if col in df_history.columns:
-                    df_history[col] = pd.to_numeric(df_history[col], errors='coerce').fillna(0.0)
-
-            # --- 建立臨時匹配 ID ---
-            df_tracking['tmp_id'] = df_tracking['進貨單號'].astype(str).str.replace("'", "").str.strip()
-            df_history['tmp_id'] = df_history['進貨單號'].astype(str).str.replace("'", "").str.strip()
-            
-            batch_items = df_tracking[df_tracking['tmp_id'] == target_pur_id].copy()
-            
-            if batch_items.empty:
-                messagebox.showerror("錯誤", f"找不到單號 {target_pur_id}")
+            # 加權平均成本 (含運費與關稅) 更新庫存，進貨紀錄標記入庫，並移出進貨追蹤
+            try:
+                df_prods, df_tracking_new, df_history, batch_items = oms_core.confirm_inbound(
+                    df_prods, df_tracking, df_history, target_pur_id, today_str, now_full)
+            except oms_core.OrderNotFound as e:
+                messagebox.showerror("錯誤", str(e))
                 return
 
-            # 處理每一個品項
-            for _, row in batch_items.iterrows():
-                p_name = str(row['商品名稱']).strip()
-                new_qty = float(row.get('數量', 0))
-                new_price = float(row.get('進貨單價', 0))
-                
-                # 清理運費稅金
-                ship_fee = pd.to_numeric(row.get('分攤運費', 0), errors='coerce')
-                tax_fee = pd.to_numeric(row.get('海關稅金', 0), errors='coerce')
-                ship_fee = 0.0 if pd.isna(ship_fee) else ship_fee
-                tax_fee = 0.0 if pd.isna(tax_fee) else tax_fee
-
-                # A. 更新商品庫存與成本 (WAC)
-                p_mask = df_prods['商品名稱'].astype(str).str.strip() == p_name
-                if not df_prods[p_mask].empty:
-                    p_idx = df_prods[p_mask].index[0]
-                    old_stock = pd.to_numeric(df_prods.at[p_idx, '目前庫存'], errors='coerce')
-                    old_cost = pd.to_numeric(df_prods.at[p_idx, '預設成本'], errors='coerce')
-                    old_stock = 0.0 if pd.isna(old_stock) else old_stock
-                    old_cost = 0.0 if pd.isna(old_cost) else old_cost
-                    
-                    total_val = (old_stock * old_cost) + (new_qty * new_price) + ship_fee + tax_fee
-                    total_qty = old_stock + new_qty
-                    
-                    if total_qty > 0:
-                        new_wac = total_val / total_qty
-                        df_prods.at[p_idx, '預設成本'] = round(new_wac, 2)
-                        df_prods.at[p_idx, '目前庫存'] = int(total_qty)
-                        df_prods.at[p_idx, '最後進貨時間'] = today_str
-                        df_prods.at[p_idx, '最後更新時間'] = now_full
-
-                # B. 更新進貨歷史總表
-                h_mask = (df_history['tmp_id'] == target_pur_id) & (df_history['商品名稱'] == p_name)
-                if not df_history[h_mask].empty:
-                    # 這裡現在絕對是字串欄位了，賦值不會再跳 float64 錯誤
-                    df_history.loc[h_mask, '入庫日期'] = today_str
-                    df_history.loc[h_mask, '備註'] = "已完成入庫"
-                    df_history.loc[h_mask, '分攤運費'] = ship_fee
-                    df_history.loc[h_mask, '海關稅金'] = tax_fee
-                    df_history.loc[h_mask, '物流狀態'] = "已完成入庫"
-
-
-            # 5. 移除追蹤與清理輔助欄位
-            df_tracking_new = df_tracking[df_tracking['tmp_id'] != target_pur_id].copy()
-            df_tracking_new.drop(columns=['tmp_id'], inplace=True, errors='ignore')
-            df_history.drop(columns=['tmp_id'], inplace=True, errors='ignore')
-
-            # 6. 存檔
+            # 存檔
             if self._universal_save({
                 SHEET_PRODUCTS: df_prods,
                 SHEET_PUR_TRACKING: df_tracking_new,
@@ -4717,97 +5374,23 @@ class SalesApp:
             return
 
         try:
+            import oms_core
             with pd.ExcelFile(FILE_NAME) as xls:
                 df_h = pd.read_excel(xls, sheet_name=SHEET_PURCHASES)
                 df_v = pd.read_excel(xls, sheet_name=SHEET_VENDORS)
 
-            float_cols = ['平均前置天數', '綜合評等分數']
-            for col in float_cols:
-                if col in df_v.columns:
-                    # 先轉成 numeric 處理 NaN，再強制轉成 float
-                    df_v[col] = pd.to_numeric(df_v[col], errors='coerce').astype(float)
-            
-            # 星等通常是整數，但也建議轉成 float 以免意外
-            if '星等' in df_v.columns:
-                df_v['星等'] = pd.to_numeric(df_v['星等'], errors='coerce').fillna(5).astype(float)
-
-            # 1. 篩選該廠商的所有已入庫紀錄
-            v_mask = (df_h['供應商'].astype(str).str.strip() == vendor_name)
-            finished_purchases = df_h[v_mask & (df_h['入庫日期'].notna()) & (df_h['入庫日期'] != "")].copy()
-
-            if finished_purchases.empty:
-                return
-
-            # --- A. 計算平均前置天數 (Lead Time) ---
-            p_date = pd.to_datetime(finished_purchases['採購日期'], errors='coerce')
-            i_date = pd.to_datetime(finished_purchases['入庫日期'], errors='coerce')
-            # 過濾無效日期
-            valid_dates = (p_date.notna()) & (i_date.notna())
-            days_diffs = (i_date[valid_dates] - p_date[valid_dates]).dt.days
-            avg_lead_time = round(days_diffs.mean(), 1) if not days_diffs.empty else 0
-
-            # --- B. 計算品質合格率 (Quality Rate) ---
-            # 合格率 = (1 - 總瑕疵數 / 總到貨數)
-            total_qty = pd.to_numeric(finished_purchases['數量'], errors='coerce').sum()
-            total_defects = pd.to_numeric(finished_purchases.get('瑕疵數量', 0), errors='coerce').sum()
-            quality_rate = round((1 - (total_defects / total_qty)) * 100, 1) if total_qty > 0 else 100
-
-            # --- C. 計算到貨滿足率 (Fulfillment Rate) ---
-            # 滿足率 = (實際到貨數 / 原始預計數)
-            original_expected = pd.to_numeric(finished_purchases.get('原始預計數量', total_qty), errors='coerce').sum()
-            fulfillment_rate = round((total_qty / original_expected) * 100, 1) if original_expected > 0 else 100
-
-
-
-
-            
-            # --- D. 綜合評分演算法 (進化版：數據 80% + 人為 20%) ---
-            # 1. 取得人為印象分數 (1-5 轉為 0-100)
+            # 人為印象分數 (1-5 星，沒填預設滿分印象)，佔綜合評分 20%
             try:
-                manual_val = int(self.var_v_manual_adj.get()) * 20 
+                manual_stars = int(self.var_v_manual_adj.get())
             except Exception:
-                manual_val = 100 # 沒填預設滿分印象
-
-            # 2. 計算系統數據得分 (品質 40%, 時效 30%, 滿足率 10%)
-            time_score = max(100 - (avg_lead_time * 5), 0)
-            system_data_score = (quality_rate * 0.4) + (time_score * 0.3) + (fulfillment_rate * 0.1)
-
-            # 3. 最終混合評分
-            final_score = (system_data_score * 0.8) + (manual_val * 0.2)
-
-            # 轉換為星等 (5星制)
-            star = 1
-            if final_score >= 90: 
-                star = 5
-            elif final_score >= 80: 
-                star = 4
-            elif final_score >= 70: 
-                star = 3
-            elif final_score >= 60: 
-                star = 2
-
-            # 2. 更新回廠商分頁
-            if vendor_name in df_v['廠商名稱'].astype(str).str.strip().values:
-                idx = df_v[df_v['廠商名稱'].astype(str).str.strip() == vendor_name].index[0]
-                
-                # 強制轉為數值型態後再賦值
-                df_v.at[idx, '平均前置天數'] = float(avg_lead_time)
-                df_v.at[idx, '綜合評等分數'] = float(round(final_score, 1))
-                df_v.at[idx, '星等'] = int(star)
-                
-                # 強制轉為數值型態後再賦值
-                df_v.at[idx, '總到貨率'] = f"{fulfillment_rate}%"
-                df_v.at[idx, '總合格率'] = f"{quality_rate}%"
-                df_v.at[idx, '最後更新'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-                # 存檔 (保護其他分頁)
-
-                for col in ['平均前置天數', '綜合評等分數', '星等']:
-                    df_v[col] = pd.to_numeric(df_v[col], errors='coerce').fillna(0)
-
-                self._universal_save({SHEET_VENDORS: df_v})
+                manual_stars = 5
 
-                if self._universal_save({SHEET_VENDORS: df_v}):
-                    print(f"system: vendor performance updated (Score: {final_score})")
+            perf = oms_core.vendor_performance(df_h, vendor_name, manual_stars)
+            if perf is None:
+                return
+            df_v = oms_core.apply_vendor_score(df_v, vendor_name, perf)
+            if df_v is not None and self._universal_save({SHEET_VENDORS: df_v}):
+                print(f"system: vendor performance updated (Score: {perf['score']})")
 
         except Exception as e:
             print(f"system: failed to update vendor analysis: {e}")
@@ -4951,7 +5534,7 @@ class SalesApp:
             traceback.print_exc()
             messagebox.showerror("錯誤", f"進貨作業失敗: {str(e)}")
 
-    @thread_safe_file
+    @thread_safe_read
     def load_purchase_data(self):
         """ 載入最近進貨清單 """
         for i in self.tree_purchase.get_children(): 
@@ -4978,29 +5561,32 @@ class SalesApp:
         # 傳入 self.root 作為父視窗，傳入 self 作為 app 實例
         LogisticsWizard(self.root, self)
 
-    @thread_safe_file
-    def _get_full_order_info(self, df, order_id):
-        """ 強化版：從同一編號中找出『任何一列』含有資料的內容，確保不會因刪除首行而遺失資訊 """
-        clean_id = str(order_id).replace("'", "").strip()
-        # 找出該訂單的所有列
-        subset = df[df['訂單編號'].astype(str).str.contains(clean_id)]
-        
-        if subset.empty: 
-            return {}
+    # ================= 區網伺服器模式 =================
+    def _read_sheet(self, sheet_name):
+        """ 讀取分頁：伺服器模式向 OrderServer 取得，單機模式讀本機活頁簿 """
+        if self.oms_client is not None:
+            return self.oms_client.sheet(sheet_name)
+        return pd.read_excel(FILE_NAME, sheet_name=sheet_name)
+
+    def _remote_order_action(self, call, args, success_msg, returns=False, purchases=False):
+        """ 伺服器模式：在背景送出請求，完成後重新整理相關清單 """
+        def done(_):
+            messagebox.showinfo("成功", success_msg)
+            self.load_tracking_data()
+            if returns:
+                self.load_returns_data()
+            if purchases:
+                self.load_purchase_tracking()
+                self.products_df = self.load_products()
+                self.update_sales_prod_list()
 
-        # 定義需要找尋的標頭欄位
-        header_cols = ['日期', '買家名稱', '交易平台', '寄送方式', '取貨地點', '扣費項目']
-        result = {}
+        self.executor.submit(call, *args, name=f"remote_{call.__name__}", on_done=done,
+                             on_error=lambda e: messagebox.showerror("錯誤", f"伺服器操作失敗: {e}"))
 
-        for col in header_cols:
-            if col in subset.columns:
-                # 找尋該欄位中第一個不是空的、不是 NaN 的值
-                valid_rows = subset[subset[col].notna() & (subset[col].astype(str).str.strip() != "")]
-                if not valid_rows.empty:
-                    result[col] = valid_rows.iloc[0][col]
-                else:
-                    result[col] = "" # 若真的都沒資料則留空
-        return result
+    def _get_full_order_info(self, df, order_id):
+        """ 強化版：從同一編號中找出『任何一列』含有資料的內容，確保不會因刪除首行而遺失資訊 """
+        import oms_core
+        return oms_core.full_order_info(df, order_id)
     
     @thread_safe_file
     def action_track_return_item(self):
@@ -5077,69 +5663,26 @@ class SalesApp:
         if not messagebox.askyesno("結案確認", f"確定訂單 [{order_id}] 已完成？"): 
             return
 
+        if self.oms_client is not None:
+            self._remote_order_action(self.oms_client.complete_order, (order_id,),
+                                      f"訂單 {order_id} 結案成功！")
+            return
+
         try:
+            import oms_core
             # 1. 讀取追蹤與銷售紀錄
-            df_track = pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING)
-            df_track['訂單編號'] = df_track['訂單編號'].astype(str).str.replace(r'^\'', '', regex=True).str.replace(r'\.0$', '', regex=True).str.strip()
-            
+            df_track = oms_core.normalize_order_ids(pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING))
             try: 
                 df_sales = pd.read_excel(FILE_NAME, sheet_name=SHEET_SALES)
             except Exception:
                 df_sales = pd.DataFrame()
 
-            # --- [核心修正步驟 A：處理舊有銷售紀錄，防止排序斷鏈] ---
-            if not df_sales.empty:
-                # 先將所有空字串轉為真正的 NaN，這樣 ffill 才會生效
-                df_sales = df_sales.replace(r'^\s*$', pd.NA, regex=True)
-                
-                # 為了防止排序時空日期掉到最後，我們先按『訂單編號』分組，把遺失的日期與買家補回來
-                header_cols = ['日期', '買家名稱', '交易平台', '寄送方式', '取貨地點', '扣費項目']
-                # 暫時清理編號以便匹配
-                df_sales['tmp_id'] = df_sales['訂單編號'].astype(str).str.replace("'", "").str.strip()
-                # 分組向下填充：這確保每一行商品都暫時擁有正確的日期
-                df_sales[header_cols] = df_sales.groupby('tmp_id', group_keys=False)[header_cols].apply(lambda x: x.ffill().bfill())
-
-            # 2. 獲取本次要結案的訂單資訊
-            full_info = self._get_full_order_info(df_track, order_id)
-            mask = df_track['訂單編號'] == order_id
-            rows_to_finish = df_track[mask].copy()
-
-            # 確保這次結案的資料也是完整的
-            for col, val in full_info.items():
-                rows_to_finish[col] = val
-
-            # 3. 合併新舊資料
-            df_sales_combined = pd.concat([df_sales, rows_to_finish], ignore_index=True)
-
-            # --- [核心修正步驟 B：執行精準排序] ---
-            # 統一轉換日期格式，這時因為 A 步驟補過位，日期不會是空的
-            df_sales_combined['tmp_date'] = pd.to_datetime(df_sales_combined['日期'], errors='coerce')
-            # 將訂單編號轉為清潔字串進行排序
-            df_sales_combined['tmp_clean_id'] = df_sales_combined['訂單編號'].astype(str).str.replace("'", "").str.strip()
-            
-            # 排序：日期(新到舊) -> 編號(大到小)
-            df_sales_combined = df_sales_combined.sort_values(by=['tmp_date', 'tmp_clean_id'], ascending=[False, False])
-            df_sales_combined = df_sales_combined.reset_index(drop=True)
-
-            # --- [核心修正步驟 C：重新執行視覺去重 (美化)] ---
-            prev_id = None
-            for i in range(len(df_sales_combined)):
-                curr_id = df_sales_combined.at[i, 'tmp_clean_id']
-                if curr_id == prev_id:
-                    # 同一單的後續列，清空重複資訊
-                    for col in header_cols:
-                        df_sales_combined.at[i, col] = ""
-                else:
-                    # 新訂單的第一列，保留資訊
-                    prev_id = curr_id
-            
-            # 移除所有臨時輔助欄位
-            drop_cols = ['tmp_date', 'tmp_clean_id', 'tmp_id']
-            df_sales_combined = df_sales_combined.drop(columns=[c for c in drop_cols if c in df_sales_combined.columns])
+            # 2. 移入銷售紀錄：補齊標頭後依 日期(新到舊) -> 編號(大到小) 排序，再重新做視覺去重
+            df_track_rest, df_sales_combined = oms_core.complete_order(df_track, df_sales, order_id)
 
-            # 4. 執行萬用存檔
+            # 3. 執行萬用存檔
             success = self._universal_save({
-                SHEET_TRACKING: df_track[~mask], 
+                SHEET_TRACKING: df_track_rest, 
                 SHEET_SALES: df_sales_combined
             })
         
@@ -5163,91 +5706,58 @@ class SalesApp:
 
         """ 
         更新 還原功能
-        1. 執行緒鎖 (Thread Lock)：防止併發衝突。
+        1. 執行緒鎖 (Thread Lock)：整個讀改寫持有寫入鎖 (可重入，已持有鎖的呼叫端不受影響)。
         2. 原子性寫入 (Atomic Write)：使用臨時檔置換，防止寫入中斷導致檔案毀損。
         3. 資料校準 (Data Scrubbing)：消滅 nan,保護 ID 格式。
 
         """
     
-        # 拆解路徑，確保 temp_ 只加在「檔名」前面，而不是整個路徑前面
-        directory = os.path.dirname(FILE_NAME)
-        base_name = os.path.basename(FILE_NAME)
-        
-        temp_file = os.path.join(directory, "temp_" + base_name)
-        bak_file = FILE_NAME + ".bak"
+        if self.oms_client is not None:
+            # 伺服器模式下活頁簿由 OrderServer 獨佔；尚未改走 API 的功能不可寫入本機舊檔
+            messagebox.showwarning("伺服器模式", "此功能需在伺服器主機上以單機模式操作。")
+            return False
+
+        import oms_core
+        # 暫存檔與正式檔同目錄，temp_ 只加在「檔名」前面 (由 write_workbook 建立與清除)
+        temp_file = os.path.join(os.path.dirname(FILE_NAME), "temp_" + os.path.basename(FILE_NAME))
             
         try:
-            all_data = {}
-            # 1. 讀取現有分頁
-            if os.path.exists(FILE_NAME):
-                with pd.ExcelFile(FILE_NAME) as xls:
-                    for sn in xls.sheet_names:
-                        all_data[sn] = pd.read_excel(xls, sheet_name=sn)
-
-            # --- [核心修改：在套用更新前，備份目前的完整狀態] ---
-            # 我們使用 deepcopy 確保備份的是真正的資料，而不是記憶體位置
-            if updates_dict and not is_undo:
-                self.undo_buffer = copy.deepcopy(all_data)
-                self.undo_pages = list(updates_dict.keys())
-            # -----------------------------------------------
-            
-            # 2. 更新資料並進行保護
-            for sheet_name, df in updates_dict.items():
-                # 數據完整性保護：防止意外存入空表
-                if sheet_name in all_data and not all_data[sheet_name].empty:
-                    if df is None or df.empty:
+            # 精靈視窗等呼叫端不一定持有檔案鎖：寫入期間正式檔會短暫不存在，背景讀取 (自動備份複製) 必須等待
+            with self.file_lock:
+                prev_stamp = self._workbook_stamp()
+                all_data = {}
+                # 1. 讀取現有分頁
+                if os.path.exists(FILE_NAME):
+                    with pd.ExcelFile(FILE_NAME) as xls:
+                        for sn in xls.sheet_names:
+                            all_data[sn] = pd.read_excel(xls, sheet_name=sn)
+
+                # --- [核心修改：在套用更新前，備份目前的完整狀態] ---
+                # 我們使用 deepcopy 確保備份的是真正的資料，而不是記憶體位置
+                if updates_dict and not is_undo:
+                    self.undo_buffer = copy.deepcopy(all_data)
+                    self.undo_pages = list(updates_dict.keys())
+                # -----------------------------------------------
+            
+                # 2. 更新資料並進行保護
+                for sheet_name, df in updates_dict.items():
+                    # 數據完整性保護：防止意外存入空表 (保留欄位的空表代表資料已全部移出，可以存)
+                    if oms_core.blocks_empty_save(all_data.get(sheet_name), df):
                         print(f"[WARNING] Blocked empty save attempt for sheet: {sheet_name}")
                         continue 
-                all_data[sheet_name] = df
+                    all_data[sheet_name] = df
 
-            # 3. 核心數據清洗 (您原本的高階邏輯)
-            text_protection_cols = ['訂單編號', '進貨單號', '物流追蹤', '商品編號', '廠商名稱', '商店名', '統編']
-            for sn, df in all_data.items():
-                if df is None or df.empty: 
-                    continue
-                df = df.fillna("")
-                for col in df.columns:
-                    if col in text_protection_cols:
-                        def clean_logic(x):
-                            s = str(x).strip()
-                            if s.lower() in ['nan', 'none', '', 'nat']: 
-                                return ""
-                            if s.endswith('.0'): 
-                                s = s[:-2]
-                            s = s.lstrip("'")
-                            if col in ['訂單編號', '進貨單號', '物流追蹤']: 
-                                return f"'{s}"
-                            return s
-                        df[col] = df[col].apply(clean_logic)
-                
-                if sn == SHEET_VENDORS and '廠商名稱' in df.columns:
-                    df = df[df['廠商名稱'].astype(str).str.lower() != "nan"]
-                    df = df[df['廠商名稱'].astype(str).str.strip() != ""]
-                all_data[sn] = df
-
-            # --- 4. 關鍵修正：先寫入「臨時檔案」 ---
-            standard_order = [SHEET_PRODUCTS, SHEET_SALES, SHEET_TRACKING, SHEET_PURCHASES, SHEET_PUR_TRACKING, SHEET_RETURNS, SHEET_FEES, SHEET_SYS_SETTINGS, SHEET_VENDORS, SHEET_AFTER_SALES]
-            
-            with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
-                for sn in standard_order:
-                    if sn in all_data:
-                        all_data[sn].to_excel(writer, sheet_name=sn, index=False)
-                for sn, df in all_data.items():
-                    if sn not in standard_order:
-                        df.to_excel(writer, sheet_name=sn, index=False)
-
-            # --- 5. 檔案原子置換 (The Atomic Swap) ---
-            # 走到這裡，代表臨時檔寫入成功了，現在才動原始檔案
-            if os.path.exists(FILE_NAME):
-                # 建立 .bak 備份（以防萬一）
-                if os.path.exists(bak_file):
-                    os.remove(bak_file)
-                os.rename(FILE_NAME, bak_file)
-            
-            # 將臨時檔改名為正式檔 (此動作在 OS 層級是極快的，幾乎不會中斷)
-            os.rename(temp_file, FILE_NAME)
+                # 3. 核心數據清洗：消滅 nan、保護編號格式
+                oms_core.scrub_frames(all_data)
+
+                # 4. 先寫入「臨時檔案」，成功後才原子置換正式檔 (舊檔保留為 .bak)
+                sheet_order = oms_core.write_workbook(FILE_NAME, all_data)
+
+                # 5. 記錄本機快照 (只序列化本次更新的分頁，其餘沿用上一個快照)
+                self._record_snapshot(all_data, sheet_order, list(updates_dict), prev_stamp)
+                self.auto_backup.notify_write()
             
-            return True
+                return True
 
         except PermissionError:
             messagebox.showerror("存檔失敗", "Excel 檔案正被其他程式開啟中，請先關閉 Excel!")
@@ -5263,6 +5773,77 @@ class SalesApp:
             return False
         
 
+    # ================= 本機快照 =================
+    def _get_snapshot_store(self):
+        if self.snapshot_store is None:
+            from SnapshotStore import SnapshotStore
+            self.snapshot_store = SnapshotStore(SNAPSHOT_DIR)
+        return self.snapshot_store
+
+    @staticmethod
+    def _workbook_stamp():
+        if not os.path.exists(FILE_NAME):
+            return None
+        st = os.stat(FILE_NAME)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _record_snapshot(self, all_data, sheet_order, changed, prev_stamp):
+        """ 快照失敗不影響存檔本身，只記錄訊息 """
+        try:
+            store = self._get_snapshot_store()
+            snap_id, written = store.snapshot(all_data, sheet_order, changed, FILE_NAME, prev_stamp)
+            removed, freed = store.maybe_prune()
+            print(f"system: snapshot {snap_id} (+{written / 1024:.1f} KB)"
+                  + (f", pruned {removed} ({freed / 1024:.1f} KB)" if removed else ""))
+        except Exception as e:
+            print(f"system: failed to record snapshot: {e}")
+
+    @requires_tab('tab_backup')
+    def refresh_snapshot_list(self):
+        for item in self.tree_snapshot.get_children():
+            self.tree_snapshot.delete(item)
+        try:
+            store = self._get_snapshot_store()
+            snaps = store.list_snapshots()
+            for snap_id in snaps:
+                manifest = store.load_manifest(snap_id)
+                self.tree_snapshot.insert("", "end", iid=snap_id, values=(
+                    manifest["created"].replace("T", " "), "、".join(manifest.get("changed", []))))
+            self.lbl_snapshot_usage.config(text=f"共 {len(snaps)} 份，佔用 {store.disk_usage() / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            print(f"system: failed to list snapshots: {e}")
+
+    @thread_safe_file
+    def action_restore_snapshot(self, whole=False):
+        """ 將選取的快照 (單一分頁或整份) 寫回活頁簿；寫回本身也會產生新的快照，可再復原 """
+        sel = self.tree_snapshot.selection()
+        if not sel:
+            messagebox.showwarning("提示", "請先選擇一個快照")
+            return
+        snap_id = sel[0]
+        sheet = self.var_snapshot_sheet.get()
+        if not whole and not sheet:
+            messagebox.showwarning("提示", "請選擇要還原的分頁")
+            return
+        when = self.tree_snapshot.item(snap_id, "values")[0]
+        scope = "所有分頁" if whole else f"『{sheet}』"
+        if not messagebox.askyesno("確認還原", f"將 {scope} 還原成 {when} 的狀態？\n\n(目前資料會另存為新快照，可再還原回來)"):
+            return
+
+        try:
+            store = self._get_snapshot_store()
+            if whole:
+                _, updates = store.load_all(snap_id)
+            else:
+                updates = {sheet: store.load_table(snap_id, sheet)}
+        except Exception as e:
+            messagebox.showerror("還原失敗", f"讀取快照失敗: {e}")
+            return
+
+        if self._universal_save(updates):
+            self.reload_all_data()
+            messagebox.showinfo("成功", f"已將 {scope} 還原至 {when}")
+
     @thread_safe_file
     def action_perform_undo(self):
         """ 智慧型還原：列出詳細更動並恢復資料 """
@@ -5340,6 +5921,7 @@ class SalesApp:
         elif self.var_cust_loc.get() == "面交": 
             self.var_cust_loc.set("")
 
+    @requires_tab('tab_sales')
     def update_sales_prod_list(self, event=None):
         """ 
         優化搜尋：
@@ -5501,6 +6083,7 @@ class SalesApp:
     def update_totals_event(self, event): self.update_totals()
     
     
+    @requires_tab('tab_sales')
     def update_totals(self):
         """ 銷售輸入：使用 Decimal 進行高精度財務運算 """
         try:
@@ -5602,77 +6185,30 @@ class SalesApp:
         except Exception:
             d_extra = Decimal("0")
 
-        final_fee_tag = fee_tag if d_extra > Decimal("0") else ""
+        if self.oms_client is not None:
+            self._submit_order_remote(cust_name, cust_loc, ship_method, platform_name, date_str, d_extra, fee_tag)
+            return
 
         try:
-            rows = []
+            import oms_core
             # 讀取目前商品資料 (準備更新庫存與售價)
             df_prods_current = pd.read_excel(FILE_NAME, sheet_name=SHEET_PRODUCTS)
             now_full = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-            for i, item in enumerate(self.cart_data):
-                is_first = (i == 0)
-                
-                # --- [Decimal 分攤計算] ---
-                d_item_sales = Decimal(str(item['total_sales']))
-                d_item_cost = Decimal(str(item['total_cost']))
-                
-                ratio = d_item_sales / t_sales if t_sales > 0 else Decimal("0")
-                alloc_fee = self.dec_round(t_fee * ratio)
-                alloc_tax = self.dec_round(t_tax * ratio)
-                alloc_extra = self.dec_round(d_extra * ratio)
-                
-                net = d_item_sales - d_item_cost - alloc_fee - alloc_tax - alloc_extra
-                margin_pct = (net / d_item_sales * 100) if d_item_sales > 0 else Decimal("0")
-
-                # 準備存入銷售紀錄的資料
-                rows.append({
-                    "訂單編號": order_id,
-                    "商品編號": item.get('sku', ''),
-                    "日期": date_str if is_first else "",
-                    "買家名稱": cust_name if is_first else "",
-                    "交易平台": platform_name if is_first else "",
-                    "寄送方式": ship_method if is_first else "",
-                    "取貨地點": cust_loc if is_first else "",
-                    "商品名稱": item['name'],
-                    "數量": int(item['qty']),
-                    "單價(售)": float(item['unit_price']),
-                    "單價(進)": float(item['unit_cost']),
-                    "總銷售額": float(d_item_sales),
-                    "總成本": float(d_item_cost),
-                    "分攤手續費": float(alloc_fee),
-                    "扣費項目": final_fee_tag if is_first else "", 
-                    "總淨利": float(self.dec_round(net)),
-                    "毛利率": float(self.dec_round(margin_pct, 1)),
-                    "稅額": float(alloc_tax)
-                })
+            # Decimal 分攤手續費 / 稅額 / 額外扣費 (標頭只寫在第一列)
+            header = {"date": date_str, "buyer": cust_name, "platform": platform_name,
+                      "ship_method": ship_method, "location": cust_loc}
+            rows = oms_core.build_order_rows(self.cart_data, header, order_id, t_sales, t_fee, t_tax, d_extra, fee_tag)
 
-                # --- [核心修正：更新庫存與預設售價] ---
-                p_name = item['name']
-                sell_price = float(item['unit_price']) # 取得本次輸入的售價
-                
-                idxs = df_prods_current[df_prods_current['商品名稱'] == p_name].index
-                if not idxs.empty:
-                    target_idx = idxs[0]
-                    
-                    # 1. 扣除庫存
-                    df_prods_current.at[target_idx, '目前庫存'] -= int(item['qty'])
-                    
-                    # 2. 更新預設售價：只要本次售價 > 0，就同步回主檔
-                    if sell_price > 0:
-                        df_prods_current.at[target_idx, '預設售價'] = sell_price
-                        # 同步更新最後修改時間，展現維護嚴謹度
-                        df_prods_current.at[target_idx, '最後更新時間'] = now_full
+            # 扣除庫存，並把本次售價同步回主檔的『預設售價』
+            oms_core.apply_sale_to_products(df_prods_current, self.cart_data, now_full)
 
             # 3. 讀取並合併追蹤表
             try: 
                 df_track_existing = pd.read_excel(FILE_NAME, sheet_name=SHEET_TRACKING)
             except Exception:
                 df_track_existing = pd.DataFrame()
-
-            df_new_batch = pd.DataFrame(rows)
-            df_new_batch['訂單編號'] = df_new_batch['訂單編號'].apply(lambda x: f"'{x}")
-            df_track_combined = pd.concat([df_track_existing, df_new_batch], ignore_index=True)
+            df_track_combined = oms_core.append_to_tracking(df_track_existing, rows)
 
             # 4. 使用萬用引擎存檔 (一次更新商品主檔與追蹤表)
             if self._universal_save({
@@ -5685,27 +6221,51 @@ class SalesApp:
                 self.load_tracking_data() 
                 
                 messagebox.showinfo("成功", f"訂單 {order_id} 已送出，商品預設售價已同步更新。")
-
-                # 5. 重置 UI (歸零與清空)
-                self.cart_data = []
-                for i in self.tree.get_children(): 
-                    self.tree.delete(i)
-                
-                self.var_cust_name.set("")
-                self.var_ship_fee.set(0.0)
-                self.var_extra_fee.set(0.0)
-                self.var_fee_tag.set("")
-                self.var_sel_stock_info.set("--")
-                
-                # 費率維持使用者選取的狀態 (Sticky Selection 優化)
-                self.update_totals()
+                self._reset_sales_form()
 
         except Exception as e: 
             import traceback
             traceback.print_exc()
             messagebox.showerror("錯誤", f"提交失敗: {str(e)}")
 
+    def _reset_sales_form(self):
+        """ 送出訂單後重置 UI (歸零與清空) """
+        self.cart_data = []
+        for i in self.tree.get_children(): 
+            self.tree.delete(i)
+        
+        self.var_cust_name.set("")
+        self.var_ship_fee.set(0.0)
+        self.var_extra_fee.set(0.0)
+        self.var_fee_tag.set("")
+        self.var_sel_stock_info.set("--")
+        
+        # 費率維持使用者選取的狀態 (Sticky Selection 優化)
+        self.update_totals()
+
+    def _submit_order_remote(self, cust_name, cust_loc, ship_method, platform_name, date_str, d_extra, fee_tag):
+        """ 伺服器模式：訂單交給 OrderServer 寫入 (手續費與稅額沿用畫面上算好的金額)，完成後重新整理 """
+        _, t_fee, t_tax = self.update_totals()
+        payload = {
+            "items": [{"name": i['name'], "qty": int(i['qty']),
+                       "unit_price": float(i['unit_price']), "unit_cost": float(i['unit_cost'])} for i in self.cart_data],
+            "date": date_str, "buyer": cust_name, "platform": platform_name,
+            "ship_method": ship_method, "location": cust_loc,
+            "platform_fee": float(t_fee), "tax": float(t_tax), "extra_fee": float(d_extra), "fee_tag": fee_tag,
+        }
 
+        def done(result):
+            messagebox.showinfo("成功", f"訂單 {result['order_id']} 已送出至伺服器。")
+            self._reset_sales_form()
+            self.products_df = self.load_products()
+            self.update_sales_prod_list()
+            self.load_tracking_data()
+
+        self.executor.submit(self.oms_client.submit_order, payload, name="remote_submit_order", on_done=done,
+                             on_error=lambda e: messagebox.showerror("錯誤", f"提交失敗: {e}"))
+
+
+    @requires_tab('tab_products')
     def update_mgmt_prod_list(self):
         """ 及時更新商品管理清單 (過濾關鍵字) """
         search_term = self.var_mgmt_search.get().lower()
@@ -5972,6 +6532,14 @@ class SalesApp:
 
 def start_main_app():
     """ 這是原本啟動主程式的邏輯，包裝成一個 function """
+    t_login_done = time.perf_counter()
+    STARTUP_PROFILE.append(("login (wait for user)", t_login_done - _LOGIN_T0))
+
+    # 背景預載通常已完成；若尚未完成則在此等待
+    t0 = time.perf_counter()
+    load_core_modules()
+    STARTUP_PROFILE.append(("wait core modules", time.perf_counter() - t0))
+
     root = tk.Tk()
     style = ttk.Style()
 
@@ -5992,12 +6560,53 @@ def start_main_app():
         print(f"Theme Error: {e}")
     # 如果出錯，就維持系統預設，不強行設定
 
-    SalesApp(root)
+    app = SalesApp(root)
+
+    # 主視窗第一次閒置 = 可以操作，輸出啟動分析報告
+    if PROFILE_STARTUP:
+        root.after_idle(lambda: write_startup_profile(app, t_login_done))
 
     root.mainloop()
 
+    # 結束時輸出背景工作與檔案鎖的統計，方便追查卡頓
+    print(f"system: executor stats {app.executor.stats()}")
+    print(f"system: file lock stats {app.file_lock.stats()}")
+    app.executor.shutdown()
+
+
+def write_startup_profile(app, t_login_done):
+    """ --profile-startup：輸出匯入耗時與初始化各階段耗時報告 """
+    now = time.perf_counter()
+    lines = [
+        f"Startup profile ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})",
+        f"login window shown at      {(_LOGIN_T0 - _MODULE_T0) * 1000:9.1f} ms",
+        f"main window interactive in {(now - t_login_done) * 1000:9.1f} ms (after login)",
+        "",
+        "[imports / pre-main]",
+    ]
+    lines += [f"  {name:<32}{cost * 1000:9.1f} ms" for name, cost in STARTUP_PROFILE]
+    lines += ["", "[SalesApp init phases]"]
+    lines += [f"  {name:<32}{cost * 1000:9.1f} ms" for name, cost in app.startup_timings]
+    lines += ["", "tip: python -X importtime main.py 可取得逐模組匯入明細"]
+    report = "\n".join(lines)
+    print(report)
+    try:
+        with open("startup_profile.txt", "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print("system: startup profile written to startup_profile.txt")
+    except Exception as e:
+        print(f"system: failed to write startup profile: {e}")
+
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()   # 打包成 exe 後，分析運算的子行程需要
+    STARTUP_PROFILE.append(("module import (tk/stdlib)", time.perf_counter() - _MODULE_T0))
+    _LOGIN_T0 = time.perf_counter()
+
+    # 登入視窗顯示期間，於背景預載 pandas 與功能模組
+    threading.Thread(target=load_core_modules, daemon=True).start()
+
     # 1. 先顯示登入視窗
     # 2. 傳入 start_main_app 作為成功後的執行動作
     login = LoginWindow(start_main_app)
@@ -0,0 +1,44 @@
+"""
+oms_core：不依賴 Tk 的核心業務邏輯
+所有函式只吃 DataFrame / 數值並回傳結果，不讀 tk 變數、不碰 Treeview，
+SalesApp、各精靈視窗、區網伺服器、命令列工具與效能測試都呼叫同一套程式。
+
+    schema       分頁名稱與欄位常數
+    workbook     讀取分頁、存檔前資料校準、原子寫入
+    orders       送出訂單費用分攤、結案、整筆退貨、退回修改
+    purchasing   物流狀態更新、退回採購單、進貨入庫 (加權平均成本)、運費關稅分攤 (含集運併箱)、廠商績效
+    procurement  採購建議 (補貨點)
+    analysis     營收分析
+    store        伺服器端資料庫 (group commit)
+"""
+import importlib
+
+from .common import OrderNotFound, clean_id, clean_ids, dec_round, normalize_order_ids, writable_cols
+from .schema import *  # noqa: F401,F403
+
+# 其餘子模組依賴 pandas，第一次取用時才載入 (main.py 啟動時只需要分頁名稱常數，不必先載入 pandas)
+_LAZY_EXPORTS = {
+    "orders": ("append_to_tracking", "apply_sale_to_products", "build_order_rows", "cart_from_request",
+               "complete_order", "complete_orders", "fee_table", "full_order_info", "platform_fee", "recall_orders",
+               "restock_products", "return_order"),
+    "procurement": ("procurement_report",),
+    "purchasing": ("advance_logistics", "allocate_cents", "allocate_landed_cost", "allocate_shipping",
+                   "apply_vendor_score", "clean_tracking_numbers", "confirm_inbound", "purchase_line_keys",
+                   "recall_purchases", "shipment_orders", "update_logistics", "vendor_performance"),
+    "workbook": ("as_read_back", "blocks_empty_save", "read_sheets", "scrub_frame", "scrub_frames", "sheet_order_of",
+                 "write_workbook"),
+}
+_LAZY = {name: module for module, names in _LAZY_EXPORTS.items() for name in names}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
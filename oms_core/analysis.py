@@ -0,0 +1,110 @@
+"""
+營收分析運算 (與介面分離，可在背景行程執行)
+compute_analysis 只讀取活頁簿並回傳純資料，由 SalesApp 在 UI 執行緒填入表格。
+運算規則與原本的 calculate_analysis_data 相同：主子表分離，售後支出由淨利中對沖。
+"""
+from decimal import Decimal
+
+import pandas as pd
+
+SORT_KEYS = {"平均毛利率": "margin", "總銷量排行": "qty", "總獲利排行": "profit", "銷售速度排行": "velocity"}
+
+
+def _dec_sum(values):
+    total = Decimal("0.00")
+    for v in values:
+        total += Decimal(str(v))
+    return total
+
+
+def _in_range(dates, date_from, date_to):
+    """ 日期區間篩選 (含頭尾)；未指定區間時全部保留，指定後日期無法解析的列排除 """
+    keep = pd.Series(True, index=dates.index)
+    if date_from is not None:
+        keep &= dates >= pd.Timestamp(date_from)
+    if date_to is not None:
+        keep &= dates < pd.Timestamp(date_to) + pd.Timedelta(days=1)
+    return keep
+
+
+def compute_analysis(file_name, sheet_sales, sheet_products, sheet_after_sales, sort_mode,
+                     date_from=None, date_to=None, daily_limit=10):
+    """
+    回傳 {"monthly": [(月份, 營收, 實質淨利, 單數)], "daily": [...近 daily_limit 日], "products": [dict]}
+    date_from / date_to 限定銷售日期與售後發生日期 (含頭尾)；daily_limit=None 列出區間內每一天。
+    沒有銷售資料時回傳 None
+    """
+    # --- [第一階段：處理售後子表數據] ---
+    as_month_map, as_date_map, as_prod_map = {}, {}, {}
+    with pd.ExcelFile(file_name) as xls:
+        if sheet_after_sales in xls.sheet_names:
+            df_as = pd.read_excel(xls, sheet_name=sheet_after_sales)
+            if not df_as.empty:
+                df_as['發生日期'] = pd.to_datetime(df_as['發生日期'], errors='coerce')
+                df_as = df_as.dropna(subset=['發生日期'])
+                df_as = df_as[_in_range(df_as['發生日期'], date_from, date_to)]
+                df_as['月份'] = df_as['發生日期'].dt.strftime('%Y-%m')
+                df_as['日期字串'] = df_as['發生日期'].dt.strftime('%Y-%m-%d')
+                as_month_map = df_as.groupby('月份')['支出金額'].sum().to_dict()
+                as_date_map = df_as.groupby('日期字串')['支出金額'].sum().to_dict()
+                as_prod_map = df_as.groupby('商品名稱')['支出金額'].sum().to_dict()
+
+        # --- [第二階段：處理原始銷售數據] ---
+        df_sales = pd.read_excel(xls, sheet_name=sheet_sales)
+        df_prods = pd.read_excel(xls, sheet_name=sheet_products)
+
+    if df_sales.empty:
+        return None
+
+    df_sales = df_sales.replace(r'^\s*$', pd.NA, regex=True)
+    for col in ['訂單編號', '日期', '買家名稱', '交易平台']:
+        if col in df_sales.columns:
+            df_sales[col] = df_sales[col].ffill()
+
+    df_sales = df_sales.dropna(subset=['商品名稱'])
+    df_sales['日期'] = pd.to_datetime(df_sales['日期'], errors='coerce')
+    if date_from is not None or date_to is not None:
+        df_sales = df_sales[_in_range(df_sales['日期'], date_from, date_to)]
+        if df_sales.empty:
+            return None
+
+    # --- [第三階段：時間維度統計] ---
+    monthly, daily = [], []
+    df_time = df_sales.dropna(subset=['日期']).copy()
+    if not df_time.empty:
+        df_time['月份'] = df_time['日期'].dt.strftime('%Y-%m')
+        for month, group in df_time.groupby('月份', sort=False):
+            # 實質淨利 = 原始淨利 - 該月售後支出
+            profit = _dec_sum(group['總淨利']) - Decimal(str(as_month_map.get(month, 0)))
+            monthly.append((month, _dec_sum(group['總銷售額']), profit, group['訂單編號'].nunique()))
+        monthly.sort(key=lambda x: x[0], reverse=True)
+
+        df_time['日期字串'] = df_time['日期'].dt.strftime('%Y-%m-%d')
+        for d_str, group in df_time.groupby('日期字串', sort=False):
+            profit = _dec_sum(group['總淨利']) - Decimal(str(as_date_map.get(d_str, 0)))
+            daily.append((d_str, _dec_sum(group['總銷售額']), profit, group['訂單編號'].nunique()))
+        daily.sort(key=lambda x: x[0], reverse=True)
+        if daily_limit is not None:
+            daily = daily[:daily_limit]
+
+    # --- [第四階段：商品排行榜 (同樣扣除售後支出)] ---
+    listed = df_prods.drop_duplicates('商品名稱', keep='last').set_index('商品名稱')['初始上架時間'] \
+        if '初始上架時間' in df_prods.columns else pd.Series(dtype=object)
+    now = pd.Timestamp.now()
+    products = []
+    for p_name, group in df_sales.groupby('商品名稱'):
+        total_qty = group['數量'].sum()
+        total_sales = _dec_sum(group['總銷售額'])
+        final_profit = _dec_sum(group['總淨利']) - Decimal(str(as_prod_map.get(p_name, 0)))
+        margin = (final_profit / total_sales * 100) if total_sales > 0 else Decimal("0")
+
+        # 計算速度 (Velocity)：上架日起每日平均銷量
+        st_date = pd.to_datetime(listed.get(p_name), errors='coerce')
+        if pd.isna(st_date):
+            st_date = group['日期'].min()
+        days = max((now - st_date).days, 1)
+        products.append({'name': p_name, 'margin': margin, 'profit': final_profit,
+                         'qty': total_qty, 'velocity': float(total_qty) / days})
+
+    products.sort(key=lambda x: x[SORT_KEYS.get(sort_mode, 'profit')], reverse=True)
+    return {"monthly": monthly, "daily": daily, "products": products}
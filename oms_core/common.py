@@ -0,0 +1,37 @@
+"""
+共用小工具：Decimal 四捨五入、編號清理、欄位型態處理與例外
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+
+class OrderNotFound(LookupError):
+    """ 找不到指定的訂單 / 進貨單 """
+
+
+def dec_round(value, places=2):
+    """ 將數值轉換為 Decimal 並精確四捨五入到指定位數 """
+    return Decimal(str(value)).quantize(Decimal(f"1.{'0' * places}"), rounding=ROUND_HALF_UP)
+
+
+def clean_id(value):
+    return str(value).replace("'", "").strip()
+
+
+def writable_cols(df, cols):
+    """ 欄位轉為 object，之後才能寫入不同型態的值 (例如全空的 float64 欄位寫入時間字串) """
+    for col in cols:
+        if col in df.columns and df[col].dtype != object:
+            df[col] = df[col].astype(object)
+    return df
+
+
+def clean_ids(series):
+    """ 編號欄位整批清理 (clean_id 的向量化版本)：去掉保護用的 ' 、Excel 轉數字留下的 .0 與空白，空值為 "" """
+    s = series.fillna("").astype(str).str.strip().str.replace(r"^'|\.0$", "", regex=True).str.strip()
+    return s.where(s.str.lower() != "nan", "")
+
+
+def normalize_order_ids(df):
+    """ 追蹤表讀入後的編號整理 (見 clean_ids) """
+    df['訂單編號'] = clean_ids(df['訂單編號'])
+    return df
@@ -0,0 +1,240 @@
+"""
+銷售訂單：送出訂單的費用分攤、結案、整筆退貨、退回修改 (庫存補回)
+"""
+from decimal import Decimal
+
+import pandas as pd
+
+from .common import OrderNotFound, clean_id, dec_round, writable_cols
+from .schema import ORDER_HEADER_COLS
+
+
+def platform_fee(t_sales, rate, fixed):
+    """ 平台手續費 = 總銷售額 * 費率% + 固定費 """
+    return dec_round(Decimal(str(t_sales)) * (Decimal(str(rate)) / Decimal("100")) + Decimal(str(fixed)))
+
+
+def fee_table(df_fees):
+    """ 手續費設定分頁 -> {設定名稱: (費率百分比, 固定金額)} """
+    table = {}
+    if df_fees is None or df_fees.empty:
+        return table
+    for _, row in df_fees.dropna(subset=['設定名稱']).iterrows():
+        fixed = pd.to_numeric(row.get('固定金額', 0), errors='coerce')
+        table[str(row['設定名稱']).strip()] = (float(row['費率百分比']), 0.0 if pd.isna(fixed) else float(fixed))
+    return table
+
+
+def build_order_rows(items, header, order_id, t_sales, t_fee, t_tax=Decimal("0.00"), d_extra=Decimal("0"), fee_tag=""):
+    """
+    依銷售額比例分攤手續費 / 稅額 / 額外扣費，產生寫入訂單追蹤的列 (標頭只寫在第一列)。
+    items:  [{"name", "qty", "unit_price", "unit_cost", "total_sales", "total_cost", "sku"}]
+    header: {"date", "buyer", "platform", "ship_method", "location"}
+    """
+    final_fee_tag = fee_tag if d_extra > Decimal("0") else ""
+    rows = []
+    for i, item in enumerate(items):
+        is_first = (i == 0)
+        d_item_sales = Decimal(str(item['total_sales']))
+        d_item_cost = Decimal(str(item['total_cost']))
+
+        ratio = d_item_sales / t_sales if t_sales > 0 else Decimal("0")
+        alloc_fee = dec_round(t_fee * ratio)
+        alloc_tax = dec_round(t_tax * ratio)
+        alloc_extra = dec_round(d_extra * ratio)
+
+        net = d_item_sales - d_item_cost - alloc_fee - alloc_tax - alloc_extra
+        margin_pct = (net / d_item_sales * 100) if d_item_sales > 0 else Decimal("0")
+
+        rows.append({
+            "訂單編號": order_id,
+            "商品編號": item.get('sku', ''),
+            "日期": header.get('date', '') if is_first else "",
+            "買家名稱": header.get('buyer', '') if is_first else "",
+            "交易平台": header.get('platform', '') if is_first else "",
+            "寄送方式": header.get('ship_method', '') if is_first else "",
+            "取貨地點": header.get('location', '') if is_first else "",
+            "商品名稱": item['name'],
+            "數量": int(item['qty']),
+            "單價(售)": float(item['unit_price']),
+            "單價(進)": float(item['unit_cost']),
+            "總銷售額": float(d_item_sales),
+            "總成本": float(d_item_cost),
+            "分攤手續費": float(alloc_fee),
+            "扣費項目": final_fee_tag if is_first else "",
+            "總淨利": float(dec_round(net)),
+            "毛利率": float(dec_round(margin_pct, 1)),
+            "稅額": float(alloc_tax)
+        })
+    return rows
+
+
+def apply_sale_to_products(df_prods, items, now_full):
+    """ 扣除庫存；本次售價 > 0 時同步回主檔的『預設售價』(直接修改 df_prods) """
+    writable_cols(df_prods, ['預設售價', '最後更新時間'])
+    for item in items:
+        sell_price = float(item['unit_price'])
+        idxs = df_prods[df_prods['商品名稱'] == item['name']].index
+        if not idxs.empty:
+            target_idx = idxs[0]
+            df_prods.at[target_idx, '目前庫存'] -= int(item['qty'])
+            if sell_price > 0:
+                df_prods.at[target_idx, '預設售價'] = sell_price
+                df_prods.at[target_idx, '最後更新時間'] = now_full
+    return df_prods
+
+
+def append_to_tracking(df_track, rows):
+    df_new_batch = pd.DataFrame(rows)
+    df_new_batch['訂單編號'] = df_new_batch['訂單編號'].apply(lambda x: f"'{x}")
+    return pd.concat([df_track, df_new_batch], ignore_index=True)
+
+
+def cart_from_request(df_prods, lines):
+    """
+    伺服器用：把 [{"name"/"sku", "qty", "unit_price"?, "unit_cost"?}] 補齊成購物車項目
+    (未指定的售價 / 成本取商品主檔的預設值)
+    """
+    cart = []
+    names = df_prods['商品名稱'].astype(str).str.strip()
+    skus = df_prods['商品編號'].astype(str).str.replace("'", "").str.strip() if '商品編號' in df_prods.columns else None
+    for line in lines:
+        if line.get('sku') and skus is not None:
+            match = df_prods[skus == str(line['sku']).strip()]
+        else:
+            match = df_prods[names == str(line.get('name', '')).strip()]
+        if match.empty:
+            raise OrderNotFound(f"找不到商品：{line.get('name') or line.get('sku')}")
+        row = match.iloc[0]
+        qty = int(line.get('qty', 1))
+        if qty <= 0:
+            raise ValueError("數量必須大於 0")
+
+        def default(key, col):
+            v = line.get(key)
+            if v is None:
+                v = pd.to_numeric(row.get(col, 0), errors='coerce')
+            return 0.0 if pd.isna(v) else float(v)
+
+        price, cost = default('unit_price', '預設售價'), default('unit_cost', '預設成本')
+        sku = row.get('商品編號', '')
+        cart.append({"sku": "" if pd.isna(sku) else str(sku).replace("'", ""), "name": str(row['商品名稱']),
+                     "qty": qty, "unit_cost": cost, "unit_price": price,
+                     "total_sales": price * qty, "total_cost": cost * qty})
+    return cart
+
+
+# ================= 結案 / 退貨 =================
+def full_order_info(df, order_id):
+    """ 從同一編號中找出『任何一列』含有資料的標頭內容，確保不會因刪除首行而遺失資訊 """
+    cid = clean_id(order_id)
+    subset = df[df['訂單編號'].astype(str).str.contains(cid)]
+    if subset.empty:
+        return {}
+    result = {}
+    for col in ORDER_HEADER_COLS:
+        if col in subset.columns:
+            valid_rows = subset[subset[col].notna() & (subset[col].astype(str).str.strip() != "")]
+            result[col] = valid_rows.iloc[0][col] if not valid_rows.empty else ""
+    return result
+
+
+def complete_orders(df_track, df_sales, order_ids):
+    """
+    批次結案：多筆訂單一次從追蹤表移到銷售紀錄，全表只排序一次。
+    排序依 日期(新到舊) -> 編號(大到小)，並重新做視覺去重 (同一單只有第一列保留標頭)。
+    df_track 需先經 normalize_order_ids。回傳 (剩餘追蹤表, 合併後銷售紀錄, 找不到的編號清單)。
+    """
+    ids = list(dict.fromkeys(clean_id(o) for o in order_ids))
+    mask = df_track['訂單編號'].isin(ids)
+    found = set(df_track.loc[mask, '訂單編號'])
+    missing = [o for o in ids if o not in found]
+    if not mask.any():
+        return df_track, df_sales, missing
+
+    header_cols = ORDER_HEADER_COLS
+    if not df_sales.empty:
+        # 空字串轉為 NaN 後依訂單分組補齊標頭，避免留白的日期排序後掉到最底部
+        df_sales = df_sales.replace(r'^\s*$', pd.NA, regex=True)
+        df_sales['tmp_id'] = df_sales['訂單編號'].astype(str).str.replace("'", "").str.strip()
+        df_sales[header_cols] = df_sales.groupby('tmp_id', group_keys=False)[header_cols].apply(lambda x: x.ffill().bfill())
+
+    # 每筆訂單的標頭取『任何一列』有資料的值 (同 full_order_info)，補到該單所有列
+    rows_to_finish = df_track[mask].copy()
+    cols = [c for c in header_cols if c in rows_to_finish.columns]
+    values = rows_to_finish[cols]
+    values = values.mask(values.isna() | (values.astype(str).apply(lambda s: s.str.strip()) == ""))
+    filled = values.groupby(rows_to_finish['訂單編號']).transform('first')
+    writable_cols(rows_to_finish, cols)
+    rows_to_finish[cols] = filled.astype(object).where(filled.notna(), "")
+
+    combined = pd.concat([df_sales, rows_to_finish], ignore_index=True)
+    combined['tmp_date'] = pd.to_datetime(combined['日期'], errors='coerce')
+    combined['tmp_clean_id'] = combined['訂單編號'].astype(str).str.replace("'", "").str.strip()
+    combined = combined.sort_values(by=['tmp_date', 'tmp_clean_id'], ascending=[False, False]).reset_index(drop=True)
+
+    # 同一單的後續列清空重複的標頭資訊
+    repeat = combined['tmp_clean_id'].eq(combined['tmp_clean_id'].shift())
+    writable_cols(combined, header_cols)
+    combined.loc[repeat, header_cols] = ""
+
+    drop_cols = ['tmp_date', 'tmp_clean_id', 'tmp_id']
+    combined = combined.drop(columns=[c for c in drop_cols if c in combined.columns])
+    return df_track[~mask], combined, missing
+
+
+def complete_order(df_track, df_sales, order_id):
+    """ 單筆訂單結案 (見 complete_orders)。回傳 (剩餘追蹤表, 合併後銷售紀錄) """
+    df_track, df_sales, missing = complete_orders(df_track, df_sales, [order_id])
+    if missing:
+        raise OrderNotFound(f"找不到訂單 {missing[0]}")
+    return df_track, df_sales
+
+
+def return_order(df_track, df_returns, order_id, reason):
+    """ 整筆退貨：把訂單的所有商品移到退貨紀錄 (補齊標頭、備註寫入原因)。回傳 (剩餘追蹤表, 退貨紀錄) """
+    order_id = clean_id(order_id)
+    mask = df_track['訂單編號'] == order_id
+    if not mask.any():
+        raise OrderNotFound(f"找不到訂單 {order_id}")
+    rows_to_return = df_track[mask].copy()
+    for col, val in full_order_info(df_track, order_id).items():
+        rows_to_return[col] = val
+    rows_to_return['備註'] = reason
+    return df_track[~mask], pd.concat([df_returns, rows_to_return], ignore_index=True)
+
+
+def restock_products(df_prods, qty_by_name, now_full=None):
+    """
+    依商品名稱批次調整庫存 (直接修改 df_prods)：名稱只建一次索引，同名時只動第一筆 (同 apply_sale_to_products)。
+    qty_by_name: Series (商品名稱 -> 數量)，正數補回、負數扣除；now_full 指定時一併更新『最後更新時間』。
+    回傳實際調整的 Series (找不到的商品略過)
+    """
+    names = df_prods['商品名稱'].fillna("").astype(str).str.strip()
+    first = names[~names.duplicated()]
+    pos = pd.Index(first.to_numpy()).get_indexer(qty_by_name.index)
+    hit = pos >= 0
+    rows = first.index[pos[hit]]
+    stock = pd.to_numeric(df_prods.loc[rows, '目前庫存'], errors='coerce').fillna(0).astype(int)
+    df_prods.loc[rows, '目前庫存'] = (stock + qty_by_name.to_numpy()[hit]).to_numpy()
+    if now_full is not None and '最後更新時間' in df_prods.columns:
+        writable_cols(df_prods, ['最後更新時間'])
+        df_prods.loc[rows, '最後更新時間'] = now_full
+    return qty_by_name[hit]
+
+
+def recall_orders(df_track, df_prods, order_ids):
+    """
+    訂單退回修改：多筆訂單一次移出追蹤表，各商品的數量彙總後一次補回庫存。
+    df_track 需先經 normalize_order_ids。
+    回傳 (剩餘追蹤表, 商品資料, 退回的訂單列, 補回的庫存 Series, 找不到的編號清單)
+    """
+    ids = list(dict.fromkeys(clean_id(o) for o in order_ids))
+    mask = df_track['訂單編號'].isin(ids)
+    found = set(df_track.loc[mask, '訂單編號'])
+    missing = [o for o in ids if o not in found]
+    rows = df_track[mask].copy()
+    qty = pd.to_numeric(rows['數量'], errors='coerce').fillna(0).astype(int)
+    delta = qty.groupby(rows['商品名稱'].fillna("").astype(str).str.strip(), sort=False).sum()
+    restored = restock_products(df_prods, delta[delta != 0])
+    return df_track[~mask], df_prods, rows, restored, missing
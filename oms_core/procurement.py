@@ -0,0 +1,62 @@
+"""
+採購建議：依銷售速率、備貨天數與安全庫存權重計算補貨點 (ROP)
+"""
+import math
+
+import pandas as pd
+
+
+def procurement_report(df_sales, df_prods, velocity_threshold=0.0, cover_days=30, safety_multiplier=1.0, now=None):
+    """
+    回傳需要補貨的商品清單 (依商品主檔順序)：
+    [{"name", "stock", "reorder_point", "velocity", "status", "tag", "suggest_qty"}]
+    tag 為 "urgent" / "warning"，對應介面上的顏色標籤。
+    """
+    if df_prods.empty:
+        return []
+    df_prods = df_prods.copy()
+    df_sales = df_sales.copy()
+    df_prods["目前庫存"] = pd.to_numeric(df_prods["目前庫存"], errors="coerce").fillna(0)
+    df_prods["安全庫存"] = pd.to_numeric(df_prods["安全庫存"], errors="coerce").fillna(0)
+    df_sales["數量"] = pd.to_numeric(df_sales["數量"], errors="coerce").fillna(0)
+    df_sales["日期"] = pd.to_datetime(df_sales["日期"], errors="coerce")
+
+    now = now or pd.Timestamp.now()
+    # 商品第一筆成交日期 (沒有上架日時作為銷售速率的分母參考)
+    first_sale_map = df_sales.groupby("商品名稱")["日期"].min().to_dict()
+    qty_sum = df_sales.groupby("商品名稱")["數量"].sum()
+
+    report = []
+    for _, row in df_prods.iterrows():
+        p_name = str(row["商品名稱"])
+        curr_stock = float(row["目前庫存"])
+        base_safety = float(row["安全庫存"])
+
+        # A. 銷售速率 (Velocity)
+        st_date = pd.to_datetime(row.get("初始上架時間"), errors="coerce")
+        if pd.isna(st_date):
+            st_date = first_sale_map.get(p_name, now)
+        days_diff = max((now - st_date).days, 1)
+        velocity = float(qty_sum.get(p_name, 0)) / days_diff
+        if velocity < velocity_threshold:
+            continue
+
+        # B. 補貨點 = (日均銷量 * 備貨天數) + (安全庫存 * 加權係數)
+        reorder_point = (velocity * cover_days) + (base_safety * safety_multiplier)
+
+        # C. 缺貨狀態
+        if curr_stock < 0:
+            status, tag = "⚠️ 帳面超賣", "urgent"
+        elif curr_stock == 0:
+            status, tag = "🚫 缺貨中", "urgent"
+        elif curr_stock <= reorder_point:
+            status, tag = "🔴 需補貨", "urgent"
+        elif curr_stock <= (base_safety * safety_multiplier) and base_safety > 0:
+            status, tag = "🟡 庫存偏低", "warning"
+        else:
+            continue
+
+        report.append({"name": p_name, "stock": int(curr_stock), "reorder_point": round(reorder_point, 1),
+                       "velocity": velocity, "status": status, "tag": tag,
+                       "suggest_qty": int(math.ceil(max(reorder_point - curr_stock, 0)))})
+    return report
@@ -0,0 +1,335 @@
+"""
+進貨：物流狀態批次更新 (手動 / 自動追蹤)、退回採購單、整筆入庫 (加權平均成本)、整單運費 / 關稅分攤、廠商績效評分
+"""
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from .common import OrderNotFound, clean_id, dec_round, writable_cols
+from .schema import LOGISTICS_STAGES, LOGISTICS_TIME_COLS
+
+
+def purchase_line_keys(df):
+    """ (進貨單號, 商品名稱) 鍵索引：整張表只清理一次，之後以 isin / get_indexer 對應 """
+    return pd.MultiIndex.from_arrays([
+        df['進貨單號'].fillna("").astype(str).str.replace("'", "").str.strip(),
+        df['商品名稱'].fillna("").astype(str).str.strip(),
+    ])
+
+
+def update_logistics(df_track, df_hist, lines, status, remark, today_str, logi_id=None, qty=None, defects=None):
+    """
+    物流維護：把選取的進貨追蹤列與對應的進貨紀錄列一次更新 (階段、備註、單號、到達時間)。
+    lines:   [(進貨追蹤列索引, 進貨單號, 商品名稱)]
+    logi_id: 新物流單號；None 表示保留原單號
+    qty / defects: 只在單筆更新時使用，依進貨單價重算進貨總額
+    回傳 (進貨追蹤, 進貨紀錄)
+    """
+    time_col = LOGISTICS_TIME_COLS.get(status)
+    values = {'物流狀態': status, '備註': remark}
+    if logi_id:
+        values['物流追蹤'] = f"'{logi_id}"
+    if time_col:
+        values[time_col] = today_str
+    for df in (df_track, df_hist):
+        for col in values:
+            if col not in df.columns:
+                df[col] = ""
+        writable_cols(df, list(values))
+
+    t_idx = [line[0] for line in lines]
+    selected = pd.MultiIndex.from_tuples([(clean_id(pur_id), str(name).strip()) for _, pur_id, name in lines])
+    h_mask = purchase_line_keys(df_hist).isin(selected)
+    for col, val in values.items():
+        df_track.loc[t_idx, col] = val
+        df_hist.loc[h_mask, col] = val
+
+    if qty is not None and len(lines) == 1:
+        # Decimal 運算，避免 980.000...01 這種浮點誤差
+        d_qty = Decimal(str(qty))
+        u_price = pd.to_numeric(pd.Series([df_track.at[t_idx[0], '進貨單價']]), errors='coerce').fillna(0.0).iloc[0]
+        new_vals = {'數量': float(d_qty), '瑕疵數量': float(Decimal(str(defects or 0))),
+                    '進貨總額': float(dec_round(d_qty * Decimal(str(u_price))))}
+        for df, rows in ((df_track, t_idx), (df_hist, h_mask)):
+            for col, val in new_vals.items():
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(float) if col in df.columns else 0.0
+                df.loc[rows, col] = val
+    return df_track, df_hist
+
+
+def clean_tracking_numbers(series):
+    """ 物流單號：去掉保護用的 ' 與空白，空值轉為空字串 """
+    s = series.fillna("").astype(str).str.replace("'", "").str.strip()
+    return s.where(~s.str.lower().isin(["nan", "none"]), "")
+
+
+def advance_logistics(df_track, df_hist, results, today_str):
+    """
+    物流自動追蹤的結果批次寫回：results = {物流單號: {"stage": 階段, "times": {階段: 日期}}}。
+    階段只會往後推進 (不倒退)；時間欄位只補空白 (不覆蓋手動輸入)，
+    推進到的階段沒有提供時間時記為 today_str。進貨紀錄依 (單號, 品名) 鍵索引同步。
+    回傳 (進貨追蹤, 進貨紀錄, 更新的追蹤列數)
+    """
+    if not results or df_track.empty or '物流追蹤' not in df_track.columns:
+        return df_track, df_hist, 0
+    cols = ['物流狀態'] + list(LOGISTICS_TIME_COLS.values())
+    for df in (df_track, df_hist):
+        for col in cols:
+            if col not in df.columns:
+                df[col] = ""
+        writable_cols(df, cols)
+
+    rank = {stage: i for i, stage in enumerate(LOGISTICS_STAGES)}
+    numbers = clean_tracking_numbers(df_track['物流追蹤'])
+    new_stage = numbers.map({n: r["stage"] for n, r in results.items()})
+    advance = new_stage.map(rank).fillna(-1) > df_track['物流狀態'].map(rank).fillna(-1)
+    df_track.loc[advance, '物流狀態'] = new_stage[advance]
+    changed = advance.copy()
+
+    for stage, col in LOGISTICS_TIME_COLS.items():
+        times = numbers.map({n: r["times"].get(stage) or (today_str if r["stage"] == stage else None)
+                             for n, r in results.items()})
+        current = df_track[col].fillna("").astype(str).str.strip()
+        fill = times.notna() & current.isin(["", "nan", "NaT"]) & (df_track['物流狀態'].map(rank).fillna(-1) >= rank[stage])
+        df_track.loc[fill, col] = times[fill]
+        changed |= fill
+
+    if changed.any():
+        updated = df_track.loc[changed, cols]
+        updated.index = purchase_line_keys(df_track[changed])
+        updated = updated[~updated.index.duplicated(keep='last')]
+        pos = updated.index.get_indexer(purchase_line_keys(df_hist))
+        hit = pos >= 0
+        df_hist.loc[hit, cols] = updated.to_numpy()[pos[hit]]
+    return df_track, df_hist, int(changed.sum())
+
+
+def recall_purchases(df_track, df_hist, pur_ids):
+    """
+    進貨單退回採購單 (尚未入庫，等同撤銷下單)：多張單一次從進貨追蹤與進貨紀錄移除。
+    回傳 (剩餘進貨追蹤, 剩餘進貨紀錄, 退回的追蹤列, 找不到的單號清單)
+    """
+    ids = list(dict.fromkeys(clean_id(p) for p in pur_ids))
+    track_ids = purchase_line_keys(df_track).get_level_values(0)
+    mask = track_ids.isin(ids)
+    found = set(track_ids[mask])
+    missing = [p for p in ids if p not in found]
+    hist_mask = purchase_line_keys(df_hist).get_level_values(0).isin(found)
+    return df_track[~mask], df_hist[~hist_mask], df_track[mask].copy(), missing
+
+
+def confirm_inbound(df_prods, df_tracking, df_history, pur_id, today_str, now_full):
+    """
+    整筆入庫：以加權平均成本 (含分攤運費與關稅) 更新成本與庫存，
+    進貨紀錄標記已完成入庫，並從進貨追蹤移除。
+    回傳 (商品資料, 剩餘進貨追蹤, 進貨紀錄, 本次入庫的品項)
+    """
+    pur_id = clean_id(pur_id)
+    writable_cols(df_prods, ['預設成本', '目前庫存', '最後進貨時間', '最後更新時間'])
+    # 文字欄位讀入後立刻轉成純字串，避免 float64 欄位無法寫入文字
+    for col in ['入庫日期', '備註', '物流追蹤', '進貨單號']:
+        if col in df_history.columns:
+            df_history[col] = df_history[col].astype(str).replace('nan', '')
+        else:
+            df_history[col] = ""
+    for col in ['分攤運費', '海關稅金', '數量', '進貨單價']:
+        if col in df_history.columns:
+            df_history[col] = pd.to_numeric(df_history[col], errors='coerce').fillna(0.0)
+
+    df_tracking['tmp_id'] = df_tracking['進貨單號'].astype(str).str.replace("'", "").str.strip()
+    df_history['tmp_id'] = df_history['進貨單號'].astype(str).str.replace("'", "").str.strip()
+
+    batch_items = df_tracking[df_tracking['tmp_id'] == pur_id].copy()
+    if batch_items.empty:
+        raise OrderNotFound(f"找不到單號 {pur_id}")
+
+    for _, row in batch_items.iterrows():
+        p_name = str(row['商品名稱']).strip()
+        new_qty = float(row.get('數量', 0))
+        new_price = float(row.get('進貨單價', 0))
+        ship_fee = pd.to_numeric(row.get('分攤運費', 0), errors='coerce')
+        tax_fee = pd.to_numeric(row.get('海關稅金', 0), errors='coerce')
+        ship_fee = 0.0 if pd.isna(ship_fee) else ship_fee
+        tax_fee = 0.0 if pd.isna(tax_fee) else tax_fee
+
+        # A. 更新商品庫存與成本 (WAC)
+        p_mask = df_prods['商品名稱'].astype(str).str.strip() == p_name
+        if not df_prods[p_mask].empty:
+            p_idx = df_prods[p_mask].index[0]
+            old_stock = pd.to_numeric(df_prods.at[p_idx, '目前庫存'], errors='coerce')
+            old_cost = pd.to_numeric(df_prods.at[p_idx, '預設成本'], errors='coerce')
+            old_stock = 0.0 if pd.isna(old_stock) else old_stock
+            old_cost = 0.0 if pd.isna(old_cost) else old_cost
+
+            total_val = (old_stock * old_cost) + (new_qty * new_price) + ship_fee + tax_fee
+            total_qty = old_stock + new_qty
+            if total_qty > 0:
+                df_prods.at[p_idx, '預設成本'] = round(total_val / total_qty, 2)
+                df_prods.at[p_idx, '目前庫存'] = int(total_qty)
+                df_prods.at[p_idx, '最後進貨時間'] = today_str
+                df_prods.at[p_idx, '最後更新時間'] = now_full
+
+        # B. 更新進貨歷史總表
+        h_mask = (df_history['tmp_id'] == pur_id) & (df_history['商品名稱'] == p_name)
+        if not df_history[h_mask].empty:
+            df_history.loc[h_mask, '入庫日期'] = today_str
+            df_history.loc[h_mask, '備註'] = "已完成入庫"
+            df_history.loc[h_mask, '分攤運費'] = ship_fee
+            df_history.loc[h_mask, '海關稅金'] = tax_fee
+            df_history.loc[h_mask, '物流狀態'] = "已完成入庫"
+
+    df_tracking_new = df_tracking[df_tracking['tmp_id'] != pur_id].copy()
+    df_tracking_new.drop(columns=['tmp_id'], inplace=True, errors='ignore')
+    df_history.drop(columns=['tmp_id'], inplace=True, errors='ignore')
+    return df_prods, df_tracking_new, df_history, batch_items
+
+
+def allocate_cents(total, weights):
+    """
+    最大餘數法 (Hamilton)：依權重把金額分成整數「分」，每列先取無條件捨去的份額，
+    剩下的分依小數部分由大到小各補 1 分，分攤結果加總恰好等於 total (四捨五入到分)。
+    權重全為 0 時平均分攤。回傳 numpy 陣列 (元，兩位小數)。
+    """
+    cents = int(dec_round(total) * 100)
+    w = np.clip(np.asarray(weights, dtype=float), 0, None)
+    if len(w) == 0:
+        return np.zeros(0)
+    if w.sum() <= 0:
+        w = np.ones(len(w))
+    exact = cents * w / w.sum()
+    alloc = np.floor(exact).astype(np.int64)
+    short = cents - int(alloc.sum())
+    if short:
+        order = np.argsort(-(exact - alloc), kind="stable")   # 同餘數時先到先補
+        alloc[order[:short]] += 1
+    return alloc / 100
+
+
+def _allocate_lines(df_track, df_hist, df_prods, mask, total_ship, total_tax):
+    """ 把運費與稅金依 數量 x 單位權重 分攤到 mask 選取的追蹤列，並以 (單號, 品名) 鍵索引寫回進貨紀錄 """
+    for df in [df_track, df_hist]:
+        for col in ['分攤運費', '海關稅金']:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float) if col in df.columns else 0.0
+
+    names = df_prods['商品名稱'].astype(str).str.strip()
+    weights = pd.to_numeric(df_prods.get('單位權重', 1.0), errors='coerce')
+    weight_map = pd.Series(weights, index=names.index).fillna(1.0).groupby(names).last()
+
+    lines = df_track[mask]
+    qty = pd.to_numeric(lines['數量'], errors='coerce').fillna(0.0)
+    w = lines['商品名稱'].astype(str).str.strip().map(weight_map).fillna(1.0)
+    alloc = pd.DataFrame({'分攤運費': allocate_cents(total_ship, qty * w),
+                          '海關稅金': allocate_cents(total_tax, qty * w)}, index=lines.index)
+    df_track.loc[mask, ['分攤運費', '海關稅金']] = alloc
+
+    # 同步歷史表：同一 (單號, 品名) 有多列追蹤時以最後一列為準
+    alloc.index = purchase_line_keys(lines)
+    alloc = alloc[~alloc.index.duplicated(keep='last')]
+    pos = alloc.index.get_indexer(purchase_line_keys(df_hist))
+    hit = pos >= 0
+    df_hist.loc[hit, ['分攤運費', '海關稅金']] = alloc.to_numpy()[pos[hit]]
+    return df_track, df_hist
+
+
+def allocate_shipping(df_track, df_hist, df_prods, pur_id, total_ship, total_tax):
+    """
+    依 數量 x 單位權重 把整單運費與稅金分攤到進貨單的每一列 (最大餘數法，總和與輸入金額相符)，
+    並同步到進貨紀錄。回傳 (進貨追蹤, 進貨紀錄)；找不到單號時拋出 OrderNotFound。
+    """
+    return allocate_landed_cost(df_track, df_hist, df_prods, [pur_id], total_ship, total_tax)
+
+
+def allocate_landed_cost(df_track, df_hist, df_prods, pur_ids, total_ship, total_tax):
+    """
+    集運併箱：同一批出貨的多張進貨單共用一筆運費與關稅，所有單的品項一起依 數量 x 單位權重 分攤。
+    回傳 (進貨追蹤, 進貨紀錄)，由呼叫端一次存檔；任何一張單不在進貨追蹤時拋出 OrderNotFound (不做部分分攤)。
+    """
+    ids = {clean_id(p) for p in pur_ids}
+    track_ids = purchase_line_keys(df_track).get_level_values(0)
+    missing = sorted(ids - set(track_ids))
+    if missing:
+        raise OrderNotFound(f"找不到進貨單 {'、'.join(missing)} 的追蹤項目，請重新整理列表")
+    return _allocate_lines(df_track, df_hist, df_prods, track_ids.isin(ids), total_ship, total_tax)
+
+
+def shipment_orders(df_track, pur_ids):
+    """ 選取的進貨單加上與它們共用物流單號的其他進貨單 (集運倉併箱後同一個追蹤號)，依單號排序 """
+    ids = {clean_id(p) for p in pur_ids}
+    track_ids = purchase_line_keys(df_track).get_level_values(0)
+    if '物流追蹤' in df_track.columns:
+        logi = df_track['物流追蹤'].fillna("").astype(str).str.replace("'", "").str.strip()
+        numbers = set(logi[track_ids.isin(ids)]) - {"", "nan"}
+        ids |= set(track_ids[logi.isin(numbers).to_numpy()])
+    return sorted(ids)
+
+
+def vendor_performance(df_history, vendor_name, manual_stars=5):
+    """
+    由已入庫的進貨紀錄計算廠商績效。沒有已入庫紀錄時回傳 None。
+    manual_stars: 人為印象分數 (1-5 星)，佔綜合評分 20%
+    回傳 {"lead_time", "quality_rate", "fulfillment_rate", "score", "stars"}
+    """
+    v_mask = (df_history['供應商'].astype(str).str.strip() == vendor_name)
+    finished = df_history[v_mask & (df_history['入庫日期'].notna()) & (df_history['入庫日期'] != "")].copy()
+    if finished.empty:
+        return None
+
+    # A. 平均前置天數 (Lead Time)
+    p_date = pd.to_datetime(finished['採購日期'], errors='coerce')
+    i_date = pd.to_datetime(finished['入庫日期'], errors='coerce')
+    valid_dates = (p_date.notna()) & (i_date.notna())
+    days_diffs = (i_date[valid_dates] - p_date[valid_dates]).dt.days
+    avg_lead_time = round(days_diffs.mean(), 1) if not days_diffs.empty else 0
+
+    # B. 品質合格率 = (1 - 總瑕疵數 / 總到貨數)
+    total_qty = pd.to_numeric(finished['數量'], errors='coerce').sum()
+    total_defects = pd.to_numeric(finished.get('瑕疵數量', 0), errors='coerce').sum()
+    quality_rate = round((1 - (total_defects / total_qty)) * 100, 1) if total_qty > 0 else 100
+
+    # C. 到貨滿足率 = (實際到貨數 / 原始預計數)
+    original_expected = pd.to_numeric(finished.get('原始預計數量', total_qty), errors='coerce').sum()
+    fulfillment_rate = round((total_qty / original_expected) * 100, 1) if original_expected > 0 else 100
+
+    # D. 綜合評分：系統數據 80% (品質 40%、時效 30%、滿足率 10%) + 人為印象 20%
+    time_score = max(100 - (avg_lead_time * 5), 0)
+    system_data_score = (quality_rate * 0.4) + (time_score * 0.3) + (fulfillment_rate * 0.1)
+    final_score = (system_data_score * 0.8) + (manual_stars * 20 * 0.2)
+
+    star = 1
+    if final_score >= 90:
+        star = 5
+    elif final_score >= 80:
+        star = 4
+    elif final_score >= 70:
+        star = 3
+    elif final_score >= 60:
+        star = 2
+    return {"lead_time": avg_lead_time, "quality_rate": quality_rate, "fulfillment_rate": fulfillment_rate,
+            "score": final_score, "stars": star}
+
+
+def apply_vendor_score(df_vendors, vendor_name, perf, now_full=None):
+    """ 把 vendor_performance 的結果寫回廠商分頁；廠商不存在時回傳 None """
+    names = df_vendors['廠商名稱'].astype(str).str.strip()
+    if vendor_name not in names.values:
+        return None
+    for col in ['平均前置天數', '綜合評等分數']:
+        if col in df_vendors.columns:
+            df_vendors[col] = pd.to_numeric(df_vendors[col], errors='coerce').astype(float)
+    if '星等' in df_vendors.columns:
+        df_vendors['星等'] = pd.to_numeric(df_vendors['星等'], errors='coerce').fillna(5).astype(float)
+    writable_cols(df_vendors, ['總到貨率', '總合格率', '最後更新'])
+
+    idx = df_vendors[names == vendor_name].index[0]
+    df_vendors.at[idx, '平均前置天數'] = float(perf["lead_time"])
+    df_vendors.at[idx, '綜合評等分數'] = float(round(perf["score"], 1))
+    df_vendors.at[idx, '星等'] = int(perf["stars"])
+    df_vendors.at[idx, '總到貨率'] = f"{perf['fulfillment_rate']}%"
+    df_vendors.at[idx, '總合格率'] = f"{perf['quality_rate']}%"
+    df_vendors.at[idx, '最後更新'] = now_full or datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    for col in ['平均前置天數', '綜合評等分數', '星等']:
+        df_vendors[col] = pd.to_numeric(df_vendors[col], errors='coerce').fillna(0)
+    return df_vendors
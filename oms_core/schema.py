@@ -0,0 +1,69 @@
+"""
+活頁簿分頁名稱與欄位常數 (所有核心模組共用)
+"""
+SHEET_PURCHASES = '進貨紀錄'
+SHEET_PUR_TRACKING = '進貨追蹤'
+SHEET_VENDORS = '進貨廠商管理'
+SHEET_SALES = '銷售紀錄'
+SHEET_TRACKING = '訂單追蹤'
+SHEET_RETURNS = '退貨紀錄'
+SHEET_AFTER_SALES = '售後明細'
+SHEET_PRODUCTS = '商品資料'
+SHEET_FEES = '手續費設定'
+SHEET_SYS_SETTINGS = '系統設定'
+
+STANDARD_ORDER = [SHEET_PRODUCTS, SHEET_SALES, SHEET_TRACKING, SHEET_PURCHASES, SHEET_PUR_TRACKING,
+                  SHEET_RETURNS, SHEET_FEES, SHEET_SYS_SETTINGS, SHEET_VENDORS, SHEET_AFTER_SALES]
+TEXT_PROTECTION_COLS = ['訂單編號', '進貨單號', '物流追蹤', '商品編號', '廠商名稱', '商店名', '統編']
+QUOTED_ID_COLS = ['訂單編號', '進貨單號', '物流追蹤']
+ORDER_HEADER_COLS = ['日期', '買家名稱', '交易平台', '寄送方式', '取貨地點', '扣費項目']
+
+# 進貨物流階段 -> 到達該階段的時間欄位
+LOGISTICS_STAGES = ("待出貨", "廠商已發貨", "貨到集運倉", "集運倉已發貨", "抵達台灣海關", "國內配送中")
+LOGISTICS_TIME_COLS = {
+    "廠商已發貨": "時間_廠商出貨",
+    "貨到集運倉": "時間_抵達集運倉",
+    "集運倉已發貨": "時間_集運倉出貨",
+    "抵達台灣海關": "時間_抵達台灣海關",
+    "國內配送中": "時間_國內配送中",
+}
+
+# 匯入精靈 / 命令列匯入共用的欄位規格：{ERP 欄位: (型別, 預設值)}，由 ImportStream 向量化轉換
+PRODUCT_REQUIRED_FIELDS = ["商品名稱", "目前庫存", "預設成本"]
+VENDOR_REQUIRED_FIELDS = ["廠商名稱"]
+
+
+def product_field_spec(now_str):
+    return {
+        "商品編號": ("text", ""),
+        "分類Tag": ("text", "未分類"),
+        "商品名稱": ("text", ""),
+        "預設成本": ("float", 0.0),
+        "預設售價": ("float", 0.0),
+        "目前庫存": ("int", 0),
+        "最後更新時間": ("text", now_str),
+        "初始上架時間": ("text", now_str),
+        "最後進貨時間": ("text", ""),
+        "安全庫存": ("int", 0),
+        "商品連結": ("text", "無"),
+        "商品備註": ("text", "無"),
+        "單位權重": ("float", 1.0)
+    }
+
+
+def vendor_field_spec(now_str):
+    return {
+        "廠商名稱": ("text", ""),
+        "通路": ("text", ""),
+        "統編": ("text", ""),
+        "聯絡人": ("text", ""),
+        "電話": ("text", ""),
+        "地址": ("text", ""),
+        "備註": ("text", ""),
+        "平均前置天數": ("num", 0),
+        "總到貨率": ("text", "0%"),
+        "總合格率": ("text", "0%"),
+        "綜合評等分數": ("num", 0),
+        "星等": ("num", 5),
+        "最後更新": ("text", now_str)
+    }
@@ -0,0 +1,276 @@
+"""
+伺服器端資料庫 OrderStore：伺服器模式下「擁有」活頁簿的物件。
+資料常駐記憶體，寫入在鎖內依序套用，再由背景寫檔執行緒合併成一次存檔 (group commit)：
+多個請求共用一次 Excel 寫入，每個請求都等到自己的變更寫進檔案才回應。
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from .common import OrderNotFound, clean_id, clean_ids, dec_round, normalize_order_ids
+from .orders import (append_to_tracking, apply_sale_to_products, build_order_rows, cart_from_request,
+                     complete_order, fee_table, platform_fee, return_order)
+from .purchasing import confirm_inbound
+from .schema import (SHEET_FEES, SHEET_PRODUCTS, SHEET_PUR_TRACKING, SHEET_PURCHASES, SHEET_RETURNS, SHEET_SALES,
+                     SHEET_TRACKING)
+from .workbook import as_read_back, blocks_empty_save, read_sheets, scrub_frame, write_workbook
+
+
+class OrderStore:
+    """
+    伺服器模式下唯一寫入活頁簿的物件。
+    - 讀取 (庫存、商品搜尋、分頁) 直接使用記憶體中的資料，不碰檔案。
+    - 寫入在 self._cond 內依序套用到記憶體 (伺服器端序列化)，再等待背景執行緒寫檔。
+    - 背景執行緒一次把累積的所有變更寫成一個檔案 (group commit)，寫完才喚醒等待中的請求。
+    - 寫檔失敗時捨棄記憶體中尚未寫入的變更並從檔案重新載入，等待中的請求收到錯誤。
+    - 活頁簿被外部程式改動 (大小 / 修改時間不同) 時，下一次操作前自動重新載入。
+    """
+
+    def __init__(self, path, flush_delay=0.0):
+        """ flush_delay: 寫檔前額外等待的秒數，讓更多請求併入同一次寫檔 (預設不等待) """
+        self.path = path
+        self.flush_delay = flush_delay
+        self._cond = threading.Condition()
+        self._frames = None         # {分頁: DataFrame}，等同「從檔案讀出來」的樣子
+        self._written = {}          # {分頁: 清洗後的 DataFrame}，寫檔用
+        self._stamp = None          # 最後一次載入 / 寫入後的檔案指紋
+        self._seq = 0               # 已套用到記憶體的寫入序號
+        self._flushed = 0           # 已寫入檔案的寫入序號
+        self._failed = {}           # 寫檔失敗的序號區間 -> 錯誤
+        self._last_order_id = 0
+        self._closed = False
+        self.stats = {"writes": 0, "flushes": 0, "flush_ms": 0.0, "reloads": 0}
+        self._flusher = threading.Thread(target=self._flush_loop, name="oms-store-flush", daemon=True)
+        self._flusher.start()
+
+    # --- 載入 ---
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _ensure_loaded(self):
+        """ 呼叫端需持有 self._cond """
+        if self._frames is not None and (self._seq > self._flushed or self._file_stamp() == self._stamp):
+            return
+        self._frames = read_sheets(self.path)
+        self._written = {}
+        self._stamp = self._file_stamp()
+        self.stats["reloads"] += 1
+
+    def frames(self):
+        """
+        取得目前資料的唯讀快照 ({分頁: DataFrame}，請勿直接修改)。
+        每次寫入都換成新的 dict，讀取不必等待鎖 (也不會被耗時的結案運算擋住)。
+        """
+        frames = self._frames
+        if frames is not None and (self._seq > self._flushed or self._file_stamp() == self._stamp):
+            return frames
+        with self._cond:
+            self._ensure_loaded()
+            return self._frames
+
+    def sheet(self, name):
+        frames = self.frames()
+        if name not in frames:
+            raise OrderNotFound(f"沒有分頁：{name}")
+        return frames[name]
+
+    # --- 寫入 ---
+    def apply(self, fn):
+        """
+        序列化執行 fn(frames) -> (更新的分頁 dict, 結果)，等到變更寫入檔案後回傳結果。
+        fn 不可修改傳入的 dict 與 DataFrame (讀取端可能正在使用)，請先 .copy()。
+        """
+        with self._cond:
+            self._ensure_loaded()
+            updates, result = fn(self._frames)
+            frames = dict(self._frames)
+            for sn, df in updates.items():
+                # 數據完整性保護：防止意外存入空表
+                if blocks_empty_save(frames.get(sn), df):
+                    print(f"[WARNING] Blocked empty save attempt for sheet: {sn}")
+                    continue
+                cleaned = scrub_frame(sn, df)
+                self._written[sn] = cleaned
+                frames[sn] = as_read_back(cleaned)
+            self._frames = frames
+            self._seq += 1
+            seq = self._seq
+            self.stats["writes"] += 1
+            self._cond.notify_all()
+            while self._flushed < seq:
+                self._cond.wait()
+            for (lo, hi), err in list(self._failed.items()):
+                if lo <= seq <= hi:
+                    raise RuntimeError(f"存檔失敗: {err}")
+        return result
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while self._seq == self._flushed and not self._closed:
+                    self._cond.wait()
+                if self._closed and self._seq == self._flushed:
+                    return
+            if self.flush_delay:
+                time.sleep(self.flush_delay)
+            # 任何錯誤都只讓這一批請求失敗，寫檔執行緒不可結束 (否則等待中的請求永遠不會被喚醒)
+            try:
+                with self._cond:
+                    if self._frames is None:
+                        raise RuntimeError("記憶體中沒有可寫入的資料")
+                    target = self._seq
+                    # 沒變動的分頁第一次寫入時才清洗，之後沿用
+                    for sn, df in self._frames.items():
+                        if sn not in self._written:
+                            self._written[sn] = scrub_frame(sn, df)
+                    to_write = dict(self._written)
+                t0 = time.perf_counter()
+                write_workbook(self.path, to_write)
+                with self._cond:
+                    self._stamp = self._file_stamp()
+                    self.stats["flushes"] += 1
+                    self.stats["flush_ms"] += (time.perf_counter() - t0) * 1000
+                    self._flushed = target
+                    self._cond.notify_all()
+            except Exception as e:
+                print(f"system: store flush failed: {e}")
+                with self._cond:
+                    self._fail_pending(e)
+
+    def _fail_pending(self, error):
+        """
+        寫檔失敗：所有尚未寫入的序號 (含寫檔期間新套用的) 一律回報錯誤，
+        並從檔案重新載入，捨棄記憶體中未寫入的變更 (呼叫端需持有 self._cond)
+        """
+        if self._seq > self._flushed:
+            self._failed[(self._flushed + 1, self._seq)] = str(error)
+            if len(self._failed) > 100:
+                self._failed.pop(next(iter(self._failed)))
+        self._flushed = self._seq
+        self._written = {}
+        try:
+            self._frames = read_sheets(self.path)
+            self._stamp = self._file_stamp()
+            self.stats["reloads"] += 1
+        except Exception as e:
+            print(f"system: store reload failed: {e}")
+            self._frames = None        # 下一次操作時由 _ensure_loaded 再讀取
+        self._cond.notify_all()
+
+    def close(self):
+        """ 等待尚未寫入的變更寫完後停止背景執行緒 """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join(timeout=30)
+
+    def _new_order_id(self):
+        """ 以時間產生訂單編號；同一秒內多筆時往後遞增，確保不重複 (呼叫端需持有 self._cond) """
+        oid = max(int(datetime.now().strftime("%Y%m%d%H%M%S")), self._last_order_id + 1)
+        self._last_order_id = oid
+        return str(oid)
+
+    # --- 查詢 ---
+    def search_products(self, keyword="", limit=50):
+        df = self.sheet(SHEET_PRODUCTS)
+        if keyword:
+            kw = str(keyword).lower()
+            hit = df['商品名稱'].astype(str).str.lower().str.contains(kw, regex=False)
+            for col in ('商品編號', '分類Tag'):
+                if col in df.columns:
+                    hit |= df[col].astype(str).str.lower().str.contains(kw, regex=False)
+            df = df[hit]
+        return df.head(limit)
+
+    def stock(self, name=None, sku=None):
+        df = self.sheet(SHEET_PRODUCTS)
+        # 商品編號一律清理後比對與回傳 (記憶體中的 'A001 與寫回後讀到的 A001 / 1001.0 視為相同)
+        skus = clean_ids(df['商品編號']) if '商品編號' in df.columns else pd.Series("", index=df.index)
+        if sku:
+            match = df[skus == clean_id(sku)]
+        else:
+            match = df[df['商品名稱'].astype(str).str.strip() == str(name or "").strip()]
+        if match.empty:
+            raise OrderNotFound(f"找不到商品：{name or sku}")
+        row = match.iloc[0]
+        stock = pd.to_numeric(row.get('目前庫存', 0), errors='coerce')
+        safety = pd.to_numeric(row.get('安全庫存', 0), errors='coerce')
+        return {"name": str(row['商品名稱']), "sku": skus[match.index[0]],
+                "stock": 0 if pd.isna(stock) else int(stock), "safety_stock": 0 if pd.isna(safety) else int(safety)}
+
+    # --- 業務操作 ---
+    def submit_order(self, order):
+        """
+        order: {"items": [{"name"/"sku", "qty", "unit_price"?, "unit_cost"?}],
+                "date"?, "buyer"?, "platform"?, "ship_method"?, "location"?,
+                "fee"? (手續費設定名稱) 或 "fee_rate"? / "fee_fixed"? 或 "platform_fee"? (金額),
+                "tax"? (稅額), "extra_fee"?, "fee_tag"?}
+        回傳 {"order_id", "lines", "total_sales", "platform_fee"}
+        """
+        if not order.get('items'):
+            raise ValueError("訂單沒有商品")
+
+        def op(frames):
+            df_prods = frames[SHEET_PRODUCTS].copy()
+            cart = cart_from_request(df_prods, order['items'])
+            t_sales = sum((Decimal(str(i['total_sales'])) for i in cart), Decimal("0.00"))
+            rate, fixed = order.get('fee_rate', 0), order.get('fee_fixed', 0)
+            if order.get('fee'):
+                fees = fee_table(frames.get(SHEET_FEES))
+                if order['fee'] not in fees:
+                    raise OrderNotFound(f"找不到手續費設定：{order['fee']}")
+                rate, fixed = fees[order['fee']]
+            if order.get('platform_fee') is not None:
+                t_fee = dec_round(order['platform_fee'])     # 用戶端已算好的手續費金額
+            else:
+                t_fee = platform_fee(t_sales, rate, fixed)
+            t_tax = dec_round(order.get('tax', 0) or 0)
+            d_extra = Decimal(str(order.get('extra_fee', 0) or 0))
+
+            order_id = self._new_order_id()
+            header = {"date": order.get('date') or datetime.now().strftime("%Y-%m-%d"),
+                      "buyer": order.get('buyer', "未提供"), "platform": order.get('platform', "零售/現場"),
+                      "ship_method": order.get('ship_method', "未提供"), "location": order.get('location', "未提供")}
+            rows = build_order_rows(cart, header, order_id, t_sales, t_fee, t_tax, d_extra,
+                                    order.get('fee_tag', ""))
+            apply_sale_to_products(df_prods, cart, datetime.now().strftime("%Y-%m-%d %H:%M"))
+            df_track = frames.get(SHEET_TRACKING, pd.DataFrame())
+            updates = {SHEET_PRODUCTS: df_prods, SHEET_TRACKING: append_to_tracking(df_track, rows)}
+            return updates, {"order_id": order_id, "lines": len(rows),
+                             "total_sales": float(t_sales), "platform_fee": float(t_fee)}
+        return self.apply(op)
+
+    def complete_order(self, order_id):
+        def op(frames):
+            df_track = normalize_order_ids(frames[SHEET_TRACKING].copy())
+            df_sales = frames.get(SHEET_SALES, pd.DataFrame()).copy()
+            rest, combined = complete_order(df_track, df_sales, order_id)
+            return {SHEET_TRACKING: rest, SHEET_SALES: combined}, {"order_id": clean_id(order_id)}
+        return self.apply(op)
+
+    def return_order(self, order_id, reason=""):
+        def op(frames):
+            df_track = normalize_order_ids(frames[SHEET_TRACKING].copy())
+            df_returns = frames.get(SHEET_RETURNS, pd.DataFrame()).copy()
+            rest, returns = return_order(df_track, df_returns, order_id, reason)
+            return {SHEET_TRACKING: rest, SHEET_RETURNS: returns}, {"order_id": clean_id(order_id)}
+        return self.apply(op)
+
+    def confirm_inbound(self, pur_id):
+        def op(frames):
+            now = datetime.now()
+            df_prods, df_tracking, df_history, batch = confirm_inbound(
+                frames[SHEET_PRODUCTS].copy(), frames[SHEET_PUR_TRACKING].copy(), frames[SHEET_PURCHASES].copy(),
+                pur_id, now.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d %H:%M"))
+            vendor = str(batch.iloc[0]['供應商']).strip() if '供應商' in batch.columns else ""
+            return ({SHEET_PRODUCTS: df_prods, SHEET_PUR_TRACKING: df_tracking, SHEET_PURCHASES: df_history},
+                    {"purchase_id": clean_id(pur_id), "lines": len(batch), "vendor": vendor})
+        return self.apply(op)
@@ -0,0 +1,100 @@
+"""
+活頁簿讀寫：讀取分頁、存檔前資料校準、原子寫入
+SalesApp._universal_save、伺服器 OrderStore 與命令列工具共用同一套存檔規則。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .schema import QUOTED_ID_COLS, SHEET_VENDORS, STANDARD_ORDER, TEXT_PROTECTION_COLS
+
+
+def read_sheets(path, sheet_names=None):
+    """ 一次開檔讀取多個分頁 (None = 全部)，不存在的分頁略過 """
+    frames = {}
+    with pd.ExcelFile(path) as xls:
+        for sn in (sheet_names or xls.sheet_names):
+            if sn in xls.sheet_names:
+                frames[sn] = pd.read_excel(xls, sheet_name=sn)
+    return frames
+
+
+def _clean_text(col):
+    def clean_logic(x):
+        s = str(x).strip()
+        if s.lower() in ['nan', 'none', '', 'nat']:
+            return ""
+        if s.endswith('.0'):
+            s = s[:-2]
+        s = s.lstrip("'")
+        if col in QUOTED_ID_COLS:
+            return f"'{s}"
+        return s
+    return clean_logic
+
+
+def scrub_frame(sheet_name, df):
+    """ 存檔前的資料校準：消滅 nan、保護編號格式 (空表原樣回傳) """
+    if df is None or df.empty:
+        return df
+    df = df.fillna("")
+    for col in df.columns:
+        if col in TEXT_PROTECTION_COLS:
+            df[col] = df[col].apply(_clean_text(col))
+    if sheet_name == SHEET_VENDORS and '廠商名稱' in df.columns:
+        df = df[df['廠商名稱'].astype(str).str.lower() != "nan"]
+        df = df[df['廠商名稱'].astype(str).str.strip() != ""]
+    return df
+
+
+def scrub_frames(all_data):
+    for sn in list(all_data):
+        all_data[sn] = scrub_frame(sn, all_data[sn])
+    return all_data
+
+
+def sheet_order_of(all_data):
+    return [sn for sn in STANDARD_ORDER if sn in all_data] + [sn for sn in all_data if sn not in STANDARD_ORDER]
+
+
+def write_workbook(path, all_data, sheet_order=None):
+    """
+    原子寫入：先寫 temp_ 檔，成功後把正式檔改名為 .bak，再把暫存檔改名為正式檔。
+    寫入失敗時刪除暫存檔並拋出例外 (正式檔不受影響)。回傳實際的分頁順序。
+    """
+    directory, base_name = os.path.split(path)
+    temp_file = os.path.join(directory, "temp_" + base_name)
+    bak_file = path + ".bak"
+    sheet_order = sheet_order or sheet_order_of(all_data)
+    try:
+        with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
+            for sn in sheet_order:
+                all_data[sn].to_excel(writer, sheet_name=sn, index=False)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    if os.path.exists(path):
+        if os.path.exists(bak_file):
+            os.remove(bak_file)
+        os.rename(path, bak_file)
+    os.rename(temp_file, path)
+    return sheet_order
+
+
+def blocks_empty_save(current, new):
+    """
+    數據完整性保護：原本有資料的分頁，不接受 None 或連欄位都沒有的空表 (通常是讀取失敗)。
+    保留欄位的空表代表資料已全部移出 (例如最後一筆訂單結案)，照常存檔。
+    """
+    if current is None or current.empty:
+        return False
+    return new is None or (new.empty and len(new.columns) == 0)
+
+
+def as_read_back(df):
+    """ 模擬「寫入 Excel 再讀回」的結果：空字串變 NaN，純數字欄位恢復數值型態 """
+    if df is None or df.empty:
+        return df
+    return df.replace("", np.nan).infer_objects()
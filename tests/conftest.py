@@ -0,0 +1,7 @@
+"""
+測試共用設定：專案沒有安裝成套件，測試直接從專案根目錄匯入模組 (oms_core、BackupTargets …)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+"""
+運費 / 關稅分攤：向量化的最大餘數法 (allocate_cents、allocate_shipping) 對照舊版逐列 Decimal 計算
+"""
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import oms_core as S
+from oms_core.purchasing import allocate_cents
+
+
+def decimal_allocation(df_track, df_hist, df_prods, pur_id, total_ship, total_tax):
+    """ 舊版實作 (逐列 Decimal 四捨五入，總和可能差幾分錢)，作為對照基準 """
+    t_ship, t_tax = Decimal(str(total_ship)), Decimal(str(total_tax))
+    for df in (df_track, df_hist):
+        for col in ('分攤運費', '海關稅金'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float)
+    weights = pd.to_numeric(df_prods['單位權重'], errors='coerce').fillna(1.0)
+    weight_map = dict(zip(df_prods['商品名稱'], weights))
+    track_ids = df_track['進貨單號'].astype(str).str.replace("'", "").str.strip()
+    hist_ids = df_hist['進貨單號'].astype(str).str.replace("'", "").str.strip()
+    mask = track_ids == pur_id
+
+    total_w = Decimal("0.0")
+    for _, row in df_track[mask].iterrows():
+        total_w += Decimal(str(row['數量'])) * Decimal(str(weight_map.get(str(row['商品名稱']).strip(), 1.0)))
+    if total_w <= 0:
+        total_w = Decimal("1.0")
+
+    for idx in df_track[mask].index:
+        name = str(df_track.at[idx, '商品名稱']).strip()
+        ratio = Decimal(str(df_track.at[idx, '數量'])) * Decimal(str(weight_map.get(name, 1.0))) / total_w
+        ship, tax = float(S.dec_round(t_ship * ratio)), float(S.dec_round(t_tax * ratio))
+        df_track.at[idx, '分攤運費'], df_track.at[idx, '海關稅金'] = ship, tax
+        h_mask = (hist_ids == pur_id) & (df_hist['商品名稱'].astype(str).str.strip() == name)
+        df_hist.loc[h_mask, '分攤運費'], df_hist.loc[h_mask, '海關稅金'] = ship, tax
+    return df_track, df_hist
+
+
+def make_order(rng, pur_id):
+    n = int(rng.integers(1, 12))
+    n_prods = int(rng.integers(n, 60))
+    prods = pd.DataFrame({"商品名稱": [f"品{i}" for i in range(n_prods)],
+                          "單位權重": rng.choice([0.5, 1, 1.3, 2.7, np.nan], n_prods)})
+    names = list(rng.choice(prods["商品名稱"], n, replace=False))
+    track = pd.DataFrame({"進貨單號": [f"'{pur_id}"] * n + ["'other"], "商品名稱": names + ["品0"],
+                          "數量": list(rng.integers(1, 50, n)) + [3], "分攤運費": np.nan, "海關稅金": np.nan})
+    hist = pd.concat([track, track.assign(進貨單號="'history_only")], ignore_index=True)
+    return track, hist, prods
+
+
+def test_allocate_cents_exact_totals():
+    assert list(allocate_cents(100, [1, 1, 1])) == [33.34, 33.33, 33.33]
+    assert round(allocate_cents(0.05, [1] * 7).sum(), 2) == 0.05
+    assert list(allocate_cents(10, [0, 0])) == [5, 5]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_allocate_shipping_matches_decimal(seed):
+    rng = np.random.default_rng(seed)
+    pur_id = str(seed)
+    for _ in range(10):
+        track, hist, prods = make_order(rng, pur_id)
+        ship = float(rng.integers(0, 100000)) / 100
+        tax = float(rng.integers(0, 50000)) / 100
+
+        old_track, old_hist = decimal_allocation(track.copy(), hist.copy(), prods.copy(), pur_id, ship, tax)
+        new_track, new_hist = S.allocate_shipping(track.copy(), hist.copy(), prods.copy(), pur_id, ship, tax)
+
+        target = track['進貨單號'] == f"'{pur_id}"
+        for col, total in (("分攤運費", ship), ("海關稅金", tax)):
+            # 分攤結果加總剛好等於輸入金額 (以分為單位)
+            assert round(new_track.loc[target, col].sum() * 100) == round(total * 100)
+            # 每一列與舊版 Decimal 結果最多差 1 分錢
+            np.testing.assert_allclose(new_track[col].astype(float), old_track[col], atol=0.0100001)
+            np.testing.assert_allclose(new_hist[col].astype(float), old_hist[col], atol=0.0100001)
+            # 其他進貨單不受影響
+            assert (new_track.loc[~target, col].fillna(0) == 0).all()
+            other = hist['進貨單號'] != f"'{pur_id}"
+            assert (new_hist.loc[other, col].fillna(0) == 0).all()
+
+
+def test_allocate_landed_cost_rejects_missing_orders():
+    rng = np.random.default_rng(0)
+    track, hist, prods = make_order(rng, "1")
+    with pytest.raises(S.OrderNotFound):
+        S.allocate_landed_cost(track, hist, prods, ["1", "404"], 100, 10)
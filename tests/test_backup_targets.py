@@ -0,0 +1,152 @@
+"""
+本機資料夾備份目的地 (LocalFolderTarget) 與增量備份引擎：上傳、列表、下載、清理、還原
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from BackupPackage import IncrementalBackup, file_sha256
+from BackupTargets import MAX_KEEP, BackupTarget, LocalFolderTarget, load_backup_config, save_backup_config
+
+
+@pytest.fixture
+def sheets():
+    return {"商品資料": pd.DataFrame({"商品名稱": ["A", "B"], "目前庫存": [5, 7]}),
+            "訂單追蹤": pd.DataFrame({"訂單編號": ["'1", "'2"], "總淨利": [10.25, 3.1]})}
+
+
+def write_xlsx(path, sheets):
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        for sn, df in sheets.items():
+            df.to_excel(w, sheet_name=sn, index=False)
+
+
+def make_engine(tmp_path, keep=2):
+    target = LocalFolderTarget(str(tmp_path / "remote"))
+    return target, IncrementalBackup(target, str(tmp_path / "state.json"), target.key, keep=keep)
+
+
+def test_local_target_upload_list_download(tmp_path):
+    target = LocalFolderTarget(str(tmp_path / "remote"))
+    assert target.list_backups() == []
+    assert target.is_ready()
+
+    src = tmp_path / "a.bin"
+    src.write_bytes(b"payload")
+    first = target.upload(str(src), "backup.bin", {"oms_kind": "full"})
+    second = target.upload(str(src), "backup.bin")          # 同名不可覆蓋
+    assert first != second
+
+    listed = target.list_backups()
+    assert {b["id"] for b in listed} == {first, second}
+    assert listed[0]["createdTime"] >= listed[1]["createdTime"]
+    assert target.get_metadata(first)["appProperties"] == {"oms_kind": "full"}
+    assert target.get_metadata(first)["size"] == str(len(b"payload"))
+
+    dest = tmp_path / "out.bin"
+    target.download(first, str(dest))
+    assert dest.read_bytes() == b"payload"
+
+
+def test_backup_target_requires_full_interface():
+    class Partial(BackupTarget):
+        key = "partial"
+
+        def upload(self, local_path, name, properties=None):
+            return name
+
+    with pytest.raises(TypeError):
+        Partial()                                      # 缺 list_backups 等方法時不可建立
+    with pytest.raises(TypeError):
+        BackupTarget()
+
+
+def test_local_target_delete_many(tmp_path):
+    target = LocalFolderTarget(str(tmp_path / "remote"))
+    src = tmp_path / "a.bin"
+    src.write_bytes(b"x")
+    ids = [target.upload(str(src), "b.bin") for _ in range(3)]
+    target.delete_many(ids[:2] + ["missing"])
+    assert [b["id"] for b in target.list_backups()] == ids[2:]
+    assert sorted(os.listdir(target.folder)) == sorted([ids[2], ids[2] + ".meta.json"])
+
+
+def test_backup_skips_unchanged_and_writes_deltas(tmp_path, sheets):
+    xlsx = str(tmp_path / "sales_data.xlsx")
+    target, engine = make_engine(tmp_path, keep=10)
+    write_xlsx(xlsx, sheets)
+    assert engine.backup(xlsx)[0]
+    assert "沒有變更" in engine.backup(xlsx)[1]
+    sheets["商品資料"].loc[0, "目前庫存"] = 6
+    write_xlsx(xlsx, sheets)
+    assert "差異備份" in engine.backup(xlsx)[1]
+    assert [b["appProperties"]["oms_kind"] for b in target.list_backups()] == ["delta", "full"]
+
+
+def test_prune_keeps_base_of_kept_deltas(tmp_path, sheets):
+    xlsx = str(tmp_path / "sales_data.xlsx")
+    target, engine = make_engine(tmp_path, keep=2)
+    write_xlsx(xlsx, sheets)
+    engine.backup(xlsx)
+    for stock in (6, 8, 9):
+        sheets["商品資料"].loc[0, "目前庫存"] = stock
+        write_xlsx(xlsx, sheets)
+        engine.backup(xlsx)
+    kinds = [b["appProperties"]["oms_kind"] for b in target.list_backups()]
+    assert kinds == ["delta", "delta", "full"]          # 保留 2 筆 + 被引用的基準
+
+
+def test_restore_round_trip(tmp_path, sheets):
+    xlsx = str(tmp_path / "sales_data.xlsx")
+    target, engine = make_engine(tmp_path)
+    write_xlsx(xlsx, sheets)
+    engine.backup(xlsx)
+    sheets["商品資料"].loc[0, "目前庫存"] = 6
+    write_xlsx(xlsx, sheets)
+    engine.backup(xlsx)
+
+    restored = str(tmp_path / "restored.xlsx")
+    write_xlsx(restored, {"舊資料": pd.DataFrame({"a": [1]})})
+    engine.restore(target.list_backups()[0], restored)
+    got = pd.read_excel(restored, sheet_name=None)
+    for sn, df in sheets.items():
+        assert got[sn].equals(df), sn
+    assert os.path.exists(restored + ".bak")            # 原本的檔案保留為 .bak
+
+
+def test_restore_rejects_invalid_backup(tmp_path, sheets):
+    xlsx = str(tmp_path / "sales_data.xlsx")
+    target, engine = make_engine(tmp_path)
+    write_xlsx(xlsx, sheets)
+    engine.backup(xlsx)
+    sheets["商品資料"].loc[0, "目前庫存"] = 6
+    write_xlsx(xlsx, sheets)
+    engine.backup(xlsx)
+    delta, full = target.list_backups()
+
+    restored = str(tmp_path / "restored.xlsx")
+    engine.restore(full, restored)
+    before = file_sha256(restored)
+
+    # 不符合 schema：還原失敗，正式檔不動
+    with pytest.raises(ValueError):
+        engine.restore(full, restored, schema={"商品資料": ["不存在的欄位"]})
+    assert file_sha256(restored) == before
+
+    # 下載內容損毀 (雜湊不符)
+    with open(os.path.join(target.folder, delta["id"]), "ab") as f:
+        f.write(b"corrupt")
+    with pytest.raises(ValueError):
+        engine.restore(delta, restored)
+    assert file_sha256(restored) == before
+
+
+def test_backup_config_round_trip_and_clamp(tmp_path):
+    path = str(tmp_path / "backup_config.json")
+    assert load_backup_config(path)["target"] == "gdrive"
+    save_backup_config(path, {"target": "local", "local_folder": "D:/nas", "keep": 9999, "auto_writes": "x"})
+    config = load_backup_config(path)
+    assert config["target"] == "local" and config["local_folder"] == "D:/nas"
+    assert config["keep"] == MAX_KEEP
+    assert config["auto_writes"] >= 1